@@ -0,0 +1,99 @@
+"""
+Benchmark: full-text search latency and index size.
+
+Builds a throwaway database of synthetic judgments (words drawn from a
+Zipf-like vocabulary, so a few terms appear in nearly every document and most
+in a handful), indexes them as the pipeline does, then times search() for a
+common and a selective term, a phrase and a prefix, ranked and
+sort="recent", and prints the median milliseconds per query and the disk
+used by the stored search text.
+
+    python bench_search.py --docs 10000 100000 --words 600
+"""
+import argparse, os, random, statistics, tempfile, time
+
+import search
+from db import Database
+
+COMMON = ["court", "order", "section", "appeal", "the"]
+QUERIES = {
+    "common": "court",
+    "selective": "estoppel",
+    "phrase": '"cheque bounced"',
+    "prefix": "adjourn*",
+    "two terms": "appeal estoppel",
+}
+RARE = ["estoppel", "adjournment", "adjourned", "cheque bounced", "laches", "res judicata"]
+
+
+def vocabulary(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = COMMON + ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def document(rng: random.Random, words, weights, length: int) -> str:
+    body = rng.choices(words, weights, k=length)
+    if rng.random() < 0.01:             # about 1% mention each rare term
+        body.insert(rng.randrange(len(body)), rng.choice(RARE))
+    return " ".join(body)
+
+
+def build(path: str, docs: int, length: int, seed: int = 0) -> Database:
+    database = Database(path, threads=1)
+    database.migrate()
+    rng = random.Random(seed)
+    words, weights = vocabulary(20000, seed)
+    for start in range(0, docs, 1000):
+        with database.transaction(immediate=True) as conn:
+            for i in range(start, min(docs, start + 1000)):
+                fid = f"doc-{i:07d}"
+                conn.execute("INSERT INTO files (id, filename, original_name, status) VALUES (?, ?, ?, 'processed')",
+                             (fid, f"{fid}.txt", f"judgment {i}.pdf"))
+                search.index_document(conn, fid, document(rng, words, weights, length), {
+                    "facts": {"court": "High Court", "section": f"section {rng.randint(1, 500)}"},
+                    "lawyer": {"summary": document(rng, words, weights, 60)},
+                })
+    with database.transaction(immediate=True) as conn:
+        conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return database
+
+
+def timed(conn, q: str, sort: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search.search(conn, q, 20, sort=sort)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[10000])
+    parser.add_argument("--words", type=int, default=600, help="words per document")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for docs in args.docs:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            database = build(os.path.join(tmp, "bench.db"), docs, args.words)
+            built = time.perf_counter() - start
+            conn = database.connect()
+            text_bytes = conn.execute("SELECT SUM(LENGTH(CAST(text AS BLOB))) FROM search_text").fetchone()[0]
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = os.path.getsize(os.path.join(tmp, "bench.db"))
+            print(f"{docs} docs: indexed in {built:.1f}s, database {size / 1e6:.0f} MB "
+                  f"({text_bytes / 1e6:.0f} MB of it stored text)")
+            for name, q in QUERIES.items():
+                ranked = timed(conn, q, "rank", args.repeat)
+                recent = timed(conn, q, "recent", args.repeat)
+                print(f"  {name:>10} {q!r:>20}  rank {ranked:8.1f} ms  recent {recent:8.1f} ms")
+            database.close()
+
+
+if __name__ == "__main__":
+    main()
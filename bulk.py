@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Batch processing of offline corpora, without the HTTP round trips.
+
+Reads every PDF, DOCX and text file under a directory (or the paths listed in
+a manifest, one per line), extracts their text into the blob store and
+runs the same pipeline as POST /summaries, `--workers` documents at a time
+so the classifier batches across documents and LLM calls overlap. Finished
+documents are written to legal_lens.db in bulk, `--commit-every` per
+transaction, and appear in the file manager like uploads.
+
+Every committed document is appended to a checkpoint file, so an interrupted
+run picks up where it stopped when started again with the same arguments.
+File ids are derived from each source's path, size and modification time:
+a document committed just before a crash, but missing from the checkpoint,
+is overwritten rather than duplicated.
+
+    python bulk.py /archive/cases --workers 8
+    python bulk.py --manifest backfill.txt --user archive --retry-errors
+"""
+import argparse, asyncio, hashlib, json, os, sys, time, uuid
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
+
+import glue
+from glue import db, store, result_cache, llm_client, build_results, cacheable, result_row, write_results
+from stages import registry, executor
+import search
+import neardup
+from ingest.blobstore import Blob
+from ingest.reader import PDF, DOCX, TEXT, ingest_file
+
+CONTENT_TYPES = {".pdf": PDF, ".docx": DOCX, ".txt": TEXT}
+
+
+class Source(NamedTuple):
+    path: str
+    content_type: Optional[str]
+
+
+class Done(NamedTuple):
+    source: Source
+    fid: str
+    size: int
+    status: str                     # processed, cached, reused or error
+    results: Optional[Dict]
+    error: Optional[str] = None
+    text: Optional[str] = None      # extracted text file, removed once written
+    blob: Optional[Blob] = None
+    pages: Optional[str] = None
+    signature: Optional[bytes] = None
+    fingerprints: Optional[Dict[str, str]] = None   # of stage outputs, for incremental reprocessing
+
+
+def scan(root: str) -> Iterator[Source]:
+    """Supported files under a directory, in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+            if content_type:
+                yield Source(os.path.abspath(os.path.join(dirpath, name)), content_type)
+
+
+def read_manifest(manifest: str) -> Iterator[Source]:
+    """One path per line; relative paths are resolved against the manifest's directory"""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding="utf-8") as f:
+        for line in f:
+            path = line.strip()
+            if path and not path.startswith("#"):
+                path = os.path.join(base, path)
+                yield Source(path, CONTENT_TYPES.get(os.path.splitext(path)[1].lower()))
+
+
+def file_id(path: str) -> str:
+    """Stable id for one version of a source file"""
+    st = os.stat(path)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"file://{os.path.abspath(path)}?{st.st_size}:{st.st_mtime_ns}"))
+
+
+def default_checkpoint(args) -> str:
+    source = os.path.abspath(args.manifest or args.directory)
+    return os.path.join(glue.RESULTS_DIR, f"bulk-{hashlib.sha1(source.encode()).hexdigest()[:12]}.jsonl")
+
+
+def load_checkpoint(path: str, retry_errors: bool) -> Set[str]:
+    """Source paths already finished by an earlier run"""
+    finished = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue            # torn last line of an interrupted run
+                if entry["status"] != "error" or not retry_errors:
+                    finished.add(entry["path"])
+                else:
+                    finished.discard(entry["path"])
+    return finished
+
+
+async def process(source: Source) -> Done:
+    """Extract one source and run the pipeline on it, like an upload plus run_summary_job"""
+    fid, size, txt_path = None, 0, None
+    start = time.perf_counter()
+    try:
+        if source.content_type is None:
+            raise ValueError("Unsupported file type")
+        fid = file_id(source.path)
+        size = os.path.getsize(source.path)
+        txt_path = f"{glue.SPOOL_DIR}/{fid}.txt"
+        extracted = await asyncio.to_thread(ingest_file, source.path, source.content_type, txt_path, False)
+        if not extracted.has_text:
+            raise ValueError("Could not extract text")
+        blob = await asyncio.to_thread(store.put_file, txt_path)
+
+        txt = await asyncio.to_thread(glue.read_text, txt_path)
+        key = result_cache.key(txt)
+        results = await asyncio.to_thread(result_cache.get, key)
+        signature = await asyncio.to_thread(neardup.signature, txt)
+        status = "cached"
+        if results is None and neardup.NEAR_DUP_REUSE and signature is not None:
+            results = await db.run(glue.near_duplicate_results, fid, txt, signature)
+            status = "reused"
+        fingerprints = None
+        if results is None:
+            status = "processed"
+            outcome = await executor.run(txt)
+            fingerprints = outcome.fingerprints
+            glue.pipeline_stats.record_stages(outcome.timings)
+            results = build_results(outcome)
+            if cacheable(results):
+                await asyncio.to_thread(result_cache.put, key, results)
+        glue.pipeline_stats.record_job(time.perf_counter() - start, "done" if status == "processed" else status)
+        return Done(source, fid, size, status, results, text=txt_path, blob=blob,
+                    pages=json.dumps(extracted.pages), signature=signature, fingerprints=fingerprints)
+    except Exception as e:
+        glue.pipeline_stats.record_job(time.perf_counter() - start, "error")
+        if txt_path and os.path.exists(txt_path):
+            os.remove(txt_path)
+        return Done(source, fid, size, "error", None, f"{type(e).__name__}: {e}")
+
+
+def write_batch(batch: List[Done], owner: Optional[str]):
+    """One transaction for a batch of finished documents; failures are only checkpointed"""
+    batch = [d for d in batch if d.results is not None]
+    files = [
+        (d.fid, f"{d.fid}.txt", os.path.basename(d.source.path), d.size, d.source.content_type, "processed",
+         owner, d.blob.digest, d.pages, d.signature)
+        for d in batch
+    ]
+    with db.transaction(immediate=True) as conn:
+        for d in batch:
+            if not store.exists(d.blob.digest):     # released by a delete since it was stored
+                store.put_file(d.text)
+        conn.executemany(
+            "INSERT INTO blobs (digest, size, stored_size) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+            [(d.blob.digest, d.blob.size, d.blob.stored) for d in batch]
+        )
+        # a document written before a crash but not checkpointed is updated in place
+        conn.executemany('''
+            INSERT INTO files (id, filename, original_name, file_size, content_type, status, owner,
+                               text_blob, pages, minhash, processed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                status = excluded.status, owner = excluded.owner, text_blob = excluded.text_blob,
+                pages = excluded.pages, minhash = excluded.minhash, processed_at = excluded.processed_at
+        ''', files)
+        write_results(conn, [result_row(d.fid, d.results, d.fingerprints) for d in batch])
+        for d in batch:
+            search.index_document(conn, d.fid, glue.read_text(d.text), d.results)
+            neardup.index(conn, d.fid, d.signature)
+    for d in batch:
+        os.remove(d.text)
+
+
+class Progress:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.counts = {"processed": 0, "cached": 0, "reused": 0, "error": 0}
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    def add(self, batch: List[Done]):
+        for d in batch:
+            self.counts[d.status] += 1
+            self.bytes += d.size
+
+    def line(self) -> str:
+        done = sum(self.counts.values())
+        seconds = time.perf_counter() - self.started
+        rate = done / seconds if seconds else 0.0
+        remaining = self.total - done
+        eta = f"{remaining / rate / 60:.1f} min" if rate else "?"
+        return (f"{done}/{self.total} done ({self.counts['processed']} processed, "
+                f"{self.counts['cached']} cached, {self.counts['reused']} reused, {self.counts['error']} errors), "
+                f"{rate:.2f} docs/s, {self.bytes / 2 ** 20 / seconds if seconds else 0:.2f} MB/s, ETA {eta}")
+
+
+async def run(sources: List[Source], args, checkpoint: str, progress: Progress):
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.workers * 2)
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def feed():
+        for source in sources:
+            await queue.put(source)
+        for _ in range(args.workers):
+            await queue.put(None)
+
+    async def worker():
+        while (source := await queue.get()) is not None:
+            await finished.put(await process(source))
+        await finished.put(None)
+
+    async def writer():
+        batch: List[Done] = []
+        running = args.workers
+        last_flush = last_report = time.perf_counter()
+        with open(checkpoint, "a", encoding="utf-8") as log:
+            while running:
+                try:
+                    item = await asyncio.wait_for(finished.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    item = ...
+                if item is None:
+                    running -= 1
+                elif item is not ...:
+                    batch.append(item)
+                    if item.error and args.verbose:
+                        print(f"error: {item.source.path}: {item.error}", file=sys.stderr)
+                now = time.perf_counter()
+                if batch and (len(batch) >= args.commit_every or now - last_flush >= args.flush_seconds
+                              or not running):
+                    await db.run(write_batch, batch, args.user)
+                    # checkpoint only what is committed
+                    for d in batch:
+                        log.write(json.dumps({"path": d.source.path, "file_id": d.fid,
+                                              "status": d.status, "error": d.error}) + "\n")
+                    log.flush()
+                    os.fsync(log.fileno())
+                    progress.add(batch)
+                    batch, last_flush = [], now
+                if now - last_report >= args.report_every:
+                    print(progress.line(), file=sys.stderr)
+                    last_report = now
+
+    await asyncio.to_thread(glue.warm_up)
+    if registry.errors:
+        print(f"stages failed to load: {registry.errors}", file=sys.stderr)
+    try:
+        await asyncio.gather(feed(), writer(), *(worker() for _ in range(args.workers)))
+    finally:
+        await llm_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory", nargs="?", help="process every supported file under this directory")
+    parser.add_argument("--manifest", help="file listing the documents to process, one path per line")
+    parser.add_argument("--workers", type=int, default=8, help="documents in the pipeline at once")
+    parser.add_argument("--commit-every", type=int, default=100, help="documents written per transaction")
+    parser.add_argument("--flush-seconds", type=float, default=10.0, help="longest wait before a partial batch is written")
+    parser.add_argument("--checkpoint", help="progress file (default: results/bulk-<hash of the input>.jsonl)")
+    parser.add_argument("--retry-errors", action="store_true", help="reprocess documents that failed in earlier runs")
+    parser.add_argument("--user", help="owner recorded on the files, as with the upload form's user field")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--verbose", action="store_true", help="print each failed document")
+    args = parser.parse_args()
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+    args.workers = max(1, args.workers)
+    args.commit_every = max(1, args.commit_every)
+
+    checkpoint = args.checkpoint or default_checkpoint(args)
+    finished = load_checkpoint(checkpoint, args.retry_errors)
+    sources = list(read_manifest(args.manifest) if args.manifest else scan(args.directory))
+    todo = [s for s in sources if s.path not in finished]
+    progress = Progress(len(todo), len(sources) - len(todo))
+    print(f"{len(sources)} documents, {progress.skipped} already done, checkpoint {checkpoint}", file=sys.stderr)
+
+    try:
+        asyncio.run(run(todo, args, checkpoint, progress))
+    except KeyboardInterrupt:
+        print("interrupted; run again with the same arguments to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        db.close()
+    print(progress.line(), file=sys.stderr)
+    pipeline = glue.pipeline_stats.snapshot()
+    print(json.dumps({"documents": len(sources), "skipped": progress.skipped, **progress.counts,
+                      "latency": pipeline["latency"], "stages": pipeline["stages"]}))
+    sys.exit(1 if progress.counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
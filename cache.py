@@ -0,0 +1,154 @@
+"""
+Content-addressed cache of pipeline results.
+
+Re-uploads of the same notice or template contract get a new file id but
+produce the same text, so results are cached under a hash of the normalised
+text plus a version of everything else that shapes the output: the version
+of every pipeline stage (its code, configuration, prompts and model, see
+stages.py), known once the stages have loaded. A hit
+serves the lawyer/citizen summaries, facts and next steps without running a
+single stage. Entries expire after `ttl` seconds and the least recently used
+ones are evicted beyond `max_entries`.
+"""
+import hashlib, json, re, sqlite3, threading, time, unicodedata
+from typing import Dict, Iterable, Optional
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Canonical form used for hashing: NFKC, collapsed whitespace, trimmed"""
+    return _whitespace.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def fingerprint(paths: Iterable[str], extra: Iterable[str] = ()) -> str:
+    """Short hash over file contents and strings, e.g. prompt templates"""
+    h = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(b"<missing>")
+        h.update(b"\0")
+    for s in extra:
+        h.update(s.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    def __init__(self, db_file: str, version: Optional[str] = None, ttl: float = 30 * 24 * 3600,
+                 max_entries: int = 10000):
+        self.db_file = db_file
+        self.version = version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_file, timeout=30)
+
+    def init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_hit_at REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_lru ON result_cache (last_hit_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def key(self, text: str) -> str:
+        if self.version is None:
+            raise RuntimeError("Result cache version not set; load the pipeline stages first")
+        h = hashlib.sha256(normalize(text).encode("utf-8"))
+        h.update(b"\0" + self.version.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT results, created_at FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+                with self._lock:
+                    self.evictions += 1
+            if row is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE result_cache SET last_hit_at = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, results: Dict):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO result_cache (key, results, created_at, last_hit_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, json.dumps(results), now, now))
+            evicted = self._evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        expired = conn.execute(
+            "DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl,)
+        ).rowcount
+        overflow = conn.execute('''
+            DELETE FROM result_cache WHERE key IN (
+                SELECT key FROM result_cache ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,)).rowcount
+        return expired + overflow
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,116 @@
+"""
+Dynamic micro-batching for model calls.
+
+Requests for single items that arrive within `max_wait` seconds of each other
+are coalesced into one call of `fn(items) -> results`, at most `max_batch`
+items at a time, so a burst of documents costs one forward pass instead of
+one per document. The batch function runs in a worker thread; while it runs,
+new requests queue up and form the next batch. If a batch fails, its items
+are retried one by one so a single bad input only fails its own request.
+
+Stats count items, named by `unit` (the classifier's items are text
+windows, several per document); callers that submit several items per
+request report requests, named by `request_unit` (documents), with
+`count_requests()`. Both rates are per second of batch function time.
+"""
+import asyncio, threading, time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 32, max_wait: float = 0.01,
+                 unit: str = "items", request_unit: str = "requests"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.unit = unit
+        self.request_unit = request_unit
+        self.items = 0
+        self.requests = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        # the queue and worker task belong to the event loop that created them
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(self, item: Any) -> Any:
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if self.max_wait > 0 and queue.qsize() < self.max_batch - 1:
+                # give requests arriving right behind this one a chance to join
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch):
+        items = [item for item, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.fn, items)
+            outcomes = [(True, r) for r in results]
+        except Exception as e:
+            if len(batch) == 1:
+                outcomes = [(False, e)]
+            else:
+                outcomes = []
+                for item in items:
+                    try:
+                        outcomes.append((True, (await asyncio.to_thread(self.fn, [item]))[0]))
+                    except Exception as item_error:
+                        outcomes.append((False, item_error))
+        self.record(len(batch), time.perf_counter() - start)
+
+        for (_, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def record(self, items: int, seconds: float):
+        with self._stats_lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += seconds
+
+    def count_requests(self, n: int = 1):
+        with self._stats_lock:
+            self.requests += n
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = {
+                self.unit: self.items,
+                "batches": self.batches,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+                f"{self.unit}_per_sec": round(self.items / self.busy_seconds, 2) if self.busy_seconds else None,
+                "max_batch": self.max_batch,
+                "max_wait_s": self.max_wait,
+            }
+            if self.requests:
+                stats[self.request_unit] = self.requests
+                stats[f"{self.request_unit}_per_sec"] = \
+                    round(self.requests / self.busy_seconds, 2) if self.busy_seconds else None
+                stats[f"mean_{self.unit}_per_request"] = round(self.items / self.requests, 2)
+            return stats
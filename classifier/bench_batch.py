@@ -0,0 +1,75 @@
+"""
+Benchmark: classifier throughput on CPU by batch size.
+
+Classifies the same synthetic documents one at a time and then with every
+batch size given, checks that the labels match, and prints docs/sec. The last
+rows submit the documents concurrently through the micro-batcher the pipeline
+uses, so its coalescing can be compared with explicit batches.
+
+    python -m classifier.bench_batch --docs 256 --sizes 1 8 32 64 --model weights/legal_clf.joblib
+"""
+import argparse, asyncio, random, time
+from classifier import clf_infer
+from classifier.batcher import MicroBatcher
+
+LEGAL = (
+    "the court held that the appellant petition order decree hearing notice section act "
+    "evidence witness agreement respondent tribunal judgment appeal plaintiff defendant"
+).split()
+OTHER = (
+    "the recipe weather football holiday garden music travel camera river mountain "
+    "festival coffee market bicycle painting village school morning friends"
+).split()
+
+
+def make_docs(n: int, words: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(LEGAL if i % 2 == 0 else OTHER) for _ in range(words)) for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=256)
+    parser.add_argument("--words", type=int, default=300, help="words per synthetic document")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--model", default=clf_infer.MODEL_PATH)
+    parser.add_argument("--wait-ms", type=float, default=10.0, help="micro-batcher coalescing window")
+    args = parser.parse_args()
+
+    clf_infer.MODEL_PATH = args.model
+    start = time.perf_counter()
+    clf_infer.load()
+    print(f"model loaded in {time.perf_counter() - start:.2f}s")
+    docs = make_docs(args.docs, args.words)
+    clf_infer.classify_batch(docs[:4])      # warm-up
+
+    print(f"{'mode':>18} {'seconds':>8} {'docs/s':>8}")
+    expected = None
+    for size in args.sizes:
+        start = time.perf_counter()
+        labels = []
+        for i in range(0, len(docs), size):
+            labels += clf_infer.classify_batch(docs[i:i + size], batch_size=size)
+        seconds = time.perf_counter() - start
+        if expected is None:
+            expected = labels
+        assert labels == expected, f"batch size {size} changed predictions"
+        print(f"{f'batch {size}':>18} {seconds:>8.2f} {len(docs) / seconds:>8.1f}")
+
+    for size in args.sizes:
+        batcher = MicroBatcher(clf_infer.classify_batch, max_batch=size, max_wait=args.wait_ms / 1000)
+
+        async def run_all():
+            return await asyncio.gather(*(batcher.submit(d) for d in docs))
+
+        start = time.perf_counter()
+        labels = asyncio.run(run_all())
+        seconds = time.perf_counter() - start
+        assert list(labels) == expected, f"micro-batcher (max {size}) changed predictions"
+        stats = batcher.stats()
+        mode = f"micro max {size}"
+        print(f"{mode:>18} {seconds:>8.2f} {len(docs) / seconds:>8.1f}   mean batch {stats['mean_batch_size']}")
+
+
+if __name__ == "__main__":
+    main()
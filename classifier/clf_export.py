@@ -0,0 +1,89 @@
+"""
+Export the trained SetFit classifier for lightweight CPU inference.
+
+Writes, into one directory:
+  model.onnx        the sentence-transformer encoder with mean pooling (fp32)
+  model.int8.onnx   the same graph with int8 dynamically quantized weights
+  tokenizer.json    the fast tokenizer, loadable without transformers
+  head.json         the logistic-regression head and encoder settings
+
+classifier/onnx_backend.py serves predictions from these with onnxruntime and
+numpy only; run classifier/clf_parity.py afterwards to check them against the
+original model.
+
+    python -m classifier.clf_export --model weights/legal_clf.joblib --out weights/legal_clf_onnx
+"""
+import argparse, json, os
+import joblib
+import torch
+
+
+class MeanPooledEncoder(torch.nn.Module):
+    """Transformer + attention-masked mean pooling, as in the SetFit body"""
+
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask):
+        hidden = self.transformer(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+
+def export(model, out_dir: str, opset: int = 14) -> dict:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    body, head = model.model_body, model.model_head
+    transformer, pooling = body[0], body[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError("only mean-pooled sentence-transformer bodies can be exported")
+    if not hasattr(head, "coef_"):
+        raise ValueError(f"only scikit-learn linear heads can be exported, not {type(head).__name__}")
+    normalize = bool(getattr(model, "normalize_embeddings", False)) or \
+        any(type(m).__name__ == "Normalize" for m in body)
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(out_dir)
+
+    encoder = MeanPooledEncoder(transformer.auto_model).eval()
+    sample = tokenizer(["export sample"], return_tensors="pt", padding=True)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder, (sample["input_ids"], sample["attention_mask"]), fp32_path,
+            input_names=["input_ids", "attention_mask"], output_names=["embedding"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "tokens"},
+                          "attention_mask": {0: "batch", 1: "tokens"},
+                          "embedding": {0: "batch"}},
+            opset_version=opset,
+        )
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    config = {
+        "max_seq_length": int(body.max_seq_length),
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": int(tokenizer.pad_token_id),
+        "normalize": normalize,
+        "classes": [int(c) if str(c).isdigit() else str(c) for c in head.classes_],
+        "coef": head.coef_.tolist(),
+        "intercept": head.intercept_.tolist(),
+    }
+    with open(os.path.join(out_dir, "head.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return {
+        "fp32_mb": round(os.path.getsize(fp32_path) / 2 ** 20, 1),
+        "int8_mb": round(os.path.getsize(int8_path) / 2 ** 20, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="weights/legal_clf.joblib")
+    parser.add_argument("--out", default="weights/legal_clf_onnx")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    sizes = export(joblib.load(args.model), args.out, args.opset)
+    print(f"exported to {args.out}: fp32 {sizes['fp32_mb']} MB, int8 {sizes['int8_mb']} MB")
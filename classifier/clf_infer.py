@@ -1,5 +1,131 @@
-import joblib, sys
+import sys, os, time, argparse, asyncio
+from typing import List, NamedTuple
+from cache import fingerprint
+from classifier.batcher import MicroBatcher
 
-model = joblib.load("weights/legal_clf.joblib")
-text = sys.stdin.read()
-print(int(model([text])[0]))
+MODEL_PATH = "weights/legal_clf.joblib"
+BACKEND = os.getenv("CLF_BACKEND", "joblib")                  # "onnx": int8 export from clf_export.py
+ONNX_DIR = os.getenv("CLF_ONNX_DIR", "weights/legal_clf_onnx")
+BATCH_SIZE = int(os.getenv("CLF_BATCH_SIZE", "32"))          # texts per encoder forward pass
+BATCH_WAIT = float(os.getenv("CLF_BATCH_WAIT_MS", "10")) / 1000
+# MiniLM reads ~256 tokens, so long documents are sampled rather than sent whole
+WINDOW_CHARS = int(os.getenv("CLF_WINDOW_CHARS", "1500"))
+MIDDLE_WINDOWS = int(os.getenv("CLF_MIDDLE_WINDOWS", "2"))
+EARLY_EXIT = float(os.getenv("CLF_EARLY_EXIT", "0.9"))      # head-window confidence that skips the rest
+LEGAL = 1
+_model = None
+
+class Classification(NamedTuple):
+    label: int                  # 1 legal, 0 not legal
+    confidence: float           # probability of `label`
+    windows: int                # windows scored before deciding
+
+    # truthy only for legal documents, so the pipeline gate reads it like the old int
+    def __bool__(self):
+        return bool(self.label)
+
+def load():
+    global _model
+    if _model is None:
+        if BACKEND == "onnx":
+            from classifier.onnx_backend import OnnxClassifier
+            _model = OnnxClassifier(ONNX_DIR)
+        else:
+            import joblib   # with torch/setfit behind it; only needed once the model loads
+            _model = joblib.load(MODEL_PATH)
+    return _model
+
+def version() -> str:
+    """Backend, sampling settings and the weights' size and mtime (hashing the weights would take seconds)"""
+    if BACKEND == "onnx":
+        weights = [os.path.join(ONNX_DIR, name) for name in sorted(os.listdir(ONNX_DIR))] if os.path.isdir(ONNX_DIR) else []
+        code = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_backend.py")]
+    else:
+        weights, code = [MODEL_PATH], []
+    stamps = []
+    for path in weights:
+        try:
+            st = os.stat(path)
+            stamps.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            stamps.append(f"{path}:missing")
+    return fingerprint(code, [BACKEND, str(WINDOW_CHARS), str(MIDDLE_WINDOWS), str(EARLY_EXIT), *stamps])
+
+def windows(text: str, size: int = WINDOW_CHARS, middle: int = MIDDLE_WINDOWS) -> List[str]:
+    """Head first, then tail and evenly spaced middle spans; the whole text if it fits in one"""
+    text = text.strip()
+    if len(text) <= size:
+        return [text]
+    span = len(text) - size
+    starts = [0, span] + [span * (i + 1) // (middle + 1) for i in range(middle)]
+    out = []
+    for start in starts:
+        if start:
+            # start on a word boundary
+            space = text.find(" ", start, start + 100)
+            if space != -1:
+                start = space + 1
+        out.append(text[start:start + size])
+    return out
+
+def legal_probabilities(texts: List[str], batch_size: int = BATCH_SIZE) -> List[float]:
+    """P(legal) for many texts with one model call (the encoder runs batch_size at a time)"""
+    if not texts:
+        return []
+    proba = load().predict_proba(texts, batch_size=batch_size, as_numpy=True)
+    return [float(p[LEGAL]) for p in proba]
+
+def decisive(p: float) -> bool:
+    return p >= EARLY_EXIT or p <= 1 - EARLY_EXIT
+
+def combine(probabilities: List[float]) -> Classification:
+    p = sum(probabilities) / len(probabilities)
+    label = int(p >= 0.5)
+    return Classification(label, round(p if label else 1 - p, 4), len(probabilities))
+
+def score_batch(texts: List[str], batch_size: int = BATCH_SIZE) -> List[Classification]:
+    """Classify many documents: all head windows in one pass, the undecided rest in a second"""
+    spans = [windows(t) for t in texts]
+    probs = [[p] for p in legal_probabilities([s[0] for s in spans], batch_size)]
+    undecided = [i for i, s in enumerate(spans) if len(s) > 1 and not decisive(probs[i][0])]
+    rest = iter(legal_probabilities([w for i in undecided for w in spans[i][1:]], batch_size))
+    for i in undecided:
+        probs[i] += [next(rest) for _ in spans[i][1:]]
+    return [combine(p) for p in probs]
+
+def classify_batch(texts: List[str], batch_size: int = BATCH_SIZE) -> List[int]:
+    return [c.label for c in score_batch(texts, batch_size)]
+
+def classify(text: str) -> Classification:
+    return score_batch([text])[0]
+
+# Windows scored close together in time, from any document, share one forward pass
+batcher = MicroBatcher(legal_probabilities, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT,
+                       unit="windows", request_unit="docs")
+
+async def aclassify(text: str) -> Classification:
+    spans = windows(text)
+    batcher.count_requests()
+    probs = [await batcher.submit(spans[0])]
+    if len(spans) > 1 and not decisive(probs[0]):
+        probs += await asyncio.gather(*(batcher.submit(w) for w in spans[1:]))
+    return combine(probs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify documents as legal (1) or not (0)")
+    parser.add_argument("files", nargs="*", help="text files to classify in batches (default: one text on stdin)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    if not args.files:
+        result = classify(sys.stdin.read())
+        print(f"{result.label}\t{result.confidence}")
+        sys.exit(0)
+
+    load()
+    texts = [open(path, encoding="utf-8", errors="ignore").read() for path in args.files]
+    start = time.perf_counter()
+    results = score_batch(texts, batch_size=args.batch_size)
+    seconds = time.perf_counter() - start
+    for path, result in zip(args.files, results):
+        print(f"{path}\t{result.label}\t{result.confidence}\t{result.windows}")
+    print(f"{len(texts)} docs in {seconds:.2f}s ({len(texts) / seconds:.1f} docs/sec)", file=sys.stderr)
@@ -0,0 +1,82 @@
+"""
+Parity check: ONNX export vs the original SetFit classifier.
+
+Scores the same texts (the given files, or synthetic legal and non-legal
+documents) with both models, prints label agreement and the largest
+difference in P(legal), and exits non-zero if they disagree beyond the
+thresholds. With --measure it also loads each backend in a fresh process and
+reports load time and peak RSS.
+
+    python -m classifier.clf_parity --model weights/legal_clf.joblib --onnx-dir weights/legal_clf_onnx --measure
+"""
+import argparse, json, resource, subprocess, sys, time
+import numpy as np
+from classifier.bench_batch import make_docs
+
+
+def load_backend(kind: str, model: str, onnx_dir: str, quantized: bool = True):
+    if kind == "onnx":
+        from classifier.onnx_backend import OnnxClassifier
+        return OnnxClassifier(onnx_dir, quantized=quantized)
+    import joblib
+    return joblib.load(model)
+
+
+def measure(kind: str, args) -> dict:
+    """Load one backend in a fresh interpreter and report its cost"""
+    command = [sys.executable, "-m", "classifier.clf_parity", "--load-only", kind,
+               "--model", args.model, "--onnx-dir", args.onnx_dir] + (["--fp32"] if args.fp32 else [])
+    return json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", help="text files to compare on (default: synthetic documents)")
+    parser.add_argument("--model", default="weights/legal_clf.joblib")
+    parser.add_argument("--onnx-dir", default="weights/legal_clf_onnx")
+    parser.add_argument("--fp32", action="store_true", help="compare the unquantized export")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--max-prob-diff", type=float, default=0.1)
+    parser.add_argument("--measure", action="store_true", help="report load time and RSS of each backend")
+    parser.add_argument("--load-only", choices=["joblib", "onnx"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load_only:
+        start = time.perf_counter()
+        model = load_backend(args.load_only, args.model, args.onnx_dir, quantized=not args.fp32)
+        model.predict_proba(["warm up"], batch_size=1, as_numpy=True)
+        seconds = time.perf_counter() - start
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(json.dumps({"seconds": round(seconds, 2), "rss_mb": round(rss_mb, 1)}))
+        return
+
+    if args.files:
+        texts = [open(path, encoding="utf-8", errors="ignore").read() for path in args.files]
+    else:
+        texts = make_docs(args.docs, 120)
+
+    reference = load_backend("joblib", args.model, args.onnx_dir)
+    exported = load_backend("onnx", args.model, args.onnx_dir, quantized=not args.fp32)
+    expected = np.asarray(reference.predict_proba(texts, batch_size=32, as_numpy=True))
+    actual = exported.predict_proba(texts, batch_size=32)
+
+    agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    diff = np.abs(expected[:, 1] - actual[:, 1])
+    print(f"{len(texts)} texts: label agreement {agreement:.2%}, "
+          f"P(legal) diff mean {diff.mean():.4f} max {diff.max():.4f}")
+
+    if args.measure:
+        print(f"{'backend':>8} {'load s':>8} {'RSS MB':>8}")
+        for kind in ("joblib", "onnx"):
+            cost = measure(kind, args)
+            print(f"{kind:>8} {cost['seconds']:>8.2f} {cost['rss_mb']:>8.1f}")
+
+    if agreement < args.min_agreement or diff.max() > args.max_prob_diff:
+        print("parity check FAILED", file=sys.stderr)
+        sys.exit(1)
+    print("parity check passed")
+
+
+if __name__ == "__main__":
+    main()
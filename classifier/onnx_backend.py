@@ -0,0 +1,65 @@
+"""
+Classifier inference from the ONNX export (see clf_export.py).
+
+Loads the int8 encoder into onnxruntime, the fast tokenizer with the
+`tokenizers` package and the logistic head as plain arrays: no torch, setfit
+or unpickling, so it starts in a fraction of the time and memory of the
+joblib model. Exposes the predict/predict_proba calls clf_infer makes on the
+SetFit model, with the same class order.
+"""
+import json, os
+from typing import List, Optional
+
+import numpy as np
+import onnxruntime
+from tokenizers import Tokenizer
+
+
+class OnnxClassifier:
+    def __init__(self, model_dir: str, quantized: bool = True, threads: Optional[int] = None):
+        with open(os.path.join(model_dir, "head.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.classes = np.array(config["classes"])
+        self.coef = np.array(config["coef"], dtype=np.float32)
+        self.intercept = np.array(config["intercept"], dtype=np.float32)
+        self.normalize = config["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model = "model.int8.onnx" if quantized else "model.onnx"
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model), options, providers=["CPUExecutionProvider"]
+        )
+
+    def embed(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[i:i + batch_size])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            }
+            out.append(self.session.run(["embedding"], feed)[0])
+        embeddings = np.concatenate(out) if out else np.zeros((0, self.coef.shape[1]), dtype=np.float32)
+        if self.normalize:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def predict_proba(self, texts: List[str], batch_size: int = 32, as_numpy: bool = True) -> np.ndarray:
+        scores = self.embed(texts, batch_size) @ self.coef.T + self.intercept
+        if scores.shape[1] == 1:
+            # binary logistic regression: one column for the second class
+            positive = 1 / (1 + np.exp(-scores[:, 0]))
+            return np.stack([1 - positive, positive], axis=1)
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: List[str], batch_size: int = 32, as_numpy: bool = True) -> np.ndarray:
+        return self.classes[self.predict_proba(texts, batch_size).argmax(axis=1)]
+
+    __call__ = predict
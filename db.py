@@ -0,0 +1,457 @@
+"""
+SQLite access for the metadata store (legal_lens.db).
+
+Every thread that touches the database keeps one open connection instead of
+connecting per query, and connections run in WAL mode so the dashboard's
+readers and the pipeline's writers no longer block each other. Async code
+hands blocking work to `db.run()`, which executes it on the store's own small
+thread pool; that keeps queries off the event loop and bounds the number of
+open connections to DB_THREADS.
+
+Schema changes are numbered migrations, applied in order at startup. The
+current version lives in `PRAGMA user_version`, so existing databases are
+upgraded in place and fresh ones are built by the same steps.
+"""
+import asyncio, functools, hashlib, os, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",      # durable at checkpoints; WAL keeps the file consistent
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",       # 16 MB page cache per connection
+)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _create_tables(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            file_size INTEGER,
+            content_type TEXT,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            status TEXT DEFAULT 'uploaded'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS results (
+            file_id TEXT PRIMARY KEY,
+            lawyer_summary TEXT,
+            citizen_summary TEXT,
+            next_steps TEXT,
+            key_facts TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+    ''')
+
+
+def _add_owner(conn: sqlite3.Connection):
+    # Databases created before migrations existed may already have the column
+    if "owner" not in _columns(conn, "files"):
+        conn.execute("ALTER TABLE files ADD COLUMN owner TEXT")
+
+
+def _index_files(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_status ON files (status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_uploaded_at ON files (uploaded_at, id)")
+
+
+NOW_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _track_changes(conn: sqlite3.Connection):
+    """files.updated_at and deletion tombstones, for incremental file list refreshes"""
+    if "updated_at" not in _columns(conn, "files"):
+        # ADD COLUMN cannot default to the current time; triggers fill it in
+        conn.execute("ALTER TABLE files ADD COLUMN updated_at TIMESTAMP")
+    conn.execute("UPDATE files SET updated_at = COALESCE(processed_at, uploaded_at) WHERE updated_at IS NULL")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_inserted AFTER INSERT ON files
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE files SET updated_at = {NOW_MS} WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_updated AFTER UPDATE ON files
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE files SET updated_at = {NOW_MS} WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_tombstones (
+            id TEXT PRIMARY KEY,
+            deleted_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_tombstones_deleted_at ON file_tombstones (deleted_at)")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_deleted AFTER DELETE ON files
+        BEGIN
+            INSERT OR REPLACE INTO file_tombstones (id, deleted_at) VALUES (OLD.id, {NOW_MS});
+            DELETE FROM file_tombstones WHERE deleted_at < strftime('%Y-%m-%d %H:%M:%f', 'now', '-30 days');
+        END
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_updated_at ON files (updated_at, id)")
+    # Filtered listings: status with the list order, and case-insensitive name prefixes
+    conn.execute("DROP INDEX IF EXISTS idx_files_status")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_status_uploaded_at ON files (status, uploaded_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_name ON files (original_name COLLATE NOCASE)")
+
+
+def _bump(dimension: str, value: str, files: str, size: str) -> str:
+    return f'''
+            INSERT INTO file_stats (dimension, value, files, bytes) VALUES ('{dimension}', {value}, {files}, {size})
+            ON CONFLICT (dimension, value) DO UPDATE
+            SET files = files + excluded.files, bytes = bytes + excluded.bytes;'''
+
+
+def _file_stats(conn: sqlite3.Connection):
+    """Counters behind /stats, maintained by triggers in the same transaction as each change"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_stats (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            files INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("DELETE FROM file_stats")
+    for dimension, column in (("total", "''"), ("status", "COALESCE(status, '')"),
+                              ("content_type", "COALESCE(content_type, '')")):
+        conn.execute(f'''
+            INSERT INTO file_stats (dimension, value, files, bytes)
+            SELECT '{dimension}', {column}, COUNT(*), COALESCE(SUM(file_size), 0)
+            FROM files GROUP BY 2
+        ''')
+
+    def bumps(row: str, sign: str) -> str:
+        size = f"{sign}COALESCE({row}.file_size, 0)"
+        return "".join((
+            _bump("total", "''", f"{sign}1", size),
+            _bump("status", f"COALESCE({row}.status, '')", f"{sign}1", size),
+            _bump("content_type", f"COALESCE({row}.content_type, '')", f"{sign}1", size),
+        ))
+
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS file_stats_insert AFTER INSERT ON files BEGIN {bumps('NEW', '')} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS file_stats_delete AFTER DELETE ON files BEGIN {bumps('OLD', '-')} END")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS file_stats_update AFTER UPDATE OF status, content_type, file_size ON files
+        WHEN OLD.status IS NOT NEW.status OR OLD.content_type IS NOT NEW.content_type
+            OR OLD.file_size IS NOT NEW.file_size
+        BEGIN {bumps('OLD', '-')} {bumps('NEW', '')} END
+    ''')
+
+
+def _classification(conn: sqlite3.Connection):
+    if "classification" not in _columns(conn, "results"):
+        conn.execute("ALTER TABLE results ADD COLUMN classification TEXT")
+
+
+def _blob_store(conn: sqlite3.Connection):
+    """files.text_blob points into the compressed text store; blobs counts its references"""
+    for column in ("text_blob", "pages"):
+        if column not in _columns(conn, "files"):
+            conn.execute(f"ALTER TABLE files ADD COLUMN {column} TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            stored_size INTEGER NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    # The application inserts the blobs row with the file; triggers keep refs
+    ref, unref = (
+        f"UPDATE blobs SET refs = refs {sign} 1 WHERE digest = {row}.text_blob;"
+        for sign, row in (("+", "NEW"), ("-", "OLD"))
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS blobs_ref AFTER INSERT ON files WHEN NEW.text_blob IS NOT NULL BEGIN {ref} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS blobs_unref AFTER DELETE ON files WHEN OLD.text_blob IS NOT NULL BEGIN {unref} END")
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS blobs_reref AFTER UPDATE OF text_blob ON files
+        WHEN OLD.text_blob IS NOT NEW.text_blob
+        BEGIN {unref} {ref} END
+    ''')
+
+
+def _search_index(conn: sqlite3.Connection):
+    """Full-text index over processed files (filled by search.py; `python search.py rebuild`)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY,
+            file_id TEXT NOT NULL UNIQUE,
+            name TEXT,
+            text TEXT,
+            facts TEXT,
+            summaries TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5 (
+            name, text, facts, summaries,
+            content = 'search_docs', content_rowid = 'id',
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '3'
+        )
+    ''')
+    columns = "name, text, facts, summaries"
+    insert = f"INSERT INTO search_index (rowid, {columns}) VALUES (NEW.id, NEW.name, NEW.text, NEW.facts, NEW.summaries);"
+    delete = (f"INSERT INTO search_index (search_index, rowid, {columns}) "
+              f"VALUES ('delete', OLD.id, OLD.name, OLD.text, OLD.facts, OLD.summaries);")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS search_docs_insert AFTER INSERT ON search_docs BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS search_docs_delete AFTER DELETE ON search_docs BEGIN {delete} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS search_docs_update AFTER UPDATE ON search_docs BEGIN {delete} {insert} END")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS search_docs_file_deleted AFTER DELETE ON files
+        BEGIN
+            DELETE FROM search_docs WHERE file_id = OLD.id;
+        END
+    ''')
+
+
+def _near_duplicates(conn: sqlite3.Connection):
+    """MinHash signatures and LSH buckets (neardup.py); results reused from a near-duplicate"""
+    if "minhash" not in _columns(conn, "files"):
+        conn.execute("ALTER TABLE files ADD COLUMN minhash BLOB")
+    if "near_duplicate" not in _columns(conn, "results"):
+        conn.execute("ALTER TABLE results ADD COLUMN near_duplicate TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (band, bucket, file_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets_file ON lsh_buckets (file_id)")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS lsh_buckets_file_deleted AFTER DELETE ON files
+        BEGIN
+            DELETE FROM lsh_buckets WHERE file_id = OLD.id;
+        END
+    ''')
+
+
+def _stage_fingerprints(conn: sqlite3.Connection):
+    """Per-stage input fingerprints, so reprocessing reruns only stages whose inputs changed"""
+    if "fingerprints" not in _columns(conn, "results"):
+        conn.execute("ALTER TABLE results ADD COLUMN fingerprints TEXT")
+
+
+def _search_text_by_digest(conn: sqlite3.Connection):
+    """
+    Store each distinct document text once, in search_text keyed by its
+    sha256 (the text's blob digest), instead of a copy per file in
+    search_docs; the index reads its content through the search_content view
+    """
+    for trigger in ("search_docs_insert", "search_docs_delete", "search_docs_update", "search_docs_file_deleted"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS search_index")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_text (
+            digest TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        )
+    ''')
+    if "text" in _columns(conn, "search_docs"):
+        conn.create_function("sha256", 1, lambda text: hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                             deterministic=True)
+        conn.execute('''
+            CREATE TABLE search_docs_new (
+                id INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL UNIQUE,
+                name TEXT,
+                text_digest TEXT,
+                facts TEXT,
+                summaries TEXT
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO search_text (digest, text)
+            SELECT sha256(text), text FROM search_docs WHERE text IS NOT NULL
+            ON CONFLICT DO NOTHING
+        ''')
+        conn.execute('''
+            INSERT INTO search_docs_new (id, file_id, name, text_digest, facts, summaries)
+            SELECT id, file_id, name, CASE WHEN text IS NOT NULL THEN sha256(text) END, facts, summaries
+            FROM search_docs
+        ''')
+        conn.execute("DROP TABLE search_docs")
+        conn.execute("ALTER TABLE search_docs_new RENAME TO search_docs")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_docs_digest ON search_docs (text_digest)")
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS search_content AS
+        SELECT d.id, d.name, t.text, d.facts, d.summaries
+        FROM search_docs d LEFT JOIN search_text t ON t.digest = d.text_digest
+    ''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE search_index USING fts5 (
+            name, text, facts, summaries,
+            content = 'search_content', content_rowid = 'id',
+            tokenize = 'porter unicode61 remove_diacritics 2',
+            prefix = '3'
+        )
+    ''')
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('rebuild')")
+
+    # search.index_document stores the text before the row pointing at it;
+    # the last row pointing at a text removes it
+    columns = "name, text, facts, summaries"
+    text = "(SELECT text FROM search_text WHERE digest = {}.text_digest)"
+    insert = (f"INSERT INTO search_index (rowid, {columns}) "
+              f"VALUES (NEW.id, NEW.name, {text.format('NEW')}, NEW.facts, NEW.summaries);")
+    delete = (f"INSERT INTO search_index (search_index, rowid, {columns}) "
+              f"VALUES ('delete', OLD.id, OLD.name, {text.format('OLD')}, OLD.facts, OLD.summaries);")
+    release = ("DELETE FROM search_text WHERE digest = OLD.text_digest "
+               "AND NOT EXISTS (SELECT 1 FROM search_docs WHERE text_digest = OLD.text_digest);")
+    conn.execute(f"CREATE TRIGGER search_docs_insert AFTER INSERT ON search_docs BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER search_docs_delete AFTER DELETE ON search_docs BEGIN {delete} {release} END")
+    conn.execute(f"CREATE TRIGGER search_docs_update AFTER UPDATE ON search_docs BEGIN {delete} {insert} {release} END")
+    conn.execute('''
+        CREATE TRIGGER search_docs_file_deleted AFTER DELETE ON files
+        BEGIN
+            DELETE FROM search_docs WHERE file_id = OLD.id;
+        END
+    ''')
+
+
+def _jobs(conn: sqlite3.Connection):
+    """The persistent job queue (jobs.py); databases that predate this already have the table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            status TEXT DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            full INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if "full" not in _columns(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN full INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs (file_id)")
+
+
+# (version, description, step); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "files and results tables", _create_tables),
+    (2, "files.owner for per-user notifications", _add_owner),
+    (3, "indexes on files(status) and files(uploaded_at, id)", _index_files),
+    (4, "files.updated_at, tombstones and list filter indexes", _track_changes),
+    (5, "file_stats counters kept by triggers", _file_stats),
+    (6, "results.classification (label confidence)", _classification),
+    (7, "compressed text store: files.text_blob/pages and blob refcounts", _blob_store),
+    (8, "FTS5 search index over text, key facts and summaries", _search_index),
+    (9, "MinHash signatures, LSH buckets and results.near_duplicate", _near_duplicates),
+    (10, "results.fingerprints: what each stage's output was computed from", _stage_fingerprints),
+    (11, "search text stored once per distinct text, not per file", _search_text_by_digest),
+    (12, "jobs table for the persistent job queue", _jobs),
+]
+
+
+class Database:
+    def __init__(self, path: str, threads: int = DB_THREADS):
+        self.path = path
+        self.threads = max(1, threads)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db")
+
+    def connect(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # only ever used by this thread; check_same_thread=False lets close() run elsewhere.
+            # Autocommit outside transaction(), so a stray write never holds the lock.
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Commit on success, roll back on error. `immediate` takes the write lock up front."""
+        conn = self.connect()
+        if conn.in_transaction:
+            # joined an enclosing transaction on this thread
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def fetchone(self, sql: str, params: Sequence = ()) -> Optional[sqlite3.Row]:
+        return self.connect().execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params: Sequence = ()) -> List[sqlite3.Row]:
+        return self.connect().execute(sql, params).fetchall()
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking function on the database thread pool"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._timed, fn, time.perf_counter(), args, kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    @staticmethod
+    def _timed(fn: Callable[..., Any], queued: float, args, kwargs) -> Any:
+        start = time.perf_counter()
+        metrics.DB_WAIT_SECONDS.observe(start - queued)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.DB_SECONDS.observe(time.perf_counter() - start, getattr(fn, "__qualname__", "call"))
+
+    def schema_version(self) -> int:
+        return self.connect().execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self) -> int:
+        """Apply pending migrations; returns the resulting schema version"""
+        version = self.schema_version()
+        for number, _, step in MIGRATIONS:
+            if number <= version:
+                continue
+            with self.transaction(immediate=True) as conn:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            version = number
+        return version
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        self._executor.shutdown(wait=True)
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+NDJSON export of stored results, for downstream analytics.
+
+One line per file that has results, oldest upload first, optionally
+filtered by status and an upload date range. Rows are read from a cursor on
+a dedicated read-only connection in fixed-size batches, so memory stays
+constant however large the export, and the JSON stored in the results table
+is spliced into each line as-is instead of being parsed and re-encoded.
+
+The same generator backs GET /export and this command line:
+
+    python export.py --status processed --start 2024-01-01 --end 2024-07-01 --gzip -o results.ndjson.gz
+"""
+import argparse, json, sqlite3, sys, zlib
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+
+EXPORT_BATCH = 500              # rows per fetchmany
+CHUNK_BYTES = 64 * 1024         # bytes per yielded chunk
+
+COLUMNS = '''
+    f.id, f.original_name, f.status, f.content_type, f.file_size, f.uploaded_at, f.processed_at,
+    r.lawyer_summary, r.citizen_summary, r.next_steps, r.key_facts, r.classification, r.near_duplicate
+'''
+
+
+def parse_time(value: Optional[str], name: str) -> Optional[str]:
+    """
+    ISO date or datetime -> the 'YYYY-MM-DD HH:MM:SS' form of CURRENT_TIMESTAMP,
+    which is UTC: a time with an offset (or Z) is converted, one without is
+    taken as UTC already
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith(("Z", "z")) else value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+        return parsed.strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r} (expected an ISO date or datetime)")
+
+
+def export_query(status: Optional[str] = None, start: Optional[str] = None,
+                 end: Optional[str] = None) -> Tuple[str, list]:
+    """Files with results, in (uploaded_at, id) order so the index is read without a sort"""
+    where, params = [], []
+    if status:
+        where.append("f.status = ?")
+        params.append(status)
+    start, end = parse_time(start, "start"), parse_time(end, "end")
+    if start:
+        where.append("f.uploaded_at >= ?")
+        params.append(start)
+    if end:
+        where.append("f.uploaded_at < ?")
+        params.append(end)
+    return f'''
+        SELECT {COLUMNS}
+        FROM files f JOIN results r ON r.file_id = f.id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY f.uploaded_at, f.id
+    ''', params
+
+
+def open_cursor(db_file: str, status: Optional[str] = None, start: Optional[str] = None,
+                end: Optional[str] = None) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+    """
+    A cursor over the export on its own read-only connection. The caller
+    closes the connection; it may be read from any one thread at a time.
+    """
+    sql, params = export_query(status, start, end)
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+    try:
+        return conn, conn.execute(sql, params)
+    except Exception:
+        conn.close()
+        raise
+
+
+def ndjson_line(row) -> str:
+    """One export line; the stored result columns are already JSON and are not re-encoded"""
+    meta = json.dumps({
+        "file_id": row[0],
+        "name": row[1],
+        "status": row[2],
+        "content_type": row[3],
+        "size": row[4],
+        "uploaded_at": row[5],
+        "processed_at": row[6],
+    })
+    return (
+        f'{meta[:-1]}, "lawyer": {row[7] or "{}"}, "citizen": {row[8] or "{}"}, '
+        f'"next": {row[9] or "{}"}, "facts": {row[10] or "{}"}, '
+        f'"classification": {row[11] or "null"}, "near_duplicate": {row[12] or "null"}}}\n'
+    )
+
+
+def iter_ndjson(cursor: sqlite3.Cursor, gzip: bool = False, batch: int = EXPORT_BATCH,
+                chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Encoded (and optionally gzipped) export, in chunks of about `chunk_bytes`"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None   # wbits 31: gzip container
+    buffer, size = [], 0
+    while True:
+        rows = cursor.fetchmany(batch)
+        for row in rows:
+            line = ndjson_line(row).encode("utf-8")
+            buffer.append(line)
+            size += len(line)
+        if size >= chunk_bytes or (not rows and buffer):
+            data = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if not rows:
+            break
+    if compressor:
+        yield compressor.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="legal_lens.db")
+    parser.add_argument("--status", help="only files with this status")
+    parser.add_argument("--start", help="uploaded at or after this ISO date/datetime")
+    parser.add_argument("--end", help="uploaded before this ISO date/datetime")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        conn, cursor = open_cursor(args.db, args.status, args.start, args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_ndjson(cursor, gzip=args.gzip):
+            out.write(chunk)
+    finally:
+        conn.close()
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Shared spaCy analysis for the extraction and next-steps stages.
+
+Each document is parsed once, with only the components those stages read
+(sentence boundaries and named entities), and the parse is kept in a small
+LRU keyed by the text hash so every consumer of the same document reuses it.
+Stages run concurrently, so a consumer that arrives while the parse is still
+in progress waits for it instead of parsing the text a second time.
+"""
+import hashlib, threading
+from importlib import metadata
+from collections import OrderedDict
+from typing import List, Tuple
+
+import spacy
+
+from cache import fingerprint
+
+MODEL = "en_core_web_sm"
+# Components the downstream stages never read; excluding them skips the
+# dependency parse, tagging and lemmatisation altogether. Sentence boundaries
+# come from the lightweight "senter" component instead of the parser.
+EXCLUDE = ["parser", "tagger", "attribute_ruler", "lemmatizer"]
+CACHE_SIZE = 8
+
+nlp = None
+_cache: "OrderedDict[str, _Entry]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Analysis:
+    """Everything downstream stages need from one spaCy parse."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        sents = list(doc.sents)
+        self.sentences: List[str] = [sent.text for sent in sents]
+        self.sentence_spans: List[Tuple[int, int]] = [(sent.start_char, sent.end_char) for sent in sents]
+        self.sentences_lower: List[str] = [s.lower() for s in self.sentences]
+        self.entities: List[Tuple[str, str]] = [(ent.text, ent.label_) for ent in doc.ents]
+
+    @property
+    def tokens(self) -> List[str]:
+        return [token.text for token in self.doc]
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.analysis = None
+
+
+def load():
+    global nlp
+    if nlp is None:
+        model = spacy.load(MODEL, exclude=EXCLUDE)
+        if "senter" in model.pipe_names or "senter" in model.disabled:
+            model.enable_pipe("senter")
+        else:
+            model.add_pipe("sentencizer")
+        nlp = model
+    return nlp
+
+
+def version() -> str:
+    """This module, the model name and the installed model package's version"""
+    try:
+        model_version = metadata.version(MODEL)
+    except metadata.PackageNotFoundError:
+        model_version = "unknown"
+    return fingerprint([__file__], [MODEL, model_version, spacy.__version__])
+
+
+def analyse(text: str) -> Analysis:
+    """Parse `text` once and return the shared analysis"""
+    load()
+    key = hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            entry = _cache[key] = _Entry()
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+
+    with entry.lock:
+        if entry.analysis is None:
+            if len(text) >= nlp.max_length:
+                nlp.max_length = len(text) + 1
+            entry.analysis = Analysis(nlp(text))
+    return entry.analysis
@@ -0,0 +1,128 @@
+"""
+Benchmark: precompiled ExtractionEngine vs the per-field extraction loop.
+
+Builds synthetic judgments of increasing size, splits them into sentences once
+(a blank spaCy pipeline with the rule-based sentencizer, so no model download
+is needed and parsing is kept out of the timings), then times only the field
+matching of both implementations and checks that they agree.
+
+    python -m extraction.bench_extract --sizes 100000 1000000 5000000 --extra-fields 20
+"""
+import argparse, os, random, re, time
+import spacy, yaml
+from extraction.analysis import Analysis
+from extraction.matcher import ExtractionEngine
+
+FIELDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fields.yaml")
+
+SENTENCES = [
+    "The appellant: Ramesh Kumar filed the present appeal before the High Court of Delhi.",
+    "Reliance was placed on 2019 12 Delhi and on 2004 3 Bombay by the learned counsel.",
+    "The respondent: State Bank of India denied every allegation made in the petition.",
+    "The tribunal directed the parties to appear again on 12/03/2021.",
+    "It is well settled that a cheque dishonoured for insufficiency of funds attracts section 138.",
+    "The Supreme Court has repeatedly held that delay alone is no ground to refuse relief.",
+    "Counsel for the petitioner: Anita Sharma argued that the notice was never served.",
+    "The matter was adjourned and the interim order shall continue till the next date.",
+]
+
+FILLER = (
+    "the of and to in that it was for on as with by be this which at from or an are not "
+    "have has had were been their there would could should may shall upon said such any "
+    "matter record evidence witness document property amount payment agreement transaction "
+    "period hearing order date copy statement submission reply rejoinder material issue"
+).split()
+
+EXTRA_KEYWORDS = [
+    "notice", "cheque", "interim order", "adjourned", "counsel", "relief", "delay",
+    "petition", "allegation", "section 138", "appeal", "insufficiency", "served",
+    "learned", "settled", "directed", "appear", "arbitration", "injunction", "decree",
+]
+
+
+def legacy_extract(text: str, fields, sentences):
+    """The per-field loop the engine replaces, over an already split document"""
+    data = {}
+    for field in fields:
+        if "pattern" in field:
+            try:
+                data[field["name"]] = re.findall(field["pattern"], text)
+            except re.error:
+                data[field["name"]] = []
+        if "keywords" in field:
+            data[field["name"]] = [s for s in sentences if any(k in s.lower() for k in field["keywords"])]
+    return data
+
+
+def filler_sentence(rng: random.Random) -> str:
+    words = [rng.choice(FILLER) for _ in range(rng.randint(8, 25))]
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_document(size: int, hit_rate: float = 0.05, seed: int = 0) -> str:
+    """Filler prose with a `hit_rate` share of sentences carrying citations, parties and keywords"""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        paragraph = " ".join(
+            rng.choice(SENTENCES) if rng.random() < hit_rate else filler_sentence(rng)
+            for _ in range(rng.randint(3, 8))
+        )
+        parts.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(parts)[:size]
+
+
+def synthetic_fields(extra: int, seed: int = 0):
+    fields = yaml.safe_load(open(FIELDS_PATH, encoding="utf-8"))["fields"]
+    rng = random.Random(seed)
+    for i in range(extra):
+        fields.append({"name": f"topic_{i}", "keywords": rng.sample(EXTRA_KEYWORDS, 8)})
+    return fields
+
+
+def best_of(repeat: int, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000],
+                        help="document sizes in characters")
+    parser.add_argument("--extra-fields", type=int, default=10,
+                        help="synthetic keyword fields added to fields.yaml")
+    parser.add_argument("--hit-rate", type=float, default=0.05,
+                        help="share of sentences that contain extractable facts")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fields = synthetic_fields(args.extra_fields)
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    build_start = time.perf_counter()
+    engine = ExtractionEngine(fields)
+    build = time.perf_counter() - build_start
+
+    print(f"{len(fields)} fields, engine compiled in {build * 1000:.2f} ms")
+    print(f"{'chars':>10} {'sentences':>10} {'legacy s':>10} {'engine s':>10} {'speedup':>8}")
+    for size in args.sizes:
+        text = synthetic_document(size, args.hit_rate)
+        nlp.max_length = max(nlp.max_length, len(text) + 1)
+        parsed = Analysis(nlp(text))
+
+        legacy_time, legacy = best_of(args.repeat, lambda: legacy_extract(text, fields, parsed.sentences))
+        engine_time, found = best_of(args.repeat, lambda: engine.match(text, lambda _: parsed))
+        values = {name: [m.value for m in matches] for name, matches in found.items()}
+        assert values == legacy, "engine output differs from the legacy extraction"
+
+        print(f"{size:>10} {len(parsed.sentences):>10} {legacy_time:>10.3f} {engine_time:>10.3f} "
+              f"{legacy_time / engine_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
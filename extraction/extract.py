@@ -1,20 +1,29 @@
-import spacy, yaml, re, json, sys
+import yaml, json, sys, os
+from cache import fingerprint
+from extraction import analysis, matcher
+from extraction.matcher import ExtractionEngine
 
-nlp = spacy.load("en_core_web_sm")
-fields = yaml.safe_load(open("/workspace/extraction/fields.yaml", encoding="utf-8"))["fields"]
+FIELDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fields.yaml")
+engine = None
 
-def extract(text: str):
-    data = {}
-    for field in fields:
-        if "pattern" in field:
-            try:
-                data[field["name"]] = re.findall(field["pattern"], text)
-            except re.error:
-                data[field["name"]] = []
-        if "keywords" in field:
-            sentences = [sent.text for sent in nlp(text).sents]
-            data[field["name"]] = [s for s in sentences if any(k in s.lower() for k in field["keywords"]) ]
-    return data
+def load():
+    global engine
+    analysis.load()
+    if engine is None:
+        fields = yaml.safe_load(open(FIELDS_PATH, encoding="utf-8"))["fields"]
+        engine = ExtractionEngine(fields)
+
+def version():
+    return fingerprint([FIELDS_PATH, matcher.__file__], [analysis.version()])
+
+def extract(text: str, offsets: bool = False):
+    """Matches per field; with offsets=True each match is {value, start, end}"""
+    load()
+    found = engine.match(text, analysis.analyse)
+    if offsets:
+        return {name: [{"value": m.value, "start": m.start, "end": m.end} for m in matches]
+                for name, matches in found.items()}
+    return {name: [m.value for m in matches] for name, matches in found.items()}
 
 if __name__ == "__main__":
-    print(json.dumps(extract(sys.stdin.read()), ensure_ascii=False))
+    print(json.dumps(extract(sys.stdin.read(), offsets="--offsets" in sys.argv), ensure_ascii=False))
@@ -0,0 +1,114 @@
+"""
+Precompiled matching engine for the fields in fields.yaml.
+
+Regex fields are compiled once when the schema is loaded. For keyword fields
+the document is lowercased once and every distinct keyword is located with
+str.find; each hit is mapped to its sentence by offset and the search resumes
+at the end of that sentence. That replaces lowercasing and testing every
+sentence against every keyword of every field. (One big case-insensitive
+alternation was measured to be slower than this under CPython's re.) Every
+match carries its character offsets into the document.
+"""
+import re
+from bisect import bisect_right
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+
+class FieldMatch(NamedTuple):
+    field: str
+    value: object   # what re.findall would return, or the matching sentence
+    start: int
+    end: int
+
+
+class ExtractionEngine:
+    def __init__(self, fields: List[Dict]):
+        self.names: List[str] = []
+        self.patterns: Dict[str, Optional[re.Pattern]] = {}
+        self.keyword_fields: List[str] = []
+        # lowercased keyword -> fields listing it
+        self.keyword_owners: Dict[str, Set[str]] = {}
+        # used instead of str.find when lowercasing changes the text length
+        self.keyword_patterns: Dict[str, re.Pattern] = {}
+
+        for field in fields:
+            name = field["name"]
+            if name not in self.names:
+                self.names.append(name)
+            if "keywords" in field:
+                # keywords take precedence over a pattern on the same field
+                self.keyword_fields.append(name)
+                self.patterns.pop(name, None)
+                for k in field["keywords"]:
+                    if k:
+                        self.keyword_owners.setdefault(k.lower(), set()).add(name)
+            elif "pattern" in field:
+                try:
+                    self.patterns[name] = re.compile(field["pattern"])
+                except re.error:
+                    self.patterns[name] = None
+
+        for k in self.keyword_owners:
+            self.keyword_patterns[k] = re.compile(re.escape(k), re.IGNORECASE)
+
+    @staticmethod
+    def _value(m: re.Match):
+        groups = m.groups()
+        if len(groups) > 1:
+            return groups
+        return groups[0] if groups else m.group(0)
+
+    def match_patterns(self, text: str) -> Dict[str, List[FieldMatch]]:
+        out = {}
+        for name, pattern in self.patterns.items():
+            if pattern is None:
+                out[name] = []
+                continue
+            out[name] = [FieldMatch(name, self._value(m), m.start(), m.end())
+                         for m in pattern.finditer(text)]
+        return out
+
+    def match_keywords(self, text: str, analysis) -> Dict[str, List[FieldMatch]]:
+        """Sentences of `analysis` containing any keyword, per keyword field"""
+        spans = analysis.sentence_spans
+        starts = [start for start, _ in spans]
+        hits: Dict[str, Set[int]] = {name: set() for name in self.keyword_fields}
+
+        lowered = text.lower()
+        exact = len(lowered) == len(text)
+        for keyword, owners in self.keyword_owners.items():
+            pattern = self.keyword_patterns[keyword]
+            pos = 0
+            while True:
+                if exact:
+                    begin = lowered.find(keyword, pos)
+                    if begin == -1:
+                        break
+                    end = begin + len(keyword)
+                else:
+                    m = pattern.search(text, pos)
+                    if m is None:
+                        break
+                    begin, end = m.span()
+
+                i = bisect_right(starts, begin) - 1
+                if i >= 0 and end <= spans[i][1]:
+                    for name in owners:
+                        hits[name].add(i)
+                    # one hit per sentence is enough
+                    pos = max(spans[i][1], begin + 1)
+                else:
+                    pos = begin + 1
+
+        return {name: [FieldMatch(name, analysis.sentences[i], *spans[i]) for i in sorted(found)]
+                for name, found in hits.items()}
+
+    def match(self, text: str, analyse: Callable[[str], object]) -> Dict[str, List[FieldMatch]]:
+        """
+        Run every field over `text`. `analyse` returns the shared spaCy analysis
+        and is only called when the schema has keyword fields.
+        """
+        found = self.match_patterns(text)
+        if self.keyword_fields:
+            found.update(self.match_keywords(text, analyse(text)))
+        return {name: found[name] for name in self.names if name in found}
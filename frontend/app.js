@@ -1,7 +1,26 @@
 const API = window.location.origin;
 let currentFileId = null;
+let currentTab = 'lawyer';
 let processingFiles = new Set();
 let websocket = null;
+const clientId = getClientId();
+
+// Stable anonymous id: uploads are tagged with it and this browser subscribes
+// to its events, so it only hears about its own documents
+function getClientId() {
+    let id = localStorage.getItem('legalLensClientId');
+    if (!id) {
+        id = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Date.now()) + Math.random().toString(16).slice(2);
+        localStorage.setItem('legalLensClientId', id);
+    }
+    return id;
+}
+
+function subscribe(topics) {
+    if (websocket && websocket.readyState === WebSocket.OPEN) {
+        websocket.send(JSON.stringify({ action: 'subscribe', topics: topics }));
+    }
+}
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -17,7 +36,8 @@ function setupEventListeners() {
 
 function connectWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws`;
+    const topics = [`user:${clientId}`].concat(currentFileId ? [`file:${currentFileId}`] : []);
+    const wsUrl = `${protocol}//${window.location.host}/ws?user=${encodeURIComponent(clientId)}&topics=${encodeURIComponent(topics.join(','))}`;
     
     websocket = new WebSocket(wsUrl);
     
@@ -57,6 +77,18 @@ function handleWebSocketMessage(data) {
                 }
             }, 2000);
         }
+    } else if (data.type === 'partial') {
+        // Summary still being generated: show what has arrived so far
+        if (data.file_id !== currentFileId) {
+            return;
+        }
+        if (!window.data || !window.data.partial) {
+            window.data = { partial: true, lawyer: {}, citizen: {}, next: {}, facts: {} };
+        }
+        window.data[data.stage] = data.data;
+        if (currentTab === data.stage) {
+            loadTab(currentTab);
+        }
     }
 }
 
@@ -136,6 +168,7 @@ async function upload() {
     
     try {
   const fd = new FormData();
+        fd.append('user', clientId);
         for (const f of files) {
             fd.append('files', f);
             processingFiles.add(f.name);
@@ -220,13 +253,20 @@ function switchTab(t, ev) {
 async function loadSummary(fid) {
     try {
         currentFileId = fid;
+        // Files from before this browser's id need their own topic; the server
+        // refuses files another browser uploaded
+        subscribe([`file:${fid}`]);
   const res = await fetch(API + "/summaries/" + fid, { method: 'POST' });
         
         if (!res.ok) {
             throw new Error(`Analysis failed: ${res.statusText}`);
         }
         
-  const data = await res.json();
+  let data = await res.json();
+        if (res.status === 202) {
+            // Queued: wait for the background job, then fetch its results
+            data = await waitForJob(data);
+        }
   window.data = data;
   switchTab('lawyer');
         
@@ -239,8 +279,30 @@ async function loadSummary(fid) {
     }
 }
 
+async function waitForJob(job, intervalMs = 1000) {
+    while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const res = await fetch(API + job.status_url);
+        if (!res.ok) {
+            throw new Error(`Job status failed: ${res.statusText}`);
+        }
+        job = await res.json();
+    }
+    
+    if (job.status !== 'done') {
+        throw new Error(job.error || 'Processing failed');
+    }
+    
+    const res = await fetch(API + job.results_url);
+    if (!res.ok) {
+        throw new Error(`Loading results failed: ${res.statusText}`);
+    }
+    return await res.json();
+}
+
 function loadTab(t) {
   const box = document.getElementById('content');
+    currentTab = t;
     if (!window.data) {
         box.innerHTML = `
             <div class="has-text-centered has-text-grey">
@@ -465,44 +527,119 @@ async function loadFile(fileId) {
     }
 }
 
+// File manager: the pages loaded so far, keyed by id, and where to continue from
+const fileManager = { files: new Map(), nextCursor: null, syncToken: null, status: '', name: '' };
+
+function filesUrl(params) {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value) {
+            query.set(key, value);
+        }
+    });
+    return `${API}/files?${query}`;
+}
+
+async function fetchFiles(params) {
+    const response = await fetch(filesUrl(params));
+    if (!response.ok) {
+        throw new Error(response.statusText);
+    }
+    return await response.json();
+}
+
+async function loadFilePage(reset) {
+    const page = await fetchFiles({
+        limit: 50,
+        status: fileManager.status,
+        name: fileManager.name,
+        cursor: reset ? null : fileManager.nextCursor
+    });
+    if (reset) {
+        fileManager.files.clear();
+        fileManager.syncToken = page.sync_token;
+    }
+    page.files.forEach(file => fileManager.files.set(file.id, file));
+    fileManager.nextCursor = page.next_cursor;
+}
+
+async function refreshFiles() {
+    // Filtered views are reloaded; the full list only fetches what changed
+    if (!fileManager.syncToken || fileManager.status || fileManager.name) {
+        return loadFilePage(true);
+    }
+    let cursor = null;
+    do {
+        const page = await fetchFiles({ since: fileManager.syncToken, cursor: cursor, limit: 200 });
+        page.files.forEach(file => fileManager.files.set(file.id, file));
+        (page.deleted || []).forEach(id => fileManager.files.delete(id));
+        cursor = page.next_cursor;
+        if (!cursor) {
+            fileManager.syncToken = page.sync_token;
+        }
+    } while (cursor);
+}
+
+function renderFileManager() {
+    const content = document.getElementById('file-manager-content');
+    const files = Array.from(fileManager.files.values()).sort((a, b) =>
+        a.uploaded_at === b.uploaded_at ? b.id.localeCompare(a.id) : b.uploaded_at.localeCompare(a.uploaded_at));
+    
+    document.getElementById('file-load-more').style.display = fileManager.nextCursor ? '' : 'none';
+    if (files.length === 0) {
+        content.innerHTML = '<p>No files found</p>';
+        return;
+    }
+    content.innerHTML = files.map(file => `
+        <div class="file-item">
+            <div>
+                <i class="fas fa-file-alt mr-2"></i>
+                <span>${file.name}</span>
+                <br>
+                <small class="has-text-grey">${new Date(file.uploaded_at).toLocaleDateString()} &middot; ${file.status}</small>
+            </div>
+            <div class="buttons">
+                <button class="button is-small is-primary is-outlined" onclick="loadFile('${file.id}')">
+                    <i class="fas fa-eye"></i>
+                </button>
+                <button class="button is-small is-danger is-outlined" onclick="deleteFile('${file.id}')">
+                    <i class="fas fa-trash"></i>
+                </button>
+            </div>
+        </div>
+    `).join('');
+}
+
+function showFileError(error) {
+    const content = document.getElementById('file-manager-content');
+    content.innerHTML = `<p class="has-text-danger">Error loading files: ${error.message}</p>`;
+}
+
 function showFileManager() {
     const modal = document.getElementById('file-manager-modal');
-    const content = document.getElementById('file-manager-content');
     
     // Load files from backend
-    fetch(API + '/files')
-        .then(response => response.json())
-        .then(files => {
-            if (files.length === 0) {
-                content.innerHTML = '<p>No files found</p>';
-            } else {
-                content.innerHTML = files.map(file => `
-                    <div class="file-item">
-                        <div>
-                            <i class="fas fa-file-alt mr-2"></i>
-                            <span>${file.name}</span>
-                            <br>
-                            <small class="has-text-grey">${new Date(file.uploaded_at).toLocaleDateString()}</small>
-                        </div>
-                        <div class="buttons">
-                            <button class="button is-small is-primary is-outlined" onclick="loadFile('${file.id}')">
-                                <i class="fas fa-eye"></i>
-                            </button>
-                            <button class="button is-small is-danger is-outlined" onclick="deleteFile('${file.id}')">
-                                <i class="fas fa-trash"></i>
-                            </button>
-                        </div>
-                    </div>
-                `).join('');
-            }
-        })
-        .catch(error => {
-            content.innerHTML = `<p class="has-text-danger">Error loading files: ${error.message}</p>`;
-        });
+    refreshFiles()
+        .then(renderFileManager)
+        .catch(showFileError);
     
     modal.classList.add('is-active');
 }
 
+function filterFiles() {
+    fileManager.status = document.getElementById('file-filter-status').value;
+    fileManager.name = document.getElementById('file-filter-name').value.trim();
+    loadFilePage(true)
+        .then(renderFileManager)
+        .catch(showFileError);
+}
+
+function loadMoreFiles() {
+    loadFilePage(false)
+        .then(renderFileManager)
+        .catch(showFileError);
+}
+
 function hideFileManager() {
     const modal = document.getElementById('file-manager-modal');
     modal.classList.remove('is-active');
@@ -517,7 +654,8 @@ async function deleteFile(fileId) {
         const response = await fetch(API + `/files/${fileId}`, { method: 'DELETE' });
         if (response.ok) {
             showMessage('File deleted successfully', 'success');
-            showFileManager(); // Refresh the list
+            fileManager.files.delete(fileId);
+            renderFileManager();
         } else {
             throw new Error('Delete failed');
         }
@@ -557,6 +695,8 @@ window.switchTab = switchTab;
 window.removeFile = removeFile;
 window.showFileManager = showFileManager;
 window.hideFileManager = hideFileManager;
+window.filterFiles = filterFiles;
+window.loadMoreFiles = loadMoreFiles;
 window.deleteFile = deleteFile;
 window.exportResults = exportResults;
 window.loadFile = loadFile;
@@ -1,14 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, subprocess, json, io, uuid, time, sqlite3
-from PyPDF2 import PdfReader
-import docx2txt
+import os, re, json, uuid, time, base64, threading
 from datetime import datetime
 from typing import List, Dict, Optional
 import asyncio
 from pathlib import Path
+from stages import registry, executor, PipelineOutcome, LABELS as STAGE_LABELS
+from db import Database
+from stats import PipelineStats, file_counters
+from jobs import JobQueue
+from pubsub import ConnectionManager, authorize
+from summarisers.together_client import client as llm_client
+from classifier.clf_infer import Classification, batcher as clf_batcher
+from summarisers.streaming import partial_sink
+from cache import ResultCache
+from ingest.reader import CHUNK_SIZE, SUPPORTED_TYPES, ingest_upload, pages_path
+from ingest.blobstore import BlobStore
+import export
+import metrics
+import search
+import neardup
 
 app = FastAPI()
 
@@ -31,575 +44,871 @@ app.add_middleware(
 UPLOAD_DIR = "file_queue"
 RESULTS_DIR = "results"
 DB_FILE = "legal_lens.db"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(30 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_ALLOW_ALL = os.getenv("WS_ALLOW_ALL", "0").lower() in ("1", "true", "yes")
+FILES_PAGE_SIZE = 50
+FILES_MAX_PAGE_SIZE = 500
+NOT_LEGAL = "Document is not legal in nature"
 
 # Create directories
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
-# Initialize database
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id TEXT PRIMARY KEY,
-            filename TEXT NOT NULL,
-            original_name TEXT NOT NULL,
-            file_size INTEGER,
-            content_type TEXT,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            processed_at TIMESTAMP,
-            status TEXT DEFAULT 'uploaded'
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS results (
-            file_id TEXT PRIMARY KEY,
-            lawyer_summary TEXT,
-            citizen_summary TEXT,
-            next_steps TEXT,
-            key_facts TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (file_id) REFERENCES files (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# Initialize database on startup
-init_db()
+# Open the metadata store and bring its schema up to date
+db = Database(DB_FILE)
+db.migrate()
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# Extracted text, compressed and stored once per distinct content
+store = BlobStore()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Load every pipeline stage once per worker, off the event loop so /health
+# can answer (not ready) while the models are still warming up
+@app.on_event("startup")
+def warm_up_stages():
+    threading.Thread(target=warm_up, name="stage-warmup", daemon=True).start()
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+def warm_up():
+    """Load every stage, then key cached results on the stage versions; safe to call twice"""
+    registry.warm_up()
+    result_cache.version = registry.version()
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+# WebSocket connection manager
+manager = ConnectionManager(max_pending=WS_QUEUE_SIZE)
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                # Remove disconnected connections
-                self.active_connections.remove(connection)
-
-manager = ConnectionManager()
-
-def extract_text(file: UploadFile) -> str:
-    if file.content_type == "application/pdf":
-        reader = PdfReader(io.BytesIO(file.file.read()))
-        return "\n".join((page.extract_text() or "") for page in reader.pages)
-    elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return docx2txt.process(io.BytesIO(file.file.read()))
-    else:
-        return file.file.read().decode(errors="ignore")
+SPOOL_DIR = os.path.join(UPLOAD_DIR, ".spool")
+os.makedirs(SPOOL_DIR, exist_ok=True)
 
 @app.post("/upload")
-async def upload(files: list[UploadFile] = File(...)):
+async def upload(files: list[UploadFile] = File(...), user: Optional[str] = Form(None)):
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
     ids: list[str] = []
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    rows: list[tuple] = []
+    texts: dict = {}
+    written: list[str] = []
     
     try:
         for f in files:
             # Validate file type
-            if f.content_type not in ["application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text/plain"]:
+            if f.content_type not in SUPPORTED_TYPES:
                 raise HTTPException(status_code=400, detail=f"Unsupported file type: {f.content_type}")
             
-            # Extract text
-            txt = extract_text(f)
-            if not txt.strip():
-                raise HTTPException(status_code=400, detail=f"Could not extract text from {f.filename}")
-            
             # Generate unique ID
             fid = str(uuid.uuid4())
+            txt_path = f"{SPOOL_DIR}/{fid}.txt"
             
-            # Save text file
-            with open(f"{UPLOAD_DIR}/{fid}.txt", "w", encoding="utf-8") as out:
-                out.write(txt)
-            
-            # Store file info in database
-            cursor.execute('''
-                INSERT INTO files (id, filename, original_name, file_size, content_type, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (fid, f"{fid}.txt", f.filename, f.size, f.content_type, 'uploaded'))
+            # Spool to disk and extract text page by page, off the event loop
+            size, extracted = await asyncio.to_thread(
+                ingest_upload, f.file, f.content_type, f"{SPOOL_DIR}/{fid}", txt_path, sidecar=False
+            )
+            written.append(txt_path)
+            if not extracted.has_text:
+                raise HTTPException(status_code=400, detail=f"Could not extract text from {f.filename}")
+            blob = await asyncio.to_thread(store.put_file, txt_path)
+            texts[txt_path] = blob
+            signature = await asyncio.to_thread(text_signature, txt_path)
             
+            rows.append((fid, f"{fid}.txt", f.filename, size, f.content_type, 'uploaded', user or None,
+                         blob.digest, json.dumps(extracted.pages), signature))
             ids.append(fid)
         
-        conn.commit()
+        # Store file info in database, one transaction for the whole batch
+        await db.run(insert_files, rows, texts)
         return {"file_ids": ids, "message": f"Successfully uploaded {len(files)} file(s)"}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+
+def insert_files(rows: list, texts: dict):
+    """
+    Insert file rows that reference stored texts. `texts` maps each extracted
+    text file to its blob; a blob released by a delete since it was stored is
+    written again before the rows that need it are committed.
+    """
+    with db.transaction(immediate=True) as conn:
+        for path, blob in texts.items():
+            if not store.exists(blob.digest):
+                store.put_file(path)
+        conn.executemany(
+            "INSERT INTO blobs (digest, size, stored_size) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+            [(blob.digest, blob.size, blob.stored) for blob in texts.values()]
+        )
+        conn.executemany('''
+            INSERT INTO files (id, filename, original_name, file_size, content_type, status, owner, text_blob, pages, minhash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        for row in rows:
+            neardup.index(conn, row[0], row[-1])
+
+def text_signature(txt_path: str) -> Optional[bytes]:
+    """MinHash of an extracted text, read block by block so large uploads stay in bounded memory"""
+    with open(txt_path, encoding="utf-8") as f:
+        return neardup.signature_chunks(iter(lambda: f.read(CHUNK_SIZE), ""))
+
+def load_text(fid: str) -> Optional[str]:
+    """A file's extracted text, None if the file or its text is gone"""
+    row = db.fetchone("SELECT text_blob, filename FROM files WHERE id = ?", (fid,))
+    if row is None:
+        return None
+    try:
+        if row["text_blob"]:
+            return store.read(row["text_blob"])
+        # uploaded before the blob store; see `python -m ingest.blobstore import-flat`
+        return read_text(f"{UPLOAD_DIR}/{row['filename']}")
+    except FileNotFoundError:
+        return None
 
 @app.post("/summaries/{fid}")
-async def summarize(fid: str, background_tasks: BackgroundTasks):
-    # Check if file exists
-    txt_path = f"{UPLOAD_DIR}/{fid}.txt"
-    if not os.path.exists(txt_path):
+async def summarize(fid: str):
+    """Return stored results, or queue the file for processing (202 + job)"""
+    # Check if already processed (404 if the file does not exist)
+    stored = await db.run(stored_results, fid)
+    if stored is not None:
+        return stored
+    
+    # Identical text processed before: serve it without running the pipeline
+    txt = await db.run(load_text, fid)
+    if txt is None:
         raise HTTPException(status_code=404, detail="File not found")
+    if result_cache.version is not None:    # else the stages are still loading; the job checks
+        results = await asyncio.to_thread(result_cache.get, result_cache.key(txt))
+        if results is not None:
+            await db.run(store_results, fid, results, txt)
+            return results
+    
+    job = await db.run(jobs.enqueue, fid)
+    return JSONResponse(status_code=202, content=job_response(job))
+
+def stored_results(fid: str) -> Optional[Dict]:
+    """Results of a processed file, None if it still needs processing"""
+    row = db.fetchone("SELECT status FROM files WHERE id = ?", (fid,))
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found in database")
+    if row[0] != 'processed':
+        return None
     
-    # Check if already processed
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    result = db.fetchone(f"SELECT {RESULT_COLUMNS} FROM results WHERE file_id = ?", (fid,))
+    if not result:
+        return None
+    return results_from_row(result)
+
+RESULT_COLUMNS = "lawyer_summary, citizen_summary, next_steps, key_facts, classification, near_duplicate"
+
+def results_from_row(row) -> Dict:
+    results = {
+        "lawyer": json.loads(row[0]) if row[0] else {},
+        "citizen": json.loads(row[1]) if row[1] else {},
+        "next": json.loads(row[2]) if row[2] else {},
+        "facts": json.loads(row[3]) if row[3] else {}
+    }
+    if row[4]:
+        results["classification"] = json.loads(row[4])
+    if row[5]:
+        results["near_duplicate"] = json.loads(row[5])
+    return results
+
+def read_text(txt_path: str) -> str:
+    with open(txt_path, encoding="utf-8") as f:
+        return f.read()
+
+def result_row(fid: str, results: Dict, fingerprints: Optional[Dict[str, str]] = None) -> tuple:
+    return (
+        fid,
+        json.dumps(results["lawyer"]),
+        json.dumps(results["citizen"]),
+        json.dumps(results["next"]),
+        json.dumps(results["facts"]),
+        json.dumps(results["classification"]) if "classification" in results else None,
+        json.dumps(results["near_duplicate"]) if "near_duplicate" in results else None,
+        json.dumps(fingerprints) if fingerprints else None
+    )
+
+def store_results(fid: str, results: Dict, text: Optional[str] = None,
+                  fingerprints: Optional[Dict[str, str]] = None):
+    """Store results for a file and mark it processed; with its text, also index it for search"""
+    with db.transaction() as conn:
+        write_results(conn, [result_row(fid, results, fingerprints)])
+        if text is not None:
+            search.index_document(conn, fid, text, results)
+        conn.execute("UPDATE files SET status = 'processed', processed_at = CURRENT_TIMESTAMP WHERE id = ?", (fid,))
+
+def write_results(conn, rows: list):
+    conn.executemany('''
+        INSERT OR REPLACE INTO results (file_id, lawyer_summary, citizen_summary, next_steps, key_facts, classification,
+                                        near_duplicate, fingerprints)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+def previous_outputs(fid: str) -> Dict:
+    """
+    Stage outputs stored for a file with the fingerprints they were computed
+    under, as stage -> (fingerprint, output) for StageExecutor.run. Empty when
+    the results came from the cache or a near-duplicate, which record none.
+    """
+    row = db.fetchone(f"SELECT {RESULT_COLUMNS}, fingerprints FROM results WHERE file_id = ?", (fid,))
+    if not row or not row[6]:
+        return {}
+    results = results_from_row(row)
+    outputs = {}
+    for stage, fp in json.loads(row[6]).items():
+        if stage == "classify":
+            label = results.get("classification")
+            if label:
+                outputs[stage] = (fp, Classification(int(label["legal"]), label["confidence"], label["windows"]))
+        elif stage in results:
+            outputs[stage] = (fp, results[stage])
+    return outputs
+
+def cacheable(results: Dict) -> bool:
+    """Only complete results are cached; failed stages should be retried next time"""
+    return all(
+        not isinstance(v, dict) or v.get("error") in (None, NOT_LEGAL)
+        for v in results.values()
+    )
+
+async def run_summary_job(fid: str, full: bool = False):
+    """
+    Job handler: run the pipeline for one file and store its results. With
+    `full`, every stage runs: no cached, near-duplicate or stored outputs.
+    """
+    start = time.perf_counter()
     
     try:
-        cursor.execute("SELECT status FROM files WHERE id = ?", (fid,))
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="File not found in database")
-        
-        if result[0] == 'processed':
-            # Return cached results
-            cursor.execute("SELECT * FROM results WHERE file_id = ?", (fid,))
-            result = cursor.fetchone()
-            if result:
-                return {
-                    "lawyer": json.loads(result[1]) if result[1] else {},
-                    "citizen": json.loads(result[2]) if result[2] else {},
-                    "next": json.loads(result[3]) if result[3] else {},
-                    "facts": json.loads(result[4]) if result[4] else {}
-                }
-        
         # Update status to processing
-        cursor.execute("UPDATE files SET status = 'processing' WHERE id = ?", (fid,))
-        conn.commit()
+        await db.run(set_status, fid, 'processing')
         
-        # Read text
-        with open(txt_path, encoding="utf-8") as f:
-            txt = f.read()
+        # Read text, and look up who to notify while off the event loop
+        txt = await db.run(load_text, fid)
+        if txt is None:
+            raise FileNotFoundError(f"Text of file {fid} not found")
+        owner = await db.run(file_owner, fid)
+        if result_cache.version is None:
+            await asyncio.to_thread(warm_up)
+        key = result_cache.key(txt)
         
-        # Process the document with progress updates
-        results = await process_document_with_progress(txt, fid)
+        # Reprocessing: stages whose inputs did not change keep their stored output
+        previous = {} if full else await db.run(previous_outputs, fid)
+        results, fingerprints, outcome = None, None, "done"
+        if not previous and not full:
+            results = await asyncio.to_thread(result_cache.get, key)
+            outcome = "done" if results is None else "cached"
+        if results is None and not previous and not full and neardup.NEAR_DUP_REUSE:
+            # Opt-in: a lightly edited copy of a processed document gets its results
+            results = await db.run(near_duplicate_results, fid, txt)
+            outcome = "done" if results is None else "reused"
+        if results is None:
+            # Process the document with progress updates
+            results, fingerprints = await process_document_with_progress(txt, fid, previous, owner)
+            if cacheable(results):
+                await asyncio.to_thread(result_cache.put, key, results)
+        else:
+            publish_event({
+                "type": "progress",
+                "file_id": fid,
+                "step": "complete",
+                "progress": 100,
+                "message": "Served from cache" if outcome == "cached" else "Reused results of a near-duplicate document"
+            }, owner)
         
         # Store results in database
-        cursor.execute('''
-            INSERT OR REPLACE INTO results (file_id, lawyer_summary, citizen_summary, next_steps, key_facts)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            fid,
-            json.dumps(results["lawyer"]),
-            json.dumps(results["citizen"]),
-            json.dumps(results["next"]),
-            json.dumps(results["facts"])
-        ))
-        
-        # Update file status
-        cursor.execute("UPDATE files SET status = 'processed', processed_at = CURRENT_TIMESTAMP WHERE id = ?", (fid,))
-        conn.commit()
+        await db.run(store_results, fid, results, txt, fingerprints)
+        pipeline_stats.record_job(time.perf_counter() - start, outcome)
         
+    except Exception:
+        pipeline_stats.record_job(time.perf_counter() - start, "error")
+        await db.run(set_status, fid, 'error')
+        raise
+
+def near_duplicate_results(fid: str, txt: str, signature: Optional[bytes] = None) -> Optional[Dict]:
+    """
+    Results of the most similar processed file at or above NEAR_DUP_REUSE,
+    marked with where they came from and how the texts differ; None if there
+    is no such file. `signature` is read from the file's row unless given.
+    """
+    if signature is None:
+        row = db.fetchone("SELECT minhash FROM files WHERE id = ?", (fid,))
+        signature = row[0] if row else None
+    if signature is None:
+        return None
+    conn = db.connect()
+    for match in neardup.similar(conn, signature, neardup.NEAR_DUP_REUSE, limit=5, exclude=fid, status="processed"):
+        row = conn.execute(f"SELECT {RESULT_COLUMNS} FROM results WHERE file_id = ?", (match["id"],)).fetchone()
+        if row is None or row[5]:
+            continue            # only reuse results a pipeline run produced
+        results = results_from_row(row)
+        if not cacheable(results):
+            continue
+        source = load_text(match["id"])
+        results["near_duplicate"] = {
+            "file_id": match["id"],
+            "similarity": match["similarity"],
+            "changes": neardup.changes(source, txt) if source is not None else None
+        }
         return results
-        
-    except Exception as e:
-        cursor.execute("UPDATE files SET status = 'error' WHERE id = ?", (fid,))
-        conn.commit()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+    return None
+
+def file_owner(fid: str) -> Optional[str]:
+    row = db.fetchone("SELECT owner FROM files WHERE id = ?", (fid,))
+    return row[0] if row else None
+
+def publish_event(event: Dict, owner: Optional[str] = None):
+    """
+    Send a pipeline event to the file's subscribers and, if given, to those of
+    its uploader. Runs on the event loop, so the caller looks `owner` up
+    beforehand (see file_owner) rather than this querying the database.
+    """
+    fid = event["file_id"]
+    topics = [f"file:{fid}"]
+    if owner:
+        topics.append(f"user:{owner}")
+    # A newer event for the same stage replaces one the client has not received yet
+    key = (event["type"], fid, event.get("stage") or event.get("step"))
+    manager.publish(topics, json.dumps(event), key)
+
+def set_status(fid: str, status: str):
+    with db.transaction() as conn:
+        conn.execute("UPDATE files SET status = ? WHERE id = ?", (status, fid))
+
+# Keyed on the stage versions once they are known (see warm_up)
+result_cache = ResultCache(
+    DB_FILE,
+    ttl=CACHE_TTL,
+    max_entries=CACHE_MAX_ENTRIES
+)
+
+jobs = JobQueue(db, run_summary_job, workers=PIPELINE_WORKERS)
+pipeline_stats = PipelineStats()
 
-async def process_document_with_progress(txt: str, fid: str) -> Dict:
-    """Process document with real-time progress updates"""
+@app.on_event("startup")
+async def start_job_workers():
+    await jobs.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.stop()
+    await llm_client.aclose()
+    db.close()
+
+def job_response(job: Dict) -> Dict:
+    return {
+        "job_id": job["id"],
+        "file_id": job["file_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "status_url": f"/jobs/{job['id']}",
+        "results_url": f"/files/{job['file_id']}/results"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status of a processing job"""
+    job = await db.run(jobs.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+# Error messages stored in results when a stage fails
+STAGE_ERRORS = {
+    "classify": "Classification failed",
+    "facts": "Fact extraction failed",
+    "lawyer": "Lawyer summary failed",
+    "citizen": "Citizen summary failed",
+    "next": "Next steps extraction failed",
+}
+
+def build_results(outcome: PipelineOutcome) -> Dict:
+    """Map executor output onto the lawyer/citizen/next/facts result shape"""
     results = {
         "lawyer": {},
         "citizen": {},
         "next": {},
         "facts": {}
     }
-    
-    # Send progress update
-    await manager.broadcast(json.dumps({
-        "type": "progress",
-        "file_id": fid,
-        "step": "classifying",
-        "progress": 10,
-        "message": "Classifying document..."
-    }))
-    
-    # 1. Classify
-    try:
-        legal = int(
-            subprocess.check_output(
-                ["python", "classifier/clf_infer.py"], input=txt, text=True
-            ).strip()
-        )
-        if not legal:
-            results["lawyer"] = {"error": "Document is not legal in nature"}
-            results["citizen"] = {"error": "Document is not legal in nature"}
-            await manager.broadcast(json.dumps({
-                "type": "progress",
-                "file_id": fid,
-                "step": "complete",
-                "progress": 100,
-                "message": "Document is not legal in nature"
-            }))
-            return results
-    except Exception as e:
+
+    if "classify" in outcome.errors:
+        e = outcome.errors["classify"]
         results["lawyer"] = {"error": f"Classification failed: {e}"}
         results["citizen"] = {"error": f"Classification failed: {e}"}
-        await manager.broadcast(json.dumps({
-            "type": "progress",
-            "file_id": fid,
-            "step": "error",
-            "progress": 0,
-            "message": f"Classification failed: {e}"
-        }))
+        return results
+    if "classify" in outcome.results:
+        label = outcome.results["classify"]
+        results["classification"] = {
+            "legal": bool(label),
+            "confidence": getattr(label, "confidence", None),
+            "windows": getattr(label, "windows", None)
+        }
+    if not outcome.results.get("classify"):
+        results["lawyer"] = {"error": NOT_LEGAL}
+        results["citizen"] = {"error": NOT_LEGAL}
         return results
 
-    # Send progress update
-    await manager.broadcast(json.dumps({
-        "type": "progress",
-        "file_id": fid,
-        "step": "extracting_facts",
-        "progress": 30,
-        "message": "Extracting key facts..."
-    }))
-
-    # 2. Extract facts
-    try:
-        facts = json.loads(
-            subprocess.check_output(["python", "extraction/extract.py"], input=txt, text=True)
-        )
-        results["facts"] = facts
-    except Exception as e:
-        results["facts"] = {"error": f"Fact extraction failed: {e}"}
-
-    # Send progress update
-    await manager.broadcast(json.dumps({
-        "type": "progress",
-        "file_id": fid,
-        "step": "generating_lawyer_summary",
-        "progress": 50,
-        "message": "Generating legal analysis..."
-    }))
-
-    # 3. Generate lawyer summary
-    try:
-        lawyer = json.loads(
-            subprocess.check_output(["python", "summarisers/lawyer_sum.py"], input=txt, text=True)
-        )
-        results["lawyer"] = lawyer
-    except Exception as e:
-        results["lawyer"] = {"error": f"Lawyer summary failed: {e}"}
-
-    # Send progress update
-    await manager.broadcast(json.dumps({
-        "type": "progress",
-        "file_id": fid,
-        "step": "generating_citizen_summary",
-        "progress": 70,
-        "message": "Generating citizen summary..."
-    }))
+    for name in ("facts", "lawyer", "citizen", "next"):
+        if name in outcome.errors:
+            results[name] = {"error": f"{STAGE_ERRORS[name]}: {outcome.errors[name]}"}
+        elif name in outcome.results:
+            results[name] = outcome.results[name]
 
-    # 4. Generate citizen summary
-    try:
-        citizen = json.loads(
-            subprocess.check_output(["python", "summarisers/citizen_sum.py"], input=txt, text=True)
-        )
-        results["citizen"] = citizen
-    except Exception as e:
-        results["citizen"] = {"error": f"Citizen summary failed: {e}"}
+    return results
 
-    # Send progress update
-    await manager.broadcast(json.dumps({
-        "type": "progress",
-        "file_id": fid,
-        "step": "extracting_next_steps",
-        "progress": 90,
-        "message": "Extracting next steps..."
-    }))
+async def process_document_with_progress(txt: str, fid: str, previous: Optional[Dict] = None,
+                                         owner: Optional[str] = None):
+    """
+    Process document with real-time, per-stage progress updates, sent to the
+    file's and its `owner`'s subscribers. Returns the results and the
+    fingerprints of the stage outputs in them; stages in `previous` (see
+    previous_outputs) are reused where still current.
+    """
+
+    async def on_event(kind: str, stage: str, progress: int):
+        step, running_message, done_message = STAGE_LABELS[stage]
+        if kind == "started":
+            message = running_message
+        elif kind == "done":
+            message = done_message
+        elif kind == "reused":
+            message = f"{done_message} (unchanged)"
+        elif kind == "error":
+            message = STAGE_ERRORS[stage]
+        else:
+            message = f"Skipped {step.replace('_', ' ')}"
+        publish_event({
+            "type": "progress",
+            "file_id": fid,
+            "step": step,
+            "stage": stage,
+            "status": kind,
+            "progress": progress,
+            "message": message
+        }, owner)
+
+    async def on_partial(stage: str, data: Dict):
+        publish_event({
+            "type": "partial",
+            "file_id": fid,
+            "stage": stage,
+            "data": data
+        }, owner)
 
-    # 5. Extract next steps
+    # Summarisers stream their output to clients while this is set
+    token = partial_sink.set(on_partial)
     try:
-        nxt = json.loads(
-            subprocess.check_output(["python", "nextsteps/next_steps.py"], input=txt, text=True)
-        )
-        results["next"] = nxt
-    except Exception as e:
-        results["next"] = {"error": f"Next steps extraction failed: {e}"}
+        outcome = await executor.run(txt, on_event, previous)
+    finally:
+        partial_sink.reset(token)
+    pipeline_stats.record_stages(outcome.timings)
+    results = build_results(outcome)
 
     # Send completion update
-    await manager.broadcast(json.dumps({
+    if "classify" in outcome.errors:
+        step, progress, message = "error", 0, f"Classification failed: {outcome.errors['classify']}"
+    elif not outcome.results.get("classify"):
+        step, progress, message = "complete", 100, NOT_LEGAL
+    else:
+        step, progress, message = "complete", 100, "Processing complete!"
+    publish_event({
         "type": "progress",
         "file_id": fid,
-        "step": "complete",
-        "progress": 100,
-        "message": "Processing complete!"
-    }))
+        "step": step,
+        "progress": progress,
+        "message": message
+    }, owner)
 
-    return results
+    return results, outcome.fingerprints
 
 async def process_document(txt: str, fid: str) -> Dict:
     """Process document through all analysis steps"""
-    results = {
-        "lawyer": {},
-        "citizen": {},
-        "next": {},
-        "facts": {}
-    }
-    
-    # 1. Classify
-    try:
-        legal = int(
-            subprocess.check_output(
-                ["python", "classifier/clf_infer.py"], input=txt, text=True
-            ).strip()
-        )
-        if not legal:
-            results["lawyer"] = {"error": "Document is not legal in nature"}
-            results["citizen"] = {"error": "Document is not legal in nature"}
-            return results
-    except Exception as e:
-        results["lawyer"] = {"error": f"Classification failed: {e}"}
-        results["citizen"] = {"error": f"Classification failed: {e}"}
-        return results
-
-    # 2. Extract facts
-    try:
-        facts = json.loads(
-            subprocess.check_output(["python", "extraction/extract.py"], input=txt, text=True)
-        )
-        results["facts"] = facts
-    except Exception as e:
-        results["facts"] = {"error": f"Fact extraction failed: {e}"}
-
-    # 3. Generate summaries
-    try:
-        lawyer = json.loads(
-            subprocess.check_output(["python", "summarisers/lawyer_sum.py"], input=txt, text=True)
-        )
-        results["lawyer"] = lawyer
-    except Exception as e:
-        results["lawyer"] = {"error": f"Lawyer summary failed: {e}"}
-
-    try:
-        citizen = json.loads(
-            subprocess.check_output(["python", "summarisers/citizen_sum.py"], input=txt, text=True)
-        )
-        results["citizen"] = citizen
-    except Exception as e:
-        results["citizen"] = {"error": f"Citizen summary failed: {e}"}
-
-    # 4. Extract next steps
-    try:
-        nxt = json.loads(
-            subprocess.check_output(["python", "nextsteps/next_steps.py"], input=txt, text=True)
-        )
-        results["next"] = nxt
-    except Exception as e:
-        results["next"] = {"error": f"Next steps extraction failed: {e}"}
+    return build_results(await executor.run(txt))
 
-    return results
 
 # File management endpoints
 @app.get("/files")
-async def list_files():
-    """List all uploaded files"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+async def list_files(limit: int = Query(FILES_PAGE_SIZE, ge=1, le=FILES_MAX_PAGE_SIZE),
+                     cursor: Optional[str] = None, status: Optional[str] = None,
+                     name: Optional[str] = None, since: Optional[str] = None):
+    """
+    List uploaded files, newest first, one page at a time. Pass `next_cursor`
+    back as `cursor` for the next page. `status` and `name` (a case-insensitive
+    prefix) filter the list. `since` takes the `sync_token` of an earlier
+    response and returns only files changed after it (oldest change first)
+    plus the ids of files deleted since.
+    """
+    return await db.run(query_files, limit, cursor, status, name, since)
+
+FILE_COLUMNS = "id, original_name, file_size, uploaded_at, processed_at, status, updated_at"
+
+def encode_cursor(*position) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+def decode_cursor(token: str) -> list:
     try:
-        cursor.execute('''
-            SELECT id, original_name, file_size, uploaded_at, processed_at, status
+        position = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        position = None
+    if not isinstance(position, list) or len(position) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def query_files(limit: int, cursor: Optional[str], status: Optional[str],
+                name: Optional[str], since: Optional[str]) -> Dict:
+    # One read transaction: the page, the sync token and the deletions come
+    # from the same snapshot, so no change can land between them and be skipped
+    with db.transaction() as conn:
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if name:
+            # prefix match on idx_files_name; LIKE is case-insensitive like the index
+            where.append("original_name LIKE ? ESCAPE '\\'")
+            params.append(re.sub(r"([\\%_])", r"\\\1", name) + "%")
+    
+        if since is None:
+            # Keyset pagination on (uploaded_at, id): each page is an index range scan
+            order, key = "uploaded_at DESC, id DESC", ("uploaded_at", "id")
+            if cursor:
+                where.append("(uploaded_at, id) < (?, ?)")
+                params += decode_cursor(cursor)
+        else:
+            order, key = "updated_at ASC, id ASC", ("updated_at", "id")
+            where.append("(updated_at, id) > (?, ?)")
+            params += decode_cursor(cursor or since)
+    
+        rows = conn.execute(f'''
+            SELECT {FILE_COLUMNS}
             FROM files
-            ORDER BY uploaded_at DESC
-        ''')
-        files = cursor.fetchall()
-        
-        return [
-            {
-                "id": f[0],
-                "name": f[1],
-                "size": f[2],
-                "uploaded_at": f[3],
-                "processed_at": f[4],
-                "status": f[5]
-            }
-            for f in files
-        ]
-    finally:
-        conn.close()
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY {order}
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+    
+        body = {
+            "files": [file_info(row) for row in rows],
+            "next_cursor": encode_cursor(rows[-1][key[0]], rows[-1][key[1]]) if more else None
+        }
+        if since is None:
+            # Where a later `since` refresh should pick up from
+            latest = conn.execute("SELECT updated_at, id FROM files ORDER BY updated_at DESC, id DESC LIMIT 1").fetchone()
+            body["sync_token"] = encode_cursor(latest[0], latest[1]) if latest else encode_cursor("", "")
+        else:
+            body["sync_token"] = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"]) if rows else (cursor or since)
+            if cursor is None:
+                changed_after = decode_cursor(since)[0]
+                body["deleted"] = [row[0] for row in conn.execute(
+                    "SELECT id FROM file_tombstones WHERE deleted_at > ?", (changed_after,)
+                )]
+        return body
+
+def file_info(row) -> Dict:
+    return {
+        "id": row[0],
+        "name": row[1],
+        "size": row[2],
+        "uploaded_at": row[3],
+        "processed_at": row[4],
+        "status": row[5],
+        "updated_at": row[6]
+    }
 
 @app.get("/files/{file_id}")
 async def get_file_info(file_id: str):
     """Get information about a specific file"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    row = await db.run(db.fetchone, f"SELECT {FILE_COLUMNS} FROM files WHERE id = ?", (file_id,))
     
-    try:
-        cursor.execute('''
-            SELECT id, original_name, file_size, uploaded_at, processed_at, status
-            FROM files
-            WHERE id = ?
-        ''', (file_id,))
-        file_info = cursor.fetchone()
-        
-        if not file_info:
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        return {
-            "id": file_info[0],
-            "name": file_info[1],
-            "size": file_info[2],
-            "uploaded_at": file_info[3],
-            "processed_at": file_info[4],
-            "status": file_info[5]
-        }
-    finally:
-        conn.close()
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return file_info(row)
 
 @app.delete("/files/{file_id}")
 async def delete_file(file_id: str):
     """Delete a file and its results"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
     try:
-        # Check if file exists
-        cursor.execute("SELECT filename FROM files WHERE id = ?", (file_id,))
-        result = cursor.fetchone()
-        if not result:
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        filename = result[0]
+        filename = await db.run(delete_file_rows, file_id)
         
-        # Delete from database
-        cursor.execute("DELETE FROM results WHERE file_id = ?", (file_id,))
-        cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
-        conn.commit()
-        
-        # Delete physical files
+        # Delete physical files left from before the blob store
         txt_path = f"{UPLOAD_DIR}/{filename}"
-        if os.path.exists(txt_path):
-            os.remove(txt_path)
+        for path in (txt_path, pages_path(txt_path)):
+            if os.path.exists(path):
+                os.remove(path)
         
         return {"message": "File deleted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+def delete_file_rows(file_id: str) -> str:
+    """Remove a file's rows, and its text once no other file shares it; returns its stored filename"""
+    with db.transaction(immediate=True) as conn:
+        # Check if file exists
+        result = conn.execute("SELECT filename, text_blob FROM files WHERE id = ?", (file_id,)).fetchone()
+        if not result:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        conn.execute("DELETE FROM results WHERE file_id = ?", (file_id,))
+        conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        # the trigger on files released the reference; the last one removes the blob
+        blob = conn.execute("SELECT digest, refs FROM blobs WHERE digest = ?", (result["text_blob"],)).fetchone()
+        if blob and blob["refs"] <= 0:
+            digest = blob["digest"]
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            # last step before commit, so an upload sharing the text waits for the lock and re-stores it
+            store.remove(digest)
+        return result["filename"]
+
+@app.get("/files/{file_id}/similar")
+async def similar_files(file_id: str, threshold: float = Query(0.5, ge=0.0, le=1.0),
+                        limit: int = Query(10, ge=1, le=100)):
+    """Files whose text is estimated (MinHash) to overlap this one's by at least `threshold`"""
+    return await db.run(find_similar, file_id, threshold, limit)
+
+def find_similar(file_id: str, threshold: float, limit: int) -> Dict:
+    row = db.fetchone("SELECT minhash FROM files WHERE id = ?", (file_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    similar = neardup.similar(db.connect(), row[0], threshold, limit, exclude=file_id) if row[0] else []
+    return {"file_id": file_id, "similar": similar}
 
 @app.get("/files/{file_id}/results")
 async def get_file_results(file_id: str):
     """Get analysis results for a specific file"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    result = await db.run(db.fetchone, f"SELECT {RESULT_COLUMNS} FROM results WHERE file_id = ?", (file_id,))
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="Results not found")
     
+    return results_from_row(result)
+
+@app.get("/export")
+async def export_results(status: Optional[str] = None, start: Optional[str] = None,
+                         end: Optional[str] = None, gzip: bool = False):
+    """
+    Stream the results of every matching file as NDJSON, oldest upload first.
+    `start`/`end` bound the upload time (ISO dates, end exclusive); `gzip`
+    returns a .ndjson.gz download.
+    """
     try:
-        cursor.execute('''
-            SELECT lawyer_summary, citizen_summary, next_steps, key_facts
-            FROM results
-            WHERE file_id = ?
-        ''', (file_id,))
-        result = cursor.fetchone()
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Results not found")
-        
-        return {
-            "lawyer": json.loads(result[0]) if result[0] else {},
-            "citizen": json.loads(result[1]) if result[1] else {},
-            "next": json.loads(result[2]) if result[2] else {},
-            "facts": json.loads(result[3]) if result[3] else {}
-        }
-    finally:
-        conn.close()
+        conn, cursor = await db.run(export.open_cursor, DB_FILE, status, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    chunks = export.iter_ndjson(cursor, gzip=gzip)
+
+    async def body():
+        # one batch at a time on the database threads; the cursor is never shared
+        try:
+            while (chunk := await db.run(next, chunks, None)) is not None:
+                yield chunk
+        finally:
+            await db.run(conn.close)
+
+    filename = "results.ndjson.gz" if gzip else "results.ndjson"
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.post("/files/{file_id}/reprocess")
-async def reprocess_file(file_id: str):
-    """Reprocess a file"""
+async def reprocess_file(file_id: str, full: bool = False):
+    """
+    Reprocess a file. Only stages whose inputs changed since its results were
+    stored (text, stage code and configuration, prompts, model) run again;
+    `full=true` discards the results and runs every stage, without consulting
+    the result cache.
+    """
     # Check if file exists
-    txt_path = f"{UPLOAD_DIR}/{file_id}.txt"
-    if not os.path.exists(txt_path):
+    if not await db.run(db.fetchone, "SELECT 1 FROM files WHERE id = ?", (file_id,)):
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Reset status and reprocess
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+
+    if not full:
+        # The stored results stay readable until the job replaces them
+        job = await db.run(jobs.enqueue, file_id)
+        return JSONResponse(status_code=202, content=job_response(job))
+
+    # Reset status and rerun every stage, bypassing the result cache
     try:
-        cursor.execute("UPDATE files SET status = 'uploaded' WHERE id = ?", (file_id,))
-        cursor.execute("DELETE FROM results WHERE file_id = ?", (file_id,))
-        conn.commit()
-        
-        # Trigger reprocessing
-        return await summarize(file_id, BackgroundTasks())
-        
+        await db.run(reset_file, file_id)
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+    job = await db.run(jobs.enqueue, file_id, True)
+    return JSONResponse(status_code=202, content=job_response(job))
+
+@app.post("/reprocess")
+async def reprocess_files(status: str = "processed", full: bool = False):
+    """Queue every file with `status` for reprocessing, incrementally unless `full=true`"""
+    ids = await db.run(reset_files, status, full)
+    queued = await db.run(jobs.enqueue_many, ids, full)
+    return {"matched": len(ids), "queued": queued}
+
+def reset_file(file_id: str):
+    with db.transaction() as conn:
+        conn.execute("UPDATE files SET status = 'uploaded' WHERE id = ?", (file_id,))
+        conn.execute("DELETE FROM results WHERE file_id = ?", (file_id,))
+        search.remove_document(conn, file_id)
+
+def reset_files(status: str, full: bool) -> List[str]:
+    """Ids of the files with `status`; with `full`, their results are discarded first"""
+    with db.transaction(immediate=True) as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM files WHERE status = ?", (status,))]
+        if full:
+            conn.execute("DELETE FROM search_docs WHERE file_id IN (SELECT id FROM files WHERE status = ?)", (status,))
+            conn.execute("DELETE FROM results WHERE file_id IN (SELECT id FROM files WHERE status = ?)", (status,))
+            conn.execute("UPDATE files SET status = 'uploaded' WHERE status = ?", (status,))
+    return ids
+
+@app.get("/search")
+async def search_files(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100),
+                       cursor: Optional[str] = None, fields: Optional[str] = None, sort: str = "rank"):
+    """
+    Ranked full-text search over processed files: name, extracted text, key
+    facts and summaries (`fields=text,summaries` narrows it). Every word,
+    "quoted phrase" or prefix* must match. `sort=recent` lists the most
+    recently processed matches first instead of ranking them. Snippets are
+    HTML with matches in <mark>; pass `next_cursor` back as `cursor` for the
+    next page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    columns = [f for f in (fields or "").split(",") if f]
+    try:
+        hits, last = await db.run(lambda: search.search(db.connect(), q, limit, after, columns, sort))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": hits, "next_cursor": encode_cursor(*last) if last else None}
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
+    """Health check endpoint; only healthy once every pipeline stage is warm and the database answers"""
+    stages = registry.status()
+    try:
+        await db.run(db.fetchone, "SELECT 1")
+        database = "ok"
+    except Exception as e:
+        database = f"{type(e).__name__}: {e}"
+    healthy = registry.ready and database == "ok"
+    body = {
+        "status": "healthy" if healthy else stages["state"] if database == "ok" else "database unavailable",
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "stages": stages,
+        "database": database
     }
+    return JSONResponse(status_code=200 if healthy else 503, content=body)
+
+# Read only while rendering a scrape; the hot paths record into metrics.py directly
+metrics.REGISTRY.callback("legal_lens_queue_depth", "Jobs waiting for a worker", jobs.depth)
+metrics.REGISTRY.callback("legal_lens_stage_ready", "1 once a pipeline stage has loaded",
+                          lambda: {(name,): int(name in registry.functions) for name in registry.stages}, ["stage"])
+metrics.REGISTRY.callback("legal_lens_llm_calls_total", "LLM calls, retries included once",
+                          lambda: llm_client.metrics.calls, kind="counter")
+metrics.REGISTRY.callback("legal_lens_llm_failures_total", "LLM calls that failed after retrying",
+                          lambda: llm_client.metrics.failures, kind="counter")
+metrics.REGISTRY.callback("legal_lens_llm_retries_total", "LLM requests retried (429, 5xx, dropped connection)",
+                          lambda: llm_client.metrics.retries, kind="counter")
+metrics.REGISTRY.callback("legal_lens_llm_responses_total", "LLM HTTP responses by status code",
+                          lambda: {(str(code),): n for code, n in llm_client.metrics.status_counts().items()},
+                          ["status"], kind="counter")
+metrics.REGISTRY.callback("legal_lens_llm_tokens_total", "LLM tokens reported by the provider",
+                          lambda: {("prompt",): llm_client.metrics.prompt_tokens,
+                                   ("completion",): llm_client.metrics.completion_tokens},
+                          ["kind"], kind="counter")
+metrics.REGISTRY.callback("legal_lens_cache_lookups_total", "Result cache lookups",
+                          lambda: {("hit",): result_cache.hits, ("miss",): result_cache.misses},
+                          ["result"], kind="counter")
+metrics.REGISTRY.callback("legal_lens_ws_clients", "Connected WebSocket clients", lambda: len(manager.subscribers))
+metrics.REGISTRY.callback("legal_lens_ws_queued_messages", "Messages waiting in WebSocket send queues",
+                          lambda: sum(len(s.pending) for s in list(manager.subscribers.values())))
+metrics.REGISTRY.callback("legal_lens_ws_messages_total", "WebSocket messages by fate",
+                          lambda: {("delivered",): manager.delivered, ("coalesced",): manager.coalesced},
+                          ["result"], kind="counter")
+metrics.REGISTRY.callback("legal_lens_ws_dropped_clients_total", "WebSocket clients disconnected for falling behind",
+                          lambda: manager.dropped, kind="counter")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of this process's metrics"""
+    text = await asyncio.to_thread(metrics.REGISTRY.render)
+    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Statistics endpoint
 @app.get("/stats")
 async def get_stats():
     """Get system statistics"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    try:
-        # Total files
-        cursor.execute("SELECT COUNT(*) FROM files")
-        total_files = cursor.fetchone()[0]
-        
-        # Processed files
-        cursor.execute("SELECT COUNT(*) FROM files WHERE status = 'processed'")
-        processed_files = cursor.fetchone()[0]
-        
-        # Error files
-        cursor.execute("SELECT COUNT(*) FROM files WHERE status = 'error'")
-        error_files = cursor.fetchone()[0]
-        
-        # Total size
-        cursor.execute("SELECT SUM(file_size) FROM files")
-        total_size = cursor.fetchone()[0] or 0
-        
-        return {
-            "total_files": total_files,
-            "processed_files": processed_files,
-            "error_files": error_files,
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2)
-        }
-    finally:
-        conn.close()
+    files = await db.run(lambda: file_counters(db.connect()))
+    total_size = files["total"]["bytes"]
+    return {
+        "total_files": files["total"]["files"],
+        "processed_files": files["by_status"].get("processed", {}).get("files", 0),
+        "error_files": files["by_status"].get("error", {}).get("files", 0),
+        "total_size_bytes": total_size,
+        "total_size_mb": round(total_size / (1024 * 1024), 2),
+        "files": files,
+        "pipeline": pipeline_stats.snapshot(),
+        "classifier": clf_batcher.stats(),
+        "llm": llm_client.metrics.snapshot(),
+        "cache": await asyncio.to_thread(result_cache.stats),
+        "websocket": manager.stats()
+    }
+
+def authorized_topics(user: Optional[str], topics: List[str]):
+    return authorize(db.connect(), user, topics, WS_ALLOW_ALL)
 
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # Topics ("file:<id>", "user:<id>", "*") come from ?topics=a,b or later
+    # {"action": "subscribe" | "unsubscribe", "topics": [...]} messages; the
+    # client names itself with ?user=, the id its uploads were tagged with
+    user = websocket.query_params.get("user") or None
+    topics = [t for t in websocket.query_params.get("topics", "").split(",") if t]
+    allowed, refused = await db.run(authorized_topics, user, topics)
+    await manager.connect(websocket, allowed)
+    if refused:
+        await manager.send_personal_message(
+            json.dumps({"type": "subscribed", "topics": sorted(allowed), "refused": refused}), websocket
+        )
     try:
         while True:
-            # Keep connection alive and handle any incoming messages
             data = await websocket.receive_text()
-            # Echo back for now, can be extended for specific commands
-            await manager.send_personal_message(f"Echo: {data}", websocket)
+            try:
+                command = json.loads(data)
+            except ValueError:
+                command = None
+            if isinstance(command, dict) and command.get("action") in ("subscribe", "unsubscribe"):
+                requested = command.get("topics") or []
+                if isinstance(requested, str):
+                    requested = [requested]
+                requested, refused = [str(t) for t in requested], []
+                if command["action"] == "subscribe":
+                    requested, refused = await db.run(authorized_topics, user, requested)
+                    current = manager.subscribe(websocket, requested)
+                else:
+                    current = manager.unsubscribe(websocket, requested)
+                reply = {"type": "subscribed", "topics": current}
+                if refused:
+                    reply["refused"] = refused
+                await manager.send_personal_message(json.dumps(reply), websocket)
+            else:
+                await manager.send_personal_message(f"Echo: {data}", websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
@@ -0,0 +1,131 @@
+"""
+Benchmark: disk use and read latency of flat text files vs the blob store.
+
+Builds a corpus shaped like ours (mostly short notices and orders, some long
+judgments and bundles, a share of re-uploaded identical documents) or takes
+the .txt files of an existing directory, writes it both as one flat file per
+upload and into a BlobStore per codec, and prints bytes on disk (allocated
+blocks), file count, and p50/p95 latency of reading a whole document and of
+its first 4 KB.
+
+    python -m ingest.bench_blobstore --docs 2000 --duplicates 0.2
+    python -m ingest.bench_blobstore --dir file_queue
+"""
+import argparse, os, random, shutil, tempfile, time
+from ingest.blobstore import BlobStore, zstandard
+from ingest.bench_pdf import WORDS
+
+# (share of uploads, min chars, max chars)
+SHAPE = [(0.6, 2_000, 20_000), (0.3, 20_000, 150_000), (0.1, 150_000, 1_500_000)]
+
+
+def make_text(rng: random.Random, chars: int) -> str:
+    lines, size = [], 0
+    while size < chars:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16)))
+        if rng.random() < 0.2:
+            line += f" dated {rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.20{rng.randint(10, 24)}"
+            line += f" Rs. {rng.randint(1000, 999999):,}"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def make_corpus(n: int, duplicates: float, seed: int = 0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        if texts and rng.random() < duplicates:
+            texts.append(rng.choice(texts))         # the same notice uploaded again
+            continue
+        pick = rng.random()
+        for share, low, high in SHAPE:
+            if pick < share:
+                break
+            pick -= share
+        texts.append(make_text(rng, rng.randint(low, high)))
+    return texts
+
+
+def disk_usage(root: str):
+    """(allocated bytes, regular files) under a directory"""
+    used = files = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            used += os.stat(os.path.join(dirpath, name)).st_blocks * 512
+            files += 1
+    return used, files
+
+
+def latencies(read, keys, repeat: int):
+    timings = []
+    for key in keys[:repeat]:
+        start = time.perf_counter()
+        read(key)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000
+
+
+def first_4k(opener):
+    def read(key):
+        with opener(key) as f:
+            return f.read(4096)
+    return read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of uploads repeating an earlier text")
+    parser.add_argument("--dir", help="measure the .txt files of this directory instead")
+    parser.add_argument("--reads", type=int, default=300, help="documents read for the latency figures")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flat = os.path.join(tmp, "flat")
+        os.makedirs(flat)
+        if args.dir:
+            for name in sorted(os.listdir(args.dir)):
+                if name.endswith(".txt"):
+                    shutil.copyfile(os.path.join(args.dir, name), os.path.join(flat, name))
+        else:
+            for i, text in enumerate(make_corpus(args.docs, args.duplicates)):
+                with open(os.path.join(flat, f"{i}.txt"), "w", encoding="utf-8") as f:
+                    f.write(text)
+        names = sorted(os.listdir(flat))
+        paths = [os.path.join(flat, name) for name in names]
+        logical = sum(os.path.getsize(p) for p in paths)
+        random.Random(1).shuffle(paths)
+
+        used, files = disk_usage(flat)
+        print(f"{len(paths)} documents, {logical / 2 ** 20:.1f} MB of text")
+        print(f"{'layout':>10} {'MB on disk':>10} {'files':>7} {'ratio':>6} {'write s':>8} "
+              f"{'read p50/p95 ms':>16} {'4KB p50/p95 ms':>15}")
+
+        def read_flat(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+        full = latencies(read_flat, paths, args.reads)
+        head = latencies(first_4k(lambda p: open(p, encoding="utf-8")), paths, args.reads)
+        print(f"{'flat':>10} {used / 2 ** 20:>10.1f} {files:>7} {logical / used:>6.2f} {'-':>8} "
+              f"{full[0]:>7.2f}/{full[1]:<8.2f} {head[0]:>6.2f}/{head[1]:<8.2f}")
+
+        for codec in ["gzip"] + (["zstd"] if zstandard else []):
+            store = BlobStore(os.path.join(tmp, codec), codec=codec)
+            start = time.perf_counter()
+            digests = {path: store.put_file(path).digest for path in paths}
+            seconds = time.perf_counter() - start
+            used, files = disk_usage(store.root)
+            keys = [digests[p] for p in paths]
+            full = latencies(store.read, keys, args.reads)
+            head = latencies(first_4k(store.open), keys, args.reads)
+            print(f"{codec:>10} {used / 2 ** 20:>10.1f} {files:>7} {logical / used:>6.2f} {seconds:>8.2f} "
+                  f"{full[0]:>7.2f}/{full[1]:<8.2f} {head[0]:>6.2f}/{head[1]:<8.2f}")
+        if not zstandard:
+            print("(install zstandard to include zstd)")
+
+
+if __name__ == "__main__":
+    main()
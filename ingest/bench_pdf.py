@@ -0,0 +1,94 @@
+"""
+Benchmark: sequential vs process-pool PDF text extraction.
+
+Writes synthetic text PDFs with a few hundred pages, extracts each one
+sequentially and then in parallel for every combination of worker count and
+page batch size, checks that the text and page offsets are identical, and
+prints pages/sec.
+
+    python -m ingest.bench_pdf --pages 200 500 --workers 2 4 --batch 8 32
+"""
+import argparse, os, random, tempfile, time
+from ingest.reader import PDF, extract_to_file, _get_pool
+
+WORDS = (
+    "the court held that appellant respondent petition order decree hearing notice "
+    "section act evidence witness agreement payment cheque tribunal judgment appeal"
+).split()
+
+
+def make_pdf(pages, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """Minimal valid PDF with `pages` pages of Helvetica text"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i in range(pages):
+        objects.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode())
+        lines = " ".join(
+            "(" + " ".join(rng.choice(WORDS) for _ in range(12)) + ") Tj T*"
+            for _ in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 14 TL 40 760 Td (Page {i + 1}) Tj T* {lines} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--batch", type=int, nargs="+", default=[8, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.txt")
+        for workers in args.workers:
+            # start the pool outside the timings; the server keeps it warm too
+            _get_pool(workers).submit(int).result()
+
+        print(f"{'pages':>6} {'mode':>18} {'seconds':>8} {'pages/s':>8}")
+        for pages in args.pages:
+            pdf = os.path.join(tmp, f"bundle_{pages}.pdf")
+            with open(pdf, "wb") as f:
+                f.write(make_pdf(pages))
+
+            seconds, expected = timed(lambda: extract_to_file(pdf, PDF, out, workers=0))
+            with open(out, encoding="utf-8") as f:
+                expected_text = f.read()
+            print(f"{pages:>6} {'sequential':>18} {seconds:>8.2f} {pages / seconds:>8.1f}")
+
+            for workers in args.workers:
+                for batch in args.batch:
+                    seconds, result = timed(lambda: extract_to_file(
+                        pdf, PDF, out, workers=workers, batch_pages=batch, parallel_min_pages=0))
+                    with open(out, encoding="utf-8") as f:
+                        assert f.read() == expected_text, "parallel text differs"
+                    assert result.pages == expected.pages, "page offsets differ"
+                    mode = f"{workers}w x {batch}p"
+                    print(f"{pages:>6} {mode:>18} {seconds:>8.2f} {pages / seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
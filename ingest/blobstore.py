@@ -0,0 +1,217 @@
+"""
+Content-addressed, compressed store for extracted document text.
+
+Each text is kept once, under the SHA-256 of its bytes, as a compressed
+file in a two-level sharded directory (`ab/cd/abcd….zst`), so identical
+re-uploads share one blob and no directory holds more than a few hundred
+entries. Blobs are zstd-compressed when the `zstandard` package is
+installed and gzip otherwise; the extension records the codec, so a store
+written with one can always be read back.
+
+The store itself knows nothing about references. legal_lens.db counts them
+in the `blobs` table (kept by triggers on files.text_blob, see db.py) and
+the caller removes a blob once its count drops to zero. Reads are lazy:
+`open()` returns a text stream that decompresses as it is read.
+
+    python -m ingest.blobstore import-flat   # move file_queue/*.txt into the store
+    python -m ingest.blobstore stats
+    python -m ingest.blobstore gc            # remove blobs no file references
+"""
+import argparse, gzip, hashlib, io, json, os, sys, tempfile, time
+from typing import Iterator, NamedTuple, Optional, TextIO
+
+try:
+    import zstandard
+except ImportError:             # optional; gzip is always available
+    zstandard = None
+
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join("file_queue", "blobs"))
+BLOB_CODEC = os.getenv("BLOB_CODEC", "zstd" if zstandard else "gzip")
+BLOB_LEVEL = int(os.getenv("BLOB_LEVEL", "0"))      # 0 = the codec's default level
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+CHUNK_SIZE = 1024 * 1024
+
+
+class Blob(NamedTuple):
+    digest: str
+    size: int                   # uncompressed bytes
+    stored: int                 # bytes on disk
+    created: bool               # False if the content was already stored
+
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR, codec: str = BLOB_CODEC, level: int = BLOB_LEVEL):
+        if codec not in EXTENSIONS:
+            raise ValueError(f"Unknown blob codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("BLOB_CODEC=zstd needs the zstandard package")
+        self.root = root
+        self.codec = codec
+        self.level = level
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + EXTENSIONS[codec])
+
+    def find(self, digest: str) -> Optional[str]:
+        """Path of a stored blob, whichever codec wrote it"""
+        for codec in (self.codec, *EXTENSIONS):
+            path = self._path(digest, codec)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, digest: str) -> bool:
+        return self.find(digest) is not None
+
+    def put_file(self, src_path: str) -> Blob:
+        """Store the contents of a file; a no-op apart from hashing if already present"""
+        h = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        size = os.path.getsize(src_path)
+        existing = self.find(digest)
+        if existing:
+            return Blob(digest, size, os.path.getsize(existing), False)
+
+        path = self._path(digest, self.codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write beside the target and rename, so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, open(src_path, "rb") as src:
+                self._compress(src, out)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return Blob(digest, size, os.path.getsize(path), True)
+
+    def _compress(self, src, out):
+        if self.codec == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            compressor.copy_stream(src, out, read_size=CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=self.level or 6, mtime=0) as gz:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    gz.write(chunk)
+
+    def open(self, digest: str) -> TextIO:
+        """Text stream over a blob, decompressed as it is read"""
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob not found: {digest}")
+        if path.endswith(EXTENSIONS["zstd"]):
+            if zstandard is None:
+                raise RuntimeError(f"{path} is zstd-compressed; install the zstandard package")
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+            return io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8")
+        return gzip.open(path, "rt", encoding="utf-8")
+
+    def read(self, digest: str) -> str:
+        with self.open(digest) as f:
+            return f.read()
+
+    def remove(self, digest: str):
+        while (path := self.find(digest)) is not None:
+            os.remove(path)
+
+    def walk(self) -> Iterator[str]:
+        """Digests of every stored blob"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                digest, ext = os.path.splitext(name)
+                if ext in EXTENSIONS.values():
+                    yield digest
+
+
+def import_flat(database, store: BlobStore, upload_dir: str) -> int:
+    """Move pre-store `file_queue/<id>.txt` texts (and page sidecars) into the store"""
+    from ingest.reader import pages_path
+
+    moved = 0
+    rows = database.fetchall("SELECT id, filename FROM files WHERE text_blob IS NULL")
+    for fid, filename in rows:
+        txt_path = os.path.join(upload_dir, filename)
+        if not os.path.exists(txt_path):
+            continue
+        blob = store.put_file(txt_path)
+        try:
+            with open(pages_path(txt_path), encoding="utf-8") as f:
+                pages = f.read()
+        except OSError:
+            pages = None
+        with database.transaction(immediate=True) as conn:
+            conn.execute("INSERT INTO blobs (digest, size, stored_size) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                         (blob.digest, blob.size, blob.stored))
+            conn.execute("UPDATE files SET text_blob = ?, pages = ? WHERE id = ?", (blob.digest, pages, fid))
+        for path in (txt_path, pages_path(txt_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        moved += 1
+    return moved
+
+
+def collect_garbage(database, store: BlobStore, grace: float = 3600.0) -> int:
+    """
+    Remove blobs no file references: rows whose count reached zero, and
+    files never recorded (an upload that failed after storing its text).
+    Unrecorded files younger than `grace` seconds may belong to an upload in
+    progress and are kept.
+    """
+    removed = 0
+    with database.transaction(immediate=True) as conn:
+        for (digest,) in conn.execute("SELECT digest FROM blobs WHERE refs <= 0").fetchall():
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            store.remove(digest)
+            removed += 1
+    known = {row[0] for row in database.fetchall("SELECT digest FROM blobs")}
+    now = time.time()
+    for digest in list(store.walk()):
+        path = store.find(digest)
+        if digest not in known and path and now - os.path.getmtime(path) > grace:
+            store.remove(digest)
+            removed += 1
+    return removed
+
+
+def main():
+    from db import Database
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["import-flat", "stats", "gc"])
+    parser.add_argument("--db", default="legal_lens.db")
+    parser.add_argument("--upload-dir", default="file_queue")
+    parser.add_argument("--grace", type=float, default=3600.0, help="gc: keep unrecorded blobs younger than this (seconds)")
+    args = parser.parse_args()
+
+    database = Database(args.db)
+    database.migrate()
+    store = BlobStore()
+    try:
+        if args.command == "import-flat":
+            print(f"moved {import_flat(database, store, args.upload_dir)} text files into {store.root}")
+        elif args.command == "gc":
+            print(f"removed {collect_garbage(database, store, args.grace)} blobs")
+        else:
+            row = database.fetchone(
+                "SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs"
+            )
+            blobs, refs, size, stored = row
+            logical = database.fetchone(
+                "SELECT COALESCE(SUM(b.size), 0) FROM files f JOIN blobs b ON b.digest = f.text_blob"
+            )[0]
+            print(json.dumps({
+                "blobs": blobs, "references": refs, "codec": store.codec,
+                "text_bytes": logical, "unique_bytes": size, "stored_bytes": stored,
+                "ratio": round(logical / stored, 2) if stored else None,
+            }, indent=2))
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,19 @@
 from fastapi import FastAPI, UploadFile, File
-from PyPDF2 import PdfReader
-import docx2txt, io, os, uuid
+import asyncio, os, uuid
+from ingest.reader import ingest_upload
 
 app = FastAPI()
 UPLOAD_DIR = "file_queue"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-def extract_text(file: UploadFile) -> str:
-    if file.content_type == "application/pdf":
-        reader = PdfReader(io.BytesIO(file.file.read()))
-        return "\n".join((page.extract_text() or "") for page in reader.pages)
-    elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return docx2txt.process(io.BytesIO(file.file.read()))
-    else:
-        return file.file.read().decode(errors="ignore")
+SPOOL_DIR = os.path.join(UPLOAD_DIR, ".spool")
+os.makedirs(SPOOL_DIR, exist_ok=True)
 
 @app.post("/upload")
 async def upload(files: list[UploadFile] = File(...)):
     ids: list[str] = []
     for f in files:
-        txt = extract_text(f)
         fid = str(uuid.uuid4())
-        with open(f"{UPLOAD_DIR}/{fid}.txt", "w", encoding="utf-8") as out:
-            out.write(txt)
+        await asyncio.to_thread(
+            ingest_upload, f.file, f.content_type, f"{SPOOL_DIR}/{fid}", f"{UPLOAD_DIR}/{fid}.txt"
+        )
         ids.append(fid)
     return {"file_ids": ids}
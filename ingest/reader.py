@@ -0,0 +1,210 @@
+"""
+Streaming text extraction for uploads.
+
+Uploads are copied to a spool file on disk in fixed-size chunks instead of
+being read into memory whole, and text is produced page by page (PDF) or
+chunk by chunk (plain text) and appended to the output file as it comes, so
+memory per file stays bounded by one page rather than the whole bundle. The
+functions here are blocking; callers in async handlers run them in a worker
+thread.
+
+Large PDFs can instead be split into page ranges that a process pool extracts
+in parallel; batches are written back in page order as they complete, with
+only a bounded window of batches in flight. Either way the character range of
+every page in the output is recorded in a `.pages.json` sidecar so later
+stages can cite page numbers.
+"""
+import codecs, json, multiprocessing, os, shutil, threading, time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from PyPDF2 import PdfReader
+import docx2txt
+
+import metrics
+
+PDF = "application/pdf"
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT = "text/plain"
+SUPPORTED_TYPES = (PDF, DOCX, TEXT)
+
+CHUNK_SIZE = 1024 * 1024
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))              # 0 = extract pages sequentially
+PDF_BATCH_PAGES = int(os.getenv("PDF_BATCH_PAGES", "32"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+
+class Extracted(NamedTuple):
+    chars: int                      # characters written to the output
+    has_text: bool                  # whether any non-whitespace text was found
+    pages: List[Tuple[int, int]]    # [start, end) character range of each page
+
+
+def spool(src: BinaryIO, path: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """Copy an upload stream to `path` in chunks; returns the byte count"""
+    src.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(src, out, chunk_size)
+        return out.tell()
+
+
+def iter_text(path: str, content_type: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield the text of a spooled upload one page (or chunk) at a time"""
+    if content_type == PDF:
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            for page in reader.pages:
+                yield page.extract_text() or ""
+    elif content_type == DOCX:
+        # docx2txt parses document.xml in one go; DOCX text is small next to PDF bundles
+        yield docx2txt.process(path)
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                yield decoder.decode(block)
+            yield decoder.decode(b"", final=True)
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Process pool worker: text of pages [start, stop) of a PDF"""
+    with open(path, "rb") as f:
+        reader = PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: forking a threaded server process is not safe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def iter_pdf_pages_parallel(path: str, workers: int, batch_pages: int,
+                            page_count: Optional[int] = None) -> Iterator[str]:
+    """Yield PDF page texts in order, extracting page batches on a process pool"""
+    if page_count is None:
+        page_count = _pdf_page_count(path)
+    batch_pages = max(1, batch_pages)
+    pool = _get_pool(workers)
+    ranges = [(start, min(start + batch_pages, page_count)) for start in range(0, page_count, batch_pages)]
+    window = workers * 2
+    pending = [pool.submit(_extract_page_range, path, a, b) for a, b in ranges[:window]]
+    next_range = len(pending)
+    while pending:
+        texts = pending.pop(0).result()
+        if next_range < len(ranges):
+            a, b = ranges[next_range]
+            pending.append(pool.submit(_extract_page_range, path, a, b))
+            next_range += 1
+        yield from texts
+
+
+def extract_to_file(path: str, content_type: str, out_path: str,
+                    workers: int = PDF_WORKERS, batch_pages: int = PDF_BATCH_PAGES,
+                    parallel_min_pages: int = PDF_PARALLEL_MIN_PAGES) -> Extracted:
+    """
+    Write the text of a spooled upload to `out_path` as it is extracted.
+    PDF pages are separated by newlines; PDFs with at least
+    `parallel_min_pages` pages are extracted on `workers` processes when
+    workers > 1.
+    """
+    pieces = None
+    if content_type == PDF and workers > 1:
+        page_count = _pdf_page_count(path)
+        if page_count >= parallel_min_pages:
+            pieces = iter_pdf_pages_parallel(path, workers, batch_pages, page_count)
+    if pieces is None:
+        pieces = iter_text(path, content_type)
+
+    written, has_text, pages = 0, False, []
+    separator = "\n" if content_type == PDF else ""
+    with open(out_path, "w", encoding="utf-8") as out:
+        for i, piece in enumerate(pieces):
+            if i and separator:
+                out.write(separator)
+                written += len(separator)
+            out.write(piece)
+            pages.append((written, written + len(piece)))
+            written += len(piece)
+            has_text = has_text or bool(piece.strip())
+    if content_type != PDF:
+        # chunks of a text file are not pages
+        pages = [(0, written)]
+    return Extracted(written, has_text, pages)
+
+
+def pages_path(out_path: str) -> str:
+    return os.path.splitext(out_path)[0] + ".pages.json"
+
+
+def load_pages(out_path: str) -> List[Tuple[int, int]]:
+    """Page character ranges recorded for an extracted text file ([] if none)"""
+    try:
+        with open(pages_path(out_path), encoding="utf-8") as f:
+            return [tuple(p) for p in json.load(f)]
+    except (OSError, ValueError):
+        return []
+
+
+def page_of(pages: List[Tuple[int, int]], offset: int) -> Optional[int]:
+    """1-based page number containing a character offset of the extracted text"""
+    i = bisect_right([start for start, _ in pages], offset) - 1
+    return i + 1 if i >= 0 else None
+
+
+def ingest_file(path: str, content_type: str, out_path: str, sidecar: bool = True) -> Extracted:
+    """
+    Extract the text of a file on disk to `out_path`, with page offsets
+    alongside unless `sidecar` is False (callers that keep them elsewhere use
+    the returned pages). Outputs are removed if extraction fails.
+    """
+    start = time.perf_counter()
+    try:
+        result = extract_to_file(path, content_type, out_path)
+        if sidecar:
+            with open(pages_path(out_path), "w", encoding="utf-8") as f:
+                json.dump(result.pages, f)
+    except Exception:
+        metrics.INGEST_ERRORS.inc(1, content_type)
+        for p in (out_path, pages_path(out_path)):
+            if os.path.exists(p):
+                os.remove(p)
+        raise
+    metrics.INGEST_SECONDS.observe(time.perf_counter() - start, content_type)
+    metrics.INGEST_BYTES.inc(os.path.getsize(path), content_type)
+    return result
+
+
+def ingest_upload(src: BinaryIO, content_type: str, spool_path: str, out_path: str,
+                  sidecar: bool = True) -> Tuple[int, Extracted]:
+    """
+    Spool an upload stream to disk and extract its text to `out_path`.
+    Returns (upload size in bytes, the extraction result). The spool file is
+    always removed; outputs are removed if extraction fails.
+    """
+    try:
+        size = spool(src, spool_path)
+        return size, ingest_file(spool_path, content_type, out_path, sidecar)
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
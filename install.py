@@ -37,7 +37,8 @@ def install_core_packages():
         "python-multipart",
         "PyPDF2",
         "docx2txt",
-        "requests"
+        "requests",
+        "httpx"
     ]
     
     for package in core_packages:
@@ -0,0 +1,177 @@
+"""
+Persistent job queue for document processing.
+
+Jobs live in the `jobs` table of legal_lens.db (created by a migration, see
+db.py), so queued and in-flight work survives a server restart. Queue
+operations are short transactions on the shared `Database`; the workers run
+them on its thread pool. A fixed number of asyncio workers claim jobs one at a
+time and hand the file id, and whether a full rerun was asked for (see
+`enqueue`), to a handler coroutine; the CPU and network heavy stage work
+already runs on worker threads (see stages.py), so the workers only
+coordinate and never block the event loop for long.
+"""
+import asyncio
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from db import Database
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobQueue:
+    """Durable FIFO of file ids, drained by `workers` concurrent workers."""
+
+    def __init__(self, db: Database, handler: Callable[[str, bool], Awaitable[None]],
+                 workers: int = 2, poll_interval: float = 2.0, max_interruptions: int = 3):
+        self.db = db
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        # a job whose run was cut short by this many restarts is given up on;
+        # a job whose handler raises fails at once and is not retried
+        self.max_interruptions = max_interruptions
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def enqueue(self, file_id: str, full: bool = False) -> Dict:
+        """
+        Queue a file for processing; returns the already active job if there
+        is one. `full` asks the handler to run every stage, ignoring cached and
+        previously stored results.
+        """
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE file_id = ? AND status IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+                (file_id, *ACTIVE_STATES)
+            ).fetchone()
+            if row is None:
+                job_id = str(uuid.uuid4())
+                conn.execute("INSERT INTO jobs (id, file_id, full) VALUES (?, ?, ?)", (job_id, file_id, int(full)))
+                conn.execute("UPDATE files SET status = 'queued' WHERE id = ?", (file_id,))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            elif full and not row["full"]:
+                conn.execute("UPDATE jobs SET full = 1 WHERE id = ?", (row["id"],))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        self._wake()
+        return dict(row)
+
+    def enqueue_many(self, file_ids: List[str], full: bool = False) -> int:
+        """Queue many files in one transaction, skipping those with an active job; returns how many were queued"""
+        with self.db.transaction(immediate=True) as conn:
+            active = {row[0] for row in conn.execute(
+                "SELECT file_id FROM jobs WHERE status IN (?, ?)", ACTIVE_STATES
+            )}
+            queued = [fid for fid in dict.fromkeys(file_ids) if fid not in active]
+            conn.executemany("INSERT INTO jobs (id, file_id, full) VALUES (?, ?, ?)",
+                             [(str(uuid.uuid4()), fid, int(full)) for fid in queued])
+            conn.executemany("UPDATE files SET status = 'queued' WHERE id = ?", [(fid,) for fid in queued])
+
+        if queued:
+            self._wake()
+        return len(queued)
+
+    def _wake(self):
+        """Wake idle workers; enqueue runs on worker threads, and asyncio.Event is not thread-safe"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self.db.fetchone("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(row) if row else None
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self.db.fetchone("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")[0]
+
+    def recover(self) -> int:
+        """
+        Requeue work orphaned by a restart: jobs left `running`, and files left
+        `queued`/`processing` without an active job. Jobs whose run has now
+        been interrupted `max_interruptions` times are marked as errors instead.
+        """
+        with self.db.transaction(immediate=True) as conn:
+            gave_up = conn.execute(
+                "SELECT id, file_id FROM jobs WHERE status = 'running' AND attempts >= ?",
+                (self.max_interruptions,)
+            ).fetchall()
+            for job_id, file_id in gave_up:
+                conn.execute('''
+                    UPDATE jobs SET status = 'error', error = 'Interrupted too many times',
+                                    finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (job_id,))
+                conn.execute("UPDATE files SET status = 'error' WHERE id = ?", (file_id,))
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+            orphans = conn.execute('''
+                SELECT id FROM files
+                WHERE status IN ('queued', 'processing')
+                  AND id NOT IN (SELECT file_id FROM jobs WHERE status IN (?, ?))
+            ''', ACTIVE_STATES).fetchall()
+            for (file_id,) in orphans:
+                conn.execute("INSERT INTO jobs (id, file_id) VALUES (?, ?)", (str(uuid.uuid4()), file_id))
+            conn.execute('''
+                UPDATE files SET status = 'queued'
+                WHERE id IN (SELECT file_id FROM jobs WHERE status = 'queued')
+            ''')
+            return requeued + len(orphans)
+
+    def _claim(self) -> Optional[Dict]:
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('''
+                UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                started_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (row["id"],))
+            return dict(row)
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None):
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, error, job_id))
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await self.db.run(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.handler(job["file_id"], bool(job["full"]))
+            except asyncio.CancelledError:
+                # Shutting down: leave the job `running` so recover() requeues it
+                raise
+            except Exception as e:
+                await self.db.run(self._finish, job["id"], "error", str(e))
+            else:
+                await self.db.run(self._finish, job["id"], "done")
+
+    async def start(self):
+        """Recover orphaned work and start the worker pool"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self.db.run(self.recover)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
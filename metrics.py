@@ -0,0 +1,185 @@
+"""
+Prometheus metrics for GET /metrics, in the text exposition format.
+
+Hot paths only touch in-memory counters: observing a histogram is one
+bisect and two additions under the metric's lock, so instrumenting a stage,
+an ingest or a database call costs about a microsecond and nothing else
+happens until a scrape. Values that take work to read (queue depth from the
+jobs table, the LLM client's and WebSocket manager's own counters) are
+registered as callbacks and only evaluated while rendering a scrape.
+
+Metrics are per process; with several uvicorn workers each one is scraped
+separately (or its series summed).
+"""
+import math, threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+# seconds; stages range from milliseconds (next steps) to minutes (long summaries)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+Labels = Tuple[str, ...]
+Samples = Union[float, Dict[Labels, float]]
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Labels, list] = {}     # labels -> [per-bucket counts + overflow, sum]
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, list(counts), total) for k, (counts, total) in self.series.items())
+        lines = self.header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Callback(Metric):
+    """A gauge or counter read from elsewhere at scrape time: `read()` returns a number or {labels: number}"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Samples], labels: Sequence[str] = (),
+                 kind: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.read = read
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_number(v)}"
+            for k, v in sorted(values.items()) if v is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, read: Callable[[], Samples], labels: Sequence[str] = (),
+                 kind: str = "gauge") -> Callback:
+        return self.register(Callback(name, help, read, labels, kind))
+
+    def render(self) -> str:
+        """The exposition text; a callback that fails is skipped rather than failing the scrape"""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines += metric.render()
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "legal_lens_stage_seconds", "Pipeline stage run time", ["stage"])
+STAGE_REUSED = REGISTRY.counter(
+    "legal_lens_stage_reused_total", "Stage outputs reused on reprocessing because their inputs were unchanged",
+    ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "legal_lens_stage_errors_total", "Pipeline stage failures", ["stage"])
+JOB_SECONDS = REGISTRY.histogram(
+    "legal_lens_job_seconds", "Processing job time, by outcome (done, cached, reused, error)", ["outcome"])
+INGEST_BYTES = REGISTRY.counter(
+    "legal_lens_ingest_bytes_total", "Bytes of uploaded documents extracted", ["content_type"])
+INGEST_SECONDS = REGISTRY.histogram(
+    "legal_lens_ingest_seconds", "Text extraction time per document", ["content_type"])
+INGEST_ERRORS = REGISTRY.counter(
+    "legal_lens_ingest_errors_total", "Documents whose text extraction failed", ["content_type"])
+LLM_SECONDS = REGISTRY.histogram(
+    "legal_lens_llm_request_seconds", "LLM call time including retries and backoff", ["outcome"])
+DB_SECONDS = REGISTRY.histogram(
+    "legal_lens_sqlite_seconds", "Time spent running database work on the SQLite thread pool, by function",
+    ["op"], FAST_BUCKETS)
+DB_WAIT_SECONDS = REGISTRY.histogram(
+    "legal_lens_sqlite_wait_seconds", "Time database work waited for a free SQLite thread", buckets=FAST_BUCKETS)
+WS_FANOUT_SECONDS = REGISTRY.histogram(
+    "legal_lens_ws_fanout_seconds", "Time to queue one event for every WebSocket subscriber", buckets=FAST_BUCKETS)
@@ -0,0 +1,189 @@
+"""
+Near-duplicate detection with MinHash and locality-sensitive hashing.
+
+The result cache only matches identical text, but many uploads are lightly
+edited versions of the same contract or notice. Each upload gets a MinHash
+signature over its word 5-gram shingles, so the share of equal signature
+slots estimates the Jaccard similarity of two documents' shingle sets. The
+signature is cut into bands whose hashes go in `lsh_buckets`: documents
+sharing any band are candidates, and with 32 bands of 4 rows a pair at 0.6
+similarity becomes one 99% of the time (87% at 0.5, 5% at 0.2). Candidates
+are then compared on their full signatures.
+
+Signatures are computed at upload, streaming the extracted text a block at a
+time (see signature_chunks), and stored with the file (files.minhash);
+a trigger drops a file's buckets when it is deleted (see db.py). Files from
+before then are signed with
+
+    python neardup.py backfill
+"""
+import argparse, difflib, hashlib, itertools, os, re, sqlite3, zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from cache import normalize
+
+NUM_PERM = 128
+BANDS, ROWS = 32, 4                 # BANDS * ROWS == NUM_PERM
+SHINGLE_WORDS = 5
+MAX_CANDIDATES = 1000               # bucket-mates compared exactly per lookup
+NEAR_DUP_REUSE = float(os.getenv("NEAR_DUP_REUSE", "0"))    # similarity to reuse results at; 0 = never
+MAX_DIFF_CHANGES = 20
+MAX_PENDING = 64 * 1024             # longest token carried between pieces
+
+_PRIME = (1 << 32) + 15             # smallest prime above 2^32
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+_word = re.compile(r"\w+")
+
+
+def _update(mins: np.ndarray, hashes: np.ndarray, chunk: int):
+    for i in range(0, len(hashes), chunk):
+        # a * x + b < 2^64 for 32-bit a, b and x, so uint64 never wraps
+        permuted = (hashes[i:i + chunk, None] * _A + _B) % _PRIME
+        np.minimum(mins, permuted.min(axis=0), out=mins)
+
+
+def _hashes(shingles) -> np.ndarray:
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def signature_chunks(pieces: Iterable[str], chunk: int = 8192) -> Optional[bytes]:
+    """
+    signature() of the concatenated `pieces`, e.g. a text read block by block,
+    holding one piece at a time instead of the whole text
+    """
+    mins = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    carry: List[str] = []           # the last words, which start shingles ending in the next piece
+    pending = ""                    # a token the piece boundary may have cut
+    total = 0
+    for piece in itertools.chain(pieces, [None]):
+        if piece is None:
+            text, pending = pending, ""
+        else:
+            text = pending + piece
+            tail = "" if not text or text[-1].isspace() else text.rsplit(None, 1)[-1]
+            text, pending = text[:len(text) - len(tail)], tail
+            if len(pending) > MAX_PENDING:
+                text, pending = text + pending, ""
+        new = _word.findall(normalize(text).lower())
+        total += len(new)
+        words = carry + new
+        if len(words) >= SHINGLE_WORDS:
+            _update(mins, _hashes({" ".join(words[i:i + SHINGLE_WORDS])
+                                   for i in range(len(words) - SHINGLE_WORDS + 1)}), chunk)
+            carry = words[-(SHINGLE_WORDS - 1):]
+        else:
+            carry = words
+    if not total:
+        return None
+    if total < SHINGLE_WORDS:
+        _update(mins, _hashes({" ".join(carry)}), chunk)
+    return (mins & 0xFFFFFFFF).astype("<u4").tobytes()
+
+
+def signature(text: str, chunk: int = 8192) -> Optional[bytes]:
+    """MinHash signature (NUM_PERM little-endian uint32s), None for a text without words"""
+    return signature_chunks([text], chunk)
+
+
+def bands(sig: bytes) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs of a signature; buckets are signed 64-bit for SQLite"""
+    width = len(sig) // BANDS
+    return [
+        (band, int.from_bytes(hashlib.blake2b(sig[band * width:(band + 1) * width], digest_size=8).digest(),
+                              "little", signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(np.frombuffer(a, dtype="<u4") == np.frombuffer(b, dtype="<u4")))
+
+
+def index(conn: sqlite3.Connection, fid: str, sig: Optional[bytes]):
+    """Record a file's LSH buckets; call in the transaction inserting the file"""
+    if sig is not None:
+        conn.executemany(
+            "INSERT OR IGNORE INTO lsh_buckets (band, bucket, file_id) VALUES (?, ?, ?)",
+            [(band, bucket, fid) for band, bucket in bands(sig)]
+        )
+
+
+def similar(conn: sqlite3.Connection, sig: bytes, threshold: float = 0.5, limit: int = 10,
+            exclude: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+    """Files whose estimated similarity to `sig` is at least `threshold`, most similar first"""
+    pairs = bands(sig)
+    candidates = conn.execute(f'''
+        SELECT DISTINCT file_id FROM lsh_buckets
+        WHERE {" OR ".join(["(band = ? AND bucket = ?)"] * len(pairs))}
+        LIMIT ?
+    ''', [v for pair in pairs for v in pair] + [MAX_CANDIDATES + 1]).fetchall()
+    ids = [row[0] for row in candidates if row[0] != exclude]
+    if not ids:
+        return []
+    where, params = [f"id IN ({', '.join('?' * len(ids))})"], list(ids)
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    matches = []
+    for row in conn.execute(f'''
+        SELECT id, original_name, status, uploaded_at, minhash FROM files WHERE {" AND ".join(where)}
+    ''', params):
+        score = similarity(sig, row[4])
+        if score >= threshold:
+            matches.append({"id": row[0], "name": row[1], "status": row[2],
+                            "uploaded_at": row[3], "similarity": round(score, 3)})
+    matches.sort(key=lambda m: (-m["similarity"], m["id"]))
+    return matches[:limit]
+
+
+def changes(old: str, new: str, limit: int = MAX_DIFF_CHANGES, width: int = 200) -> List[Dict]:
+    """Line-level differences from `old` to `new`, the first `limit` of them, each side cut to `width`"""
+    a, b = old.splitlines(), new.splitlines()
+    out = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+        if tag == "equal":
+            continue
+        out.append({
+            "type": tag,
+            "line": j1 + 1,
+            "before": "\n".join(a[i1:i2])[:width],
+            "after": "\n".join(b[j1:j2])[:width],
+        })
+        if len(out) >= limit:
+            break
+    return out
+
+
+def backfill(database, load_text, batch: int = 200) -> int:
+    """Sign and bucket every file that has no signature yet; returns the count"""
+    signed, last = 0, ""
+    while True:
+        ids = [row[0] for row in database.fetchall(
+            "SELECT id FROM files WHERE minhash IS NULL AND id > ? ORDER BY id LIMIT ?", (last, batch)
+        )]
+        if not ids:
+            return signed
+        last = ids[-1]
+        signatures = [(fid, signature(text)) for fid in ids if (text := load_text(fid)) is not None]
+        with database.transaction(immediate=True) as conn:
+            for fid, sig in signatures:
+                if sig is not None:
+                    conn.execute("UPDATE files SET minhash = ? WHERE id = ?", (sig, fid))
+                    index(conn, fid, sig)
+                    signed += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate index maintenance")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    import glue
+    try:
+        print(f"signed {backfill(glue.db, glue.load_text)} files")
+    finally:
+        glue.db.close()
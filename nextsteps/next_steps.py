@@ -1,11 +1,17 @@
-import spacy, re, json, sys
+import re, json, sys
+from extraction import analysis
 
-nlp = spacy.load("en_core_web_sm")
 date_pat = re.compile(r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b")
 
+def load():
+    analysis.load()
+
+def version():
+    return analysis.version()
+
 def parse(text: str):
     dates = sorted(set(date_pat.findall(text)))
-    entities = [(ent.text, ent.label_) for ent in nlp(text).ents]
+    entities = analysis.analyse(text).entities
     return {"deadlines": dates, "entities": entities}
 
 if __name__ == "__main__":
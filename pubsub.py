@@ -0,0 +1,207 @@
+"""
+Topic-based fan-out of pipeline events to WebSocket clients.
+
+Clients subscribe to topics such as "file:<id>" (one document) or
+"user:<id>" (everything uploaded by one user); "*" receives every event.
+Events carry summary content, so `authorize` decides which topics a client
+may join before it subscribes: its own user topic, files it uploaded, and
+"*" only where explicitly allowed.
+Publishing only enqueues: each client has its own bounded queue drained by a
+writer task, so one slow socket never stalls the pipeline or other clients.
+Events published with a coalescing key replace a still-unsent event with the
+same key (a newer progress update or partial summary supersedes the old one).
+A client whose queue is still full after coalescing is disconnected with
+code 1013 and is expected to reconnect and re-fetch state over HTTP.
+"""
+import asyncio, sqlite3, time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+import metrics
+
+ALL = "*"
+QUEUED, COALESCED, OVERFLOW = "queued", "coalesced", "overflow"
+
+
+def authorize(conn: sqlite3.Connection, user: Optional[str], topics: Iterable[str],
+              allow_all: bool = False) -> Tuple[List[str], List[str]]:
+    """
+    Split `topics` into those `user` may receive and those refused:
+    "user:<user>" itself, "file:<id>" for files `user` uploaded (files.owner),
+    and "*" only with `allow_all`. Anything else, including every topic for
+    an anonymous client, is refused.
+    """
+    topics = list(dict.fromkeys(t for t in topics if t))
+    owned: Set[str] = set()
+    file_ids = [t[len("file:"):] for t in topics if t.startswith("file:")]
+    if user and file_ids:
+        owned = {row[0] for row in conn.execute(
+            f"SELECT id FROM files WHERE owner = ? AND id IN ({', '.join('?' * len(file_ids))})",
+            [user] + file_ids
+        )}
+    allowed, refused = [], []
+    for topic in topics:
+        if topic == ALL:
+            ok = allow_all
+        elif topic.startswith("user:"):
+            ok = bool(user) and topic[len("user:"):] == user
+        elif topic.startswith("file:"):
+            ok = topic[len("file:"):] in owned
+        else:
+            ok = False
+        (allowed if ok else refused).append(topic)
+    return allowed, refused
+
+
+class Subscriber:
+    def __init__(self, websocket: WebSocket, max_pending: int):
+        self.websocket = websocket
+        self.max_pending = max(1, max_pending)
+        self.topics: Set[str] = set()
+        self.pending: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self._seq = 0
+
+    def offer(self, message: str, key: Optional[Hashable] = None) -> str:
+        if key is not None and key in self.pending:
+            self.pending[key] = message
+            return COALESCED
+        if len(self.pending) >= self.max_pending:
+            return OVERFLOW
+        if key is None:
+            self._seq += 1
+            key = (None, self._seq)
+        self.pending[key] = message
+        self.ready.set()
+        return QUEUED
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            while self.pending:
+                _, message = self.pending.popitem(last=False)
+                await self.websocket.send_text(message)
+            self.ready.clear()
+
+
+class ConnectionManager:
+    def __init__(self, max_pending: int = 256, max_topics: int = 256):
+        self.max_pending = max_pending
+        self.max_topics = max_topics
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.topics: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.subscribers)
+
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = ()) -> Subscriber:
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.max_pending)
+        self.subscribers[websocket] = subscriber
+        subscriber.writer = asyncio.create_task(self._write(subscriber))
+        self.subscribe(websocket, topics)
+        return subscriber
+
+    async def _write(self, subscriber: Subscriber):
+        try:
+            await subscriber.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket went away mid-send; the receive loop sees the disconnect too
+            self.disconnect(subscriber.websocket)
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        for topic in subscriber.topics:
+            members = self.topics.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self.topics[topic]
+        subscriber.pending.clear()
+        if subscriber.writer is not None and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return []
+        for topic in topics:
+            if len(subscriber.topics) >= self.max_topics:
+                break
+            if topic and topic not in subscriber.topics:
+                subscriber.topics.add(topic)
+                self.topics.setdefault(topic, set()).add(subscriber)
+        return sorted(subscriber.topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return []
+        for topic in topics:
+            if topic in subscriber.topics:
+                subscriber.topics.discard(topic)
+                members = self.topics.get(topic)
+                if members is not None:
+                    members.discard(subscriber)
+                    if not members:
+                        del self.topics[topic]
+        return sorted(subscriber.topics)
+
+    def publish(self, topics: Iterable[str], message: str, key: Optional[Hashable] = None) -> int:
+        """Queue `message` for every subscriber of any of `topics`; returns the recipient count"""
+        start = time.perf_counter()
+        targets: Set[Subscriber] = set(self.topics.get(ALL, ()))
+        for topic in topics:
+            targets.update(self.topics.get(topic, ()))
+
+        self.published += 1
+        overflowed = []
+        for subscriber in targets:
+            result = subscriber.offer(message, key)
+            if result == OVERFLOW:
+                overflowed.append(subscriber)
+            elif result == COALESCED:
+                self.coalesced += 1
+            else:
+                self.delivered += 1
+
+        for subscriber in overflowed:
+            self.dropped += 1
+            self.disconnect(subscriber.websocket)
+            asyncio.create_task(self._close(subscriber.websocket, 1013))
+        metrics.WS_FANOUT_SECONDS.observe(time.perf_counter() - start)
+        return len(targets) - len(overflowed)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None:
+            subscriber.offer(message)
+
+    def stats(self) -> Dict:
+        return {
+            "clients": len(self.subscribers),
+            "topics": len(self.topics),
+            "queued": sum(len(s.pending) for s in self.subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Full-text search over documents, key facts and summaries (SQLite FTS5).
+
+`search_docs` holds one row per processed file: its name, the digest of its
+extracted text, and its key facts and lawyer and citizen summaries flattened
+to plain text. The text itself is in `search_text`, once per distinct text
+however many files share it. `search_index` is an FTS5 index over the two
+joined (external content through the `search_content` view, kept in step by
+triggers, see db.py), and snippets are read back from them for the returned
+page only. Files are indexed in the transaction that stores their results,
+dropped when their results are reset for reprocessing, and removed by a
+trigger when they are deleted.
+
+Snippets need the plain text, so `search_text` is a second, uncompressed
+copy of every distinct processed text next to the compressed blob store
+(ingest/blobstore.py): the database grows by the extracted text's size, and
+the index by about one and a half times that again.
+
+Queries are plain words, "quoted phrases" and prefix* terms, all of which
+must match; results are ranked by BM25 with the name weighted highest.
+Ranking scores every match, so a term found in nearly every document costs
+about 250 ms at 100k documents, while selective queries and sort="recent"
+stay in single-digit to low double-digit milliseconds (measured with
+bench_search.py on synthetic 600-word judgments).
+
+    python search.py rebuild        # re-index every processed file
+    python search.py "section 138" --limit 5
+"""
+import argparse, hashlib, html, json, re, sqlite3, sys, time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+FIELDS = ("name", "text", "facts", "summaries")
+WEIGHTS = (10.0, 1.0, 3.0, 2.0)     # bm25 column weights, in FIELDS order
+SNIPPET_TOKENS = 24
+REBUILD_BATCH = 200
+_open, _close = "\x02", "\x03"      # highlight markers, turned into <mark> after escaping
+_token = re.compile(r'"[^"]*"|\S+')
+
+
+def flatten(value: Any) -> str:
+    """Every string and number in a stored result, one per line"""
+    if isinstance(value, dict):
+        return "\n".join(filter(None, (flatten(v) for k, v in value.items() if k != "error")))
+    if isinstance(value, list):
+        return "\n".join(filter(None, (flatten(v) for v in value)))
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value)
+    return ""
+
+
+def index_document(conn: sqlite3.Connection, fid: str, text: str, results: Dict):
+    """Add or refresh a processed file; call inside the transaction storing its results"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    conn.execute("INSERT INTO search_text (digest, text) VALUES (?, ?) ON CONFLICT DO NOTHING", (digest, text))
+    conn.execute('''
+        INSERT INTO search_docs (file_id, name, text_digest, facts, summaries)
+        VALUES (?, (SELECT original_name FROM files WHERE id = ?), ?, ?, ?)
+        ON CONFLICT (file_id) DO UPDATE SET
+            name = excluded.name, text_digest = excluded.text_digest,
+            facts = excluded.facts, summaries = excluded.summaries
+    ''', (
+        fid, fid, digest,
+        flatten(results.get("facts")),
+        "\n".join(filter(None, (flatten(results.get("lawyer")), flatten(results.get("citizen"))))),
+    ))
+
+
+def remove_document(conn: sqlite3.Connection, fid: str):
+    conn.execute("DELETE FROM search_docs WHERE file_id = ?", (fid,))
+
+
+def match_query(q: str, fields: Sequence[str] = ()) -> str:
+    """User input -> FTS5 query: each word, "phrase" or prefix* must match"""
+    terms = []
+    for token in _token.findall(q):
+        prefix = token.endswith("*")
+        words = re.findall(r"\w+", token)
+        if not words:
+            continue
+        phrase = '"' + " ".join(words) + '"'
+        terms.append(phrase + "*" if prefix and not token.startswith('"') else phrase)
+    if not terms:
+        raise ValueError("Empty search query")
+    query = " AND ".join(terms)
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown search fields: {', '.join(unknown)}")
+    return f"{{{' '.join(fields)}}} : ({query})" if fields else query
+
+
+def marked(fragment: Optional[str]) -> Optional[str]:
+    """Escape a snippet for HTML and turn the highlight markers into <mark> tags"""
+    if fragment is None:
+        return None
+    return html.escape(fragment).replace(_open, "<mark>").replace(_close, "</mark>")
+
+
+def search(conn: sqlite3.Connection, q: str, limit: int, after: Optional[Tuple[Optional[float], int]] = None,
+           fields: Sequence[str] = (), sort: str = "rank") -> Tuple[List[Dict], Optional[Tuple[Optional[float], int]]]:
+    """
+    One page of matches, best first (or most recently indexed first with
+    sort="recent"), and the (rank, rowid) to continue after, None on the
+    last page.
+    """
+    query = match_query(q, fields)
+    where, params = ["search_index MATCH ?"], [query]
+    if sort == "recent":
+        # rowid order is read straight off the index: no scoring, constant time
+        order = "rowid DESC"
+        if after:
+            where.append("rowid < ?")
+            params.append(after[1])
+    elif sort == "rank":
+        order = "rank, rowid"
+        where.append(f"rank MATCH 'bm25({', '.join(map(str, WEIGHTS))})'")
+        if after:
+            where.append("(rank > ? OR (rank = ? AND rowid > ?))")
+            params += [after[0], after[0], after[1]]
+    else:
+        raise ValueError(f"Unknown sort: {sort}")
+
+    # Rank on the index alone, then build snippets for just this page
+    ranked = conn.execute(f'''
+        SELECT rowid, rank FROM search_index
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    more = len(ranked) > limit
+    ranked = ranked[:limit]
+    if not ranked:
+        return [], None
+
+    rows = {row[0]: row for row in conn.execute(f'''
+        SELECT s.rowid, d.file_id, f.status, f.uploaded_at,
+               highlight(search_index, 0, '{_open}', '{_close}'),
+               snippet(search_index, -1, '{_open}', '{_close}', '…', {SNIPPET_TOKENS})
+        FROM search_index s
+        JOIN search_docs d ON d.id = s.rowid
+        JOIN files f ON f.id = d.file_id
+        WHERE search_index MATCH ? AND s.rowid IN ({", ".join("?" * len(ranked))})
+    ''', [query] + [r[0] for r in ranked])}
+    hits = [{
+        "file_id": rows[rowid][1],
+        "name": marked(rows[rowid][4]),
+        "status": rows[rowid][2],
+        "uploaded_at": rows[rowid][3],
+        "score": round(-rank, 6) if sort == "rank" else None,
+        "snippet": marked(rows[rowid][5]),
+    } for rowid, rank in ranked if rowid in rows]
+    last = ranked[-1]
+    return hits, ((last[1] if sort == "rank" else None, last[0]) if more else None)
+
+
+def rebuild(database, load_text: Callable[[str], Optional[str]], batch: int = REBUILD_BATCH) -> int:
+    """Re-index every processed file from its stored text and results; returns the count"""
+    from glue import RESULT_COLUMNS, results_from_row
+
+    indexed, last = 0, ""
+    while True:
+        rows = database.fetchall(f'''
+            SELECT f.id, {RESULT_COLUMNS}
+            FROM files f JOIN results r ON r.file_id = f.id
+            WHERE f.status = 'processed' AND f.id > ?
+            ORDER BY f.id LIMIT ?
+        ''', (last, batch))
+        if not rows:
+            break
+        last = rows[-1][0]
+        docs = [(row[0], load_text(row[0]), results_from_row(tuple(row)[1:])) for row in rows]
+        with database.transaction(immediate=True) as conn:
+            for fid, text, results in docs:
+                if text is not None:
+                    index_document(conn, fid, text, results)
+                    indexed += 1
+    # entries are replaced in place, so search keeps working during a rebuild; then drop the stale ones
+    with database.transaction(immediate=True) as conn:
+        conn.execute("DELETE FROM search_docs WHERE file_id NOT IN (SELECT id FROM files WHERE status = 'processed')")
+        conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("query", help='search terms, or "rebuild" to re-index every processed file')
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--fields", nargs="*", default=[], choices=FIELDS)
+    parser.add_argument("--sort", choices=["rank", "recent"], default="rank")
+    args = parser.parse_args()
+
+    import glue
+    try:
+        if args.query == "rebuild":
+            start = time.perf_counter()
+            count = rebuild(glue.db, glue.load_text)
+            print(f"indexed {count} files in {time.perf_counter() - start:.1f}s")
+            return
+        start = time.perf_counter()
+        hits, _ = search(glue.db.connect(), args.query, args.limit, fields=args.fields, sort=args.sort)
+        print(json.dumps(hits, indent=2, ensure_ascii=False))
+        print(f"{len(hits)} hits in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        glue.db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,8 @@ def main():
         "python-multipart",
         "PyPDF2",
         "docx2txt",
-        "requests"
+        "requests",
+        "httpx"
     ]
     
     for package in core_packages:
@@ -0,0 +1,262 @@
+"""
+Resident pipeline stages for Legal Lens.
+
+Every analysis stage (classifier, fact extraction, next steps and the two
+summarisers) is imported and warmed up once per worker process, then called
+as a plain function. This replaces spawning a fresh interpreter per stage,
+which reloaded the SetFit model, spaCy and the prompt files for every document.
+
+Each stage also has a version: a hash of its module's source plus whatever
+the module's optional `version()` reports (configuration files, prompt
+templates, model names and weights). With the hash of the document text it
+fingerprints the stage's output, and a rerun with stored outputs reuses
+those whose fingerprint is unchanged (see StageExecutor.run).
+"""
+import asyncio
+import hashlib
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from cache import fingerprint
+
+# stage name -> (module, function called with the document text)
+STAGES: Dict[str, Tuple[str, str]] = {
+    "classify": ("classifier.clf_infer", "aclassify"),     # micro-batched across documents
+    "facts": ("extraction.extract", "extract"),
+    "lawyer": ("summarisers.lawyer_sum", "summarise"),
+    "citizen": ("summarisers.citizen_sum", "summarise"),
+    "next": ("nextsteps.next_steps", "parse"),
+}
+
+
+class StageRegistry:
+    """Loads every stage once and dispatches documents to them in-process."""
+
+    def __init__(self, stages: Dict[str, Tuple[str, str]] = STAGES):
+        self.stages = stages
+        self.functions: Dict[str, Callable[[str], Any]] = {}
+        self.versions: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.warmed = threading.Event()
+        self.started_at: Optional[float] = None
+        self.warmed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Import every stage module and load its model. Safe to call twice."""
+        with self._lock:
+            if self.warmed.is_set():
+                return
+            self.started_at = time.time()
+            for name, (module_name, func_name) in self.stages.items():
+                try:
+                    module = importlib.import_module(module_name)
+                    self.versions[name] = fingerprint(
+                        [module.__file__], [module.version()] if hasattr(module, "version") else []
+                    )
+                    if hasattr(module, "load"):
+                        module.load()
+                    self.functions[name] = getattr(module, func_name)
+                except Exception as e:
+                    self.errors[name] = f"{type(e).__name__}: {e}"
+            self.warmed_at = time.time()
+            self.warmed.set()
+
+    def version(self) -> str:
+        """One hash over every stage's version, e.g. to key cached results; call after warm_up()"""
+        return fingerprint([], [f"{name}={self.versions.get(name, 'unloaded')}" for name in sorted(self.stages)])
+
+    @property
+    def ready(self) -> bool:
+        """True once every stage has loaded without error."""
+        return self.warmed.is_set() and not self.errors
+
+    def status(self) -> Dict:
+        if not self.warmed.is_set():
+            state = "starting"
+        elif self.errors:
+            state = "degraded"
+        else:
+            state = "ready"
+        return {
+            "state": state,
+            "stages": {
+                name: ("error" if name in self.errors else
+                       "ready" if name in self.functions else "loading")
+                for name in self.stages
+            },
+            "errors": self.errors,
+            "versions": self.versions,
+            "warmup_seconds": (
+                round(self.warmed_at - self.started_at, 3)
+                if self.warmed_at and self.started_at else None
+            ),
+        }
+
+    def _function(self, name: str) -> Callable[[str], Any]:
+        if name not in self.functions:
+            raise RuntimeError(self.errors.get(name, f"Unknown stage: {name}"))
+        return self.functions[name]
+
+    def run(self, name: str, text: str) -> Any:
+        """Run one stage on a document, waiting for warm-up if still in progress."""
+        self.warmed.wait()
+        fn = self._function(name)
+        if asyncio.iscoroutinefunction(fn):
+            return asyncio.run(fn(text))
+        return fn(text)
+
+    async def arun(self, name: str, text: str) -> Any:
+        """
+        Async counterpart of run(): coroutine stages (the summarisers, and the
+        micro-batched classifier, which offloads its own batches) are awaited
+        on the event loop, other CPU-bound ones are moved to a worker thread.
+        """
+        if not self.warmed.is_set():
+            await asyncio.to_thread(self.warmed.wait)
+        fn = self._function(name)
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(text)
+        return await asyncio.to_thread(fn, text)
+
+
+registry = StageRegistry()
+
+
+# stage name -> stages whose output it waits for. "classify" gates the rest:
+# a falsy result (not a legal document) skips every stage that depends on it.
+DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "classify": (),
+    "facts": ("classify",),
+    "lawyer": ("classify",),
+    "citizen": ("classify",),
+    "next": ("classify",),
+}
+GATES = {"classify"}
+
+# stage name -> (progress step, message while running, message when done)
+LABELS: Dict[str, Tuple[str, str, str]] = {
+    "classify": ("classifying", "Classifying document...", "Document classified"),
+    "facts": ("extracting_facts", "Extracting key facts...", "Key facts extracted"),
+    "lawyer": ("generating_lawyer_summary", "Generating legal analysis...", "Legal analysis ready"),
+    "citizen": ("generating_citizen_summary", "Generating citizen summary...", "Citizen summary ready"),
+    "next": ("extracting_next_steps", "Extracting next steps...", "Next steps extracted"),
+}
+
+
+class PipelineOutcome:
+    """Per-stage results of one pipeline run."""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.skipped: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}     # seconds per stage that ran
+        self.fingerprints: Dict[str, str] = {}  # per stage that ran or was reused without error
+        self.reused: List[str] = []
+
+
+class StageExecutor:
+    """
+    Runs the stage DAG for one document. Every stage whose dependencies are
+    satisfied is started at once (see StageRegistry.arun), so after classification
+    the extraction, summaries and next steps overlap instead of queueing
+    behind each other. `on_event(kind, stage, progress)` is awaited when a
+    stage starts ("started") and finishes ("done", "error" or "skipped"), or
+    is reused ("reused"); progress is the percentage of stages finished so far.
+
+    `previous` maps stages to (fingerprint, output) from an earlier run on
+    the same file. A stage whose fingerprint still matches gets that output
+    back without running; the rest run as usual. Stages only read the text,
+    so dependencies decide whether a stage runs, not what it produces, and a
+    reclassified document whose label did not change keeps its summaries.
+    """
+
+    def __init__(self, registry: StageRegistry,
+                 dependencies: Dict[str, Tuple[str, ...]] = DEPENDENCIES,
+                 gates=GATES):
+        self.registry = registry
+        self.dependencies = dependencies
+        self.gates = set(gates)
+
+    def fingerprint(self, name: str, text_hash: str) -> Optional[str]:
+        """Hash of a stage's inputs: the text and the stage's version; None if it never loaded"""
+        version = self.registry.versions.get(name)
+        if version is None:
+            return None
+        return hashlib.sha256(f"{text_hash}\0{name}\0{version}".encode("utf-8")).hexdigest()[:16]
+
+    async def run(self, text: str, on_event: Optional[Callable] = None,
+                  previous: Optional[Dict[str, Tuple[str, Any]]] = None) -> PipelineOutcome:
+        outcome = PipelineOutcome()
+        previous = previous or {}
+        if not self.registry.warmed.is_set():
+            await asyncio.to_thread(self.registry.warmed.wait)
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        fingerprints = {name: self.fingerprint(name, text_hash) for name in self.dependencies}
+        waiting = dict(self.dependencies)
+        running: Dict[Any, str] = {}
+        started: Dict[str, float] = {}
+        finished = 0
+        total = len(waiting)
+
+        async def emit(kind: str, name: str):
+            if on_event is not None:
+                await on_event(kind, name, int(finished * 100 / total))
+
+        while waiting or running:
+            progressed = False
+            for name, deps in list(waiting.items()):
+                blocked = [d for d in deps if d in outcome.errors or d in outcome.skipped]
+                gated = [d for d in deps if d in self.gates and d in outcome.results
+                         and not outcome.results[d]]
+                if blocked or gated:
+                    del waiting[name]
+                    progressed = True
+                    finished += 1
+                    outcome.skipped[name] = (blocked or gated)[0]
+                    await emit("skipped", name)
+                elif all(d in outcome.results for d in deps):
+                    del waiting[name]
+                    progressed = True
+                    if fingerprints[name] is not None and previous.get(name, (None,))[0] == fingerprints[name]:
+                        finished += 1
+                        outcome.results[name] = previous[name][1]
+                        outcome.fingerprints[name] = fingerprints[name]
+                        outcome.reused.append(name)
+                        metrics.STAGE_REUSED.inc(1, name)
+                        await emit("reused", name)
+                        continue
+                    task = asyncio.ensure_future(self.registry.arun(name, text))
+                    running[task] = name
+                    started[name] = time.perf_counter()
+                    await emit("started", name)
+
+            if not running:
+                if not progressed:
+                    raise ValueError(f"Unsatisfiable stage dependencies: {sorted(waiting)}")
+                continue
+
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                outcome.timings[name] = time.perf_counter() - started[name]
+                metrics.STAGE_SECONDS.observe(outcome.timings[name], name)
+                finished += 1
+                try:
+                    outcome.results[name] = task.result()
+                    if fingerprints[name] is not None:
+                        outcome.fingerprints[name] = fingerprints[name]
+                    await emit("done", name)
+                except Exception as e:
+                    outcome.errors[name] = e
+                    metrics.STAGE_ERRORS.inc(1, name)
+                    await emit("error", name)
+
+        return outcome
+
+
+executor = StageExecutor(registry)
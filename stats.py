@@ -0,0 +1,85 @@
+"""
+Figures for /stats that do not depend on the size of the corpus.
+
+File counts and bytes per status, per content type and in total are read
+from the `file_stats` table, which triggers on `files` keep current in the
+same transaction as every insert, status change and delete (see migration 5
+in db.py); answering reads a handful of rows however many files there are.
+Pipeline throughput and latency percentiles come from an in-memory window of
+recent jobs and stage runs in this process.
+"""
+import sqlite3, threading, time
+from collections import deque
+from typing import Deque, Dict, Iterable, Tuple
+
+import metrics
+
+
+def file_counters(conn: sqlite3.Connection) -> Dict:
+    counters = {"total": {"files": 0, "bytes": 0}, "by_status": {}, "by_content_type": {}}
+    for dimension, value, files, size in conn.execute(
+        "SELECT dimension, value, files, bytes FROM file_stats WHERE files != 0"
+    ):
+        entry = {"files": files, "bytes": size}
+        if dimension == "total":
+            counters["total"] = entry
+        elif dimension == "status":
+            counters["by_status"][value or "unknown"] = entry
+        elif dimension == "content_type":
+            counters["by_content_type"][value or "unknown"] = entry
+    return counters
+
+
+def percentiles(values: Iterable[float]) -> Dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0, "p50_s": None, "p95_s": None, "p99_s": None, "max_s": None}
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {"count": len(ordered), "p50_s": pct(0.50), "p95_s": pct(0.95),
+            "p99_s": pct(0.99), "max_s": round(ordered[-1], 3)}
+
+
+class PipelineStats:
+    """Outcome counters and recent latencies of pipeline jobs and stages."""
+
+    def __init__(self, window: int = 1000, rate_window: float = 300.0):
+        self.window = window
+        self.rate_window = rate_window
+        self.started_at = time.time()
+        self.counts = {"done": 0, "cached": 0, "error": 0}
+        self.jobs: Deque[Tuple[float, float]] = deque(maxlen=window)   # (finished_at, seconds)
+        self.stages: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record_job(self, seconds: float, outcome: str):
+        """outcome is "done", "cached", "reused" or "error"; failed jobs do not count as throughput"""
+        metrics.JOB_SECONDS.observe(seconds, outcome)
+        with self._lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            if outcome != "error":
+                self.jobs.append((time.time(), seconds))
+
+    def record_stages(self, timings: Dict[str, float]):
+        with self._lock:
+            for stage, seconds in timings.items():
+                self.stages.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            jobs = list(self.jobs)
+            stages = {name: list(values) for name, values in self.stages.items()}
+            counts = dict(self.counts)
+        recent = [finished for finished, _ in jobs if now - finished <= self.rate_window]
+        uptime = now - self.started_at
+        completed = sum(n for outcome, n in counts.items() if outcome != "error")
+        return {
+            "jobs": counts,
+            "throughput_per_min": round(len(recent) * 60 / min(self.rate_window, uptime or 1), 2),
+            "throughput_per_min_since_start": round(completed * 60 / (uptime or 1), 2),
+            "latency": percentiles(seconds for _, seconds in jobs),
+            "stages": {name: percentiles(values) for name, values in sorted(stages.items())},
+        }
@@ -0,0 +1,214 @@
+"""
+Map-reduce summarisation for documents too long for one LLM request.
+
+The text is split into token-bounded chunks that follow the document's own
+structure: paragraphs and section headings ("JUDGMENT", "ORDER", numbered
+paragraphs, ...) are kept whole where they fit, and each chunk repeats the
+tail of the previous one so nothing is lost at a boundary. Every chunk is
+summarised concurrently with the stage's normal prompt (the LLM client's
+semaphore and rate limit still apply), then a reduce call merges the partial
+JSON objects into one object with the same keys. If the reduce call fails the
+partials are merged field by field instead. Documents that fit in one chunk
+are sent in a single request exactly as before.
+
+When the pipeline is publishing partial results (see summarisers/streaming.py)
+a single-chunk summary is streamed, and a long document publishes the running
+merge of its chunk summaries as each one completes.
+
+Token counts are estimated at ~4 characters per token; there is no tokenizer
+for the hosted model on this side.
+"""
+import asyncio, json, os, re
+from typing import Dict, List, Optional
+
+from cache import fingerprint
+from summarisers.streaming import emitter, stream_json
+from summarisers.together_client import acall_llm, client
+
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP", "300"))
+REDUCE_TOKENS = int(os.getenv("SUMMARY_REDUCE_TOKENS", "6000"))
+CHARS_PER_TOKEN = 4
+
+_heading = re.compile(
+    r"^\s*(?:[A-Z][A-Z .,'&()-]{3,}|(?:\d+|[IVXLC]+)[.)]\s+\S.*|(?:PART|CHAPTER|SECTION)\s+\S+.*)\s*$"
+)
+_sentence_end = re.compile(r"(?<=[.!?;])\s+")
+
+REDUCE_PROMPT = """The JSON objects below are analyses of consecutive parts of ONE document.
+Merge them into a single JSON object with exactly the same keys. Combine and
+de-duplicate list items, and write single consolidated values for text fields.
+Return only JSON.
+
+{{PARTS}}"""
+
+
+def version() -> str:
+    """What shapes every summary besides the stage's prompt: this module, the model and the chunk sizes"""
+    return fingerprint([__file__], [client.model, str(CHUNK_TOKENS), str(CHUNK_OVERLAP), str(REDUCE_TOKENS)])
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _units(text: str, max_tokens: int) -> List[str]:
+    """Paragraph-sized pieces, each starting a new unit at a heading, none over max_tokens"""
+    units: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines(keepends=True):
+        starts_section = bool(_heading.match(line)) or not line.strip()
+        if starts_section and current:
+            units.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        units.append("".join(current))
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    bounded: List[str] = []
+    for unit in units:
+        if len(unit) <= max_chars:
+            bounded.append(unit)
+            continue
+        # Oversized paragraph: fall back to sentences, then to a hard cut
+        piece = ""
+        for sentence in _sentence_end.split(unit):
+            while len(sentence) > max_chars:
+                if piece:
+                    bounded.append(piece)
+                    piece = ""
+                bounded.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if len(piece) + len(sentence) + 1 > max_chars:
+                bounded.append(piece)
+                piece = ""
+            piece = f"{piece} {sentence}" if piece else sentence
+        if piece:
+            bounded.append(piece)
+    return [u for u in bounded if u.strip()]
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into section-aware chunks of at most ~max_tokens that overlap by ~overlap_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    units = _units(text, max_tokens - overlap_tokens)
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if current and size + tokens > max_tokens:
+            chunks.append("".join(current))
+            # carry the trailing units of this chunk over as context
+            carried: List[str] = []
+            carried_size = 0
+            for previous in reversed(current):
+                t = estimate_tokens(previous)
+                if carried_size + t > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_size += t
+            current, size = carried, carried_size
+        current.append(unit)
+        size += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _dedupe(items: List) -> List:
+    seen, out = set(), []
+    for item in items:
+        marker = json.dumps(item, sort_keys=True) if not isinstance(item, str) else item.strip().lower()
+        if marker not in seen:
+            seen.add(marker)
+            out.append(item)
+    return out
+
+
+def merge_partials(partials: List[Dict]) -> Dict:
+    """Field-by-field merge: lists are concatenated and de-duplicated, text is joined"""
+    merged: Dict = {}
+    for partial in partials:
+        for key, value in partial.items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(merged[key], list):
+                merged[key] = _dedupe(merged[key] + (value if isinstance(value, list) else [value]))
+            elif isinstance(merged[key], str) and isinstance(value, str):
+                if value.strip() and value.strip() not in merged[key]:
+                    merged[key] = f"{merged[key]} {value}".strip()
+    return merged
+
+
+async def _reduce(system: str, partials: List[Dict]) -> Dict:
+    """Merge partial analyses with the LLM, in groups that fit the reduce budget"""
+    while len(partials) > 1:
+        groups: List[List[Dict]] = [[]]
+        size = 0
+        for partial in partials:
+            tokens = estimate_tokens(json.dumps(partial, ensure_ascii=False))
+            if groups[-1] and size + tokens > REDUCE_TOKENS:
+                groups.append([])
+                size = 0
+            groups[-1].append(partial)
+            size += tokens
+        if len(groups) == len(partials):
+            # every partial alone fills the budget; nothing more the LLM can merge
+            return merge_partials(partials)
+
+        async def reduce_group(group: List[Dict]) -> Dict:
+            if len(group) == 1:
+                return group[0]
+            parts = "\n\n".join(json.dumps(p, ensure_ascii=False) for p in group)
+            merged = json.loads(await acall_llm(system, REDUCE_PROMPT.replace("{{PARTS}}", parts)))
+            if not isinstance(merged, dict):
+                raise ValueError("reduce step did not return a JSON object")
+            return merged
+
+        partials = list(await asyncio.gather(*(reduce_group(g) for g in groups)))
+    return partials[0]
+
+
+async def summarise_document(system: str, template: str, text: str, stage: Optional[str] = None) -> Dict:
+    """
+    Summarise `text` with a {{TEXT}} prompt template, map-reducing long
+    documents. `stage` names the results for partial updates.
+    """
+    emit = emitter(stage)
+    chunks = chunk_text(text)
+    if len(chunks) == 1:
+        prompt = template.replace("{{TEXT}}", text)
+        if emit is None:
+            return json.loads(await acall_llm(system, prompt))
+        return json.loads(await stream_json(system, prompt, emit))
+
+    done: List[Dict] = []
+
+    async def summarise_chunk(i: int, chunk: str) -> Dict:
+        part = f"[Part {i + 1} of {len(chunks)} of a longer document]\n{chunk}"
+        partial = json.loads(await acall_llm(system, template.replace("{{TEXT}}", part)))
+        if emit is not None and isinstance(partial, dict):
+            done.append(partial)
+            await emit(merge_partials(done))
+        return partial
+
+    results = await asyncio.gather(*(summarise_chunk(i, c) for i, c in enumerate(chunks)),
+                                   return_exceptions=True)
+    # A summary missing a chunk would be cached and fingerprinted as current,
+    # so any failed chunk fails the stage (after the others have settled)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    partials = list(results)
+    if not all(isinstance(p, dict) for p in partials):
+        raise ValueError("a chunk summary was not a JSON object")
+
+    try:
+        return await _reduce(system, partials)
+    except Exception:
+        return merge_partials(partials)
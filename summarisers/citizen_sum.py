@@ -1,6 +1,23 @@
-import sys, json
-from together_client import call_llm
+import sys, json, os, asyncio
+from cache import fingerprint
+from summarisers import chunking
+from summarisers.chunking import summarise_document
 
 system = "You are a helpful Indian legal advisor for the public. Return only JSON."
-prompt = open("/workspace/prompts/citizen.txt", encoding="utf-8").read().replace("{{TEXT}}", sys.stdin.read())
-print(call_llm(system, prompt))
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompts", "citizen.txt")
+template = None
+
+def load():
+    global template
+    if template is None:
+        template = open(PROMPT_PATH, encoding="utf-8").read()
+
+def version():
+    return fingerprint([PROMPT_PATH], [system, chunking.version()])
+
+async def summarise(text: str) -> dict:
+    load()
+    return await summarise_document(system, template, text, stage="citizen")
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(summarise(sys.stdin.read())), ensure_ascii=False))
@@ -0,0 +1,108 @@
+"""
+Live partial summaries while the LLM is still generating.
+
+The pipeline installs a sink with `partial_sink.set(...)` before running the
+stages; summarisers that see one request a streamed completion instead of
+waiting for the whole response. The growing response text is parsed on the
+server into the best JSON object it already describes (open strings, lists
+and objects are closed, a dangling key or comma is dropped) and handed to the
+sink as `sink(stage, partial_object)`, at most every SUMMARY_STREAM_INTERVAL
+seconds and only when it changed. Clients therefore always receive valid JSON
+with the same keys as the final result, never raw token fragments.
+
+The sink lives in a context variable so it follows the pipeline's stage tasks
+without being threaded through the stage registry; CLI runs leave it unset and
+make ordinary requests.
+"""
+import json, os, time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from summarisers.together_client import astream_llm
+
+ENABLED = os.getenv("SUMMARY_STREAM", "1") != "0"
+STREAM_INTERVAL = float(os.getenv("SUMMARY_STREAM_INTERVAL", "0.25"))
+
+Sink = Callable[[str, Dict], Awaitable[None]]
+Emit = Callable[[Dict], Awaitable[None]]
+
+partial_sink: ContextVar[Optional[Sink]] = ContextVar("partial_sink", default=None)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _scan(s: str):
+    """Open containers, whether a string is open, and the cut points of a JSON prefix"""
+    stack: List[str] = []
+    cuts: List[int] = []
+    in_string = escaped = False
+    for i, ch in enumerate(s):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            cuts.append(i + 1)      # just inside the new container
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            cuts.append(i)          # before the member that follows
+    return stack, in_string, escaped, cuts
+
+
+def _close(prefix: str) -> str:
+    stack, in_string, escaped, _ = _scan(prefix)
+    if escaped:
+        prefix = prefix[:-1]
+    return prefix + ('"' if in_string else "") + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def partial_json(text: str, attempts: int = 4) -> Optional[Dict]:
+    """The JSON object described so far by an incomplete response, or None"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    s = text[start:]
+    candidates = [s] + [s[:cut] for cut in reversed(_scan(s)[3])][:attempts]
+    for candidate in candidates:
+        try:
+            value = json.loads(_close(candidate))
+        except ValueError:
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def emitter(stage: Optional[str]) -> Optional[Emit]:
+    """Callback publishing partial results of `stage`, if anyone is listening"""
+    sink = partial_sink.get()
+    if not ENABLED or sink is None or stage is None:
+        return None
+
+    async def emit(data: Dict):
+        await sink(stage, data)
+
+    return emit
+
+
+async def stream_json(system: str, user: str, emit: Emit) -> str:
+    """Streamed LLM call that emits parsed partial objects; returns the full text"""
+    last = {"at": 0.0, "data": None}
+
+    async def on_text(text: str):
+        now = time.monotonic()
+        if now - last["at"] < STREAM_INTERVAL:
+            return
+        data = partial_json(text)
+        if data and data != last["data"]:
+            last["at"], last["data"] = now, data
+            await emit(data)
+
+    return await astream_llm(system, user, on_text)
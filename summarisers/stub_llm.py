@@ -0,0 +1,97 @@
+"""
+Local stand-in for the Together chat completions endpoint.
+
+Answers every POST with a canned JSON summary, optionally after a delay and
+with every Nth request rejected with 429, so the LLM client's pooling,
+rate limiting and retries can be exercised offline. Requests with
+"stream": true get the same answer as server-sent events, a few characters
+per event, with token usage (estimated at 4 characters per token) in the last:
+
+    python -m summarisers.stub_llm --port 8089 --fail-every 3 &
+    TOGETHER_URL=http://127.0.0.1:8089/v1/chat/completions python start.py
+"""
+import argparse, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED = {
+    "summary": "Stub summary",
+    "issues": ["Stub issue"],
+    "arguments": [],
+    "precedents": [],
+    "outcome": "",
+    "risks": [],
+    "citations": [],
+}
+
+
+def make_handler(delay: float, fail_every: int, stream_delay: float = 0.01):
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with lock:
+                counter["n"] += 1
+                n = counter["n"]
+            time.sleep(delay)
+            if fail_every and n % fail_every == 0:
+                self._send(429, {"error": "rate limited"}, {"Retry-After": "0"})
+                return
+            content = json.dumps(CANNED)
+            prompt = sum(len(m.get("content", "")) for m in request.get("messages", []))
+            usage = {"prompt_tokens": prompt // 4 + 1, "completion_tokens": len(content) // 4 + 1}
+            if request.get("stream"):
+                self._stream(content, usage)
+                return
+            self._send(200, {"choices": [{"message": {"content": content}}], "usage": usage})
+
+        def _stream(self, content, usage, piece=8):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            events = [{"choices": [{"delta": {"content": content[i:i + piece]}}]}
+                      for i in range(0, len(content), piece)]
+            events[-1]["usage"] = usage
+            for event in [json.dumps(e) for e in events] + ["[DONE]"]:
+                data = f"data: {event}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                time.sleep(stream_delay)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8089, delay: float = 0.0, fail_every: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, fail_every))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub LLM server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay, args.fail_every))
+    print(f"Stub LLM listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    server.serve_forever()
@@ -1,19 +1,295 @@
-import os, requests
+"""
+Async client for the Together chat completions API.
+
+One pooled keep-alive connection set is shared by every summary, so calls
+after the first skip the TCP+TLS handshake. A global semaphore caps the calls
+in flight, a token bucket keeps us under the provider's request rate, and 429
+or 5xx responses (and dropped connections) are retried with jittered
+exponential backoff. Per-call latency, retries and failures are recorded in
+`client.metrics` (and exported at /metrics, with the token usage the
+provider reports). `stream()` requests a server-sent-events completion and
+reports the text as it grows, for live partial summaries.
+
+Point TOGETHER_URL at a local server (see summarisers/stub_llm.py) to exercise
+the client without calling the real API.
+"""
+import asyncio, json, os, random, threading, time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+import metrics as prometheus
 
 KEY = os.getenv("TOGETHER_KEY") or "YOUR_FREE_KEY"
-URL = "https://api.together.xyz/v1/chat/completions"
+URL = os.getenv("TOGETHER_URL", "https://api.together.xyz/v1/chat/completions")
+MODEL = os.getenv("TOGETHER_MODEL", "meta-llama/Llama-3.2-3B-Instruct-Turbo")
 HEAD = {"Authorization": f"Bearer {KEY}"}
 
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+RATE = float(os.getenv("LLM_RATE", "2"))          # requests per second, 0 = unlimited
+BURST = int(os.getenv("LLM_BURST", "4"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMMetrics:
+    """Counters and a window of recent call latencies."""
+
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.statuses: Dict[int, int] = {}
+        self._statuses_lock = threading.Lock()     # /metrics reads them from a worker thread
+        self.latencies = deque(maxlen=window)
+        self.first_token = deque(maxlen=window)     # streamed calls only
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        if not ok:
+            self.failures += 1
+        self.latencies.append(latency)
+        prometheus.LLM_SECONDS.observe(latency, "ok" if ok else "error")
+
+    def record_status(self, code: int):
+        with self._statuses_lock:
+            self.statuses[code] = self.statuses.get(code, 0) + 1
+
+    def status_counts(self) -> Dict[int, int]:
+        with self._statuses_lock:
+            return dict(self.statuses)
+
+    def record_usage(self, usage: Optional[Dict]):
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+
+    def snapshot(self) -> Dict:
+        ordered = sorted(self.latencies)
+        first = sorted(self.first_token)
+
+        def pct(p, values=ordered):
+            return round(values[min(len(values) - 1, int(p * len(values)))], 3) if values else None
+
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "statuses": self.status_counts(),
+            "latency_p50_s": pct(0.50),
+            "latency_p95_s": pct(0.95),
+            "latency_max_s": round(ordered[-1], 3) if ordered else None,
+            "first_token_p50_s": pct(0.50, first),
+        }
+
+
+class LLMClient:
+    def __init__(self, url: str = URL, model: str = MODEL, headers: Optional[Dict] = None,
+                 concurrency: int = CONCURRENCY, rate: float = RATE, burst: int = BURST,
+                 max_retries: int = MAX_RETRIES, timeout: float = TIMEOUT,
+                 backoff_base: float = 0.5, backoff_cap: float = 20.0):
+        self.url = url
+        self.model = model
+        self.headers = HEAD if headers is None else headers
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.metrics = LLMMetrics()
+        # httpx clients and semaphores belong to the event loop that created them
+        self._loop = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _session(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._http is not None:
+                try:
+                    await self._http.aclose()
+                except Exception:
+                    pass        # its connections may have gone with their loop
+            self._loop = loop
+            self._http = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency,
+                                    keepalive_expiry=60.0),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._http, self._semaphore
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_cap, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def payload(self, system: str, user: str) -> Dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": 0.2,
+            "max_tokens": 1000,
+        }
+
+    async def complete(self, system: str, user: str) -> str:
+        http, semaphore = await self._session()
+        payload = self.payload(system, user)
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            response = None
+            # a slot is held per attempt, not across backoff, so other calls use it meanwhile
+            async with semaphore:
+                await self.bucket.acquire()
+                try:
+                    response = await http.post(self.url, json=payload)
+                    self.metrics.record_status(response.status_code)
+                    retryable = response.status_code in RETRY_STATUSES
+                    if not retryable:
+                        response.raise_for_status()
+                        body = response.json()
+                        content = body["choices"][0]["message"]["content"]
+                        self.metrics.record_usage(body.get("usage"))
+                        self.metrics.record(time.perf_counter() - start, ok=True)
+                        return content
+                    error: Exception = httpx.HTTPStatusError(
+                        f"{response.status_code} from LLM provider", request=response.request, response=response)
+                except httpx.TransportError as e:
+                    error = e
+                except Exception:
+                    self.metrics.record(time.perf_counter() - start, ok=False)
+                    raise
+
+            if attempt >= self.max_retries:
+                self.metrics.record(time.perf_counter() - start, ok=False)
+                raise error
+            self.metrics.retries += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def stream(self, system: str, user: str, on_text: Callable[[str], Awaitable[None]]) -> str:
+        """
+        Like complete(), but requests a streamed completion and awaits
+        `on_text(text_so_far)` as deltas arrive. A retry restarts the
+        completion, so `on_text` may see the text start over.
+        """
+        http, semaphore = await self._session()
+        payload = dict(self.payload(system, user), stream=True)
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            response = None
+            async with semaphore:
+                await self.bucket.acquire()
+                try:
+                    async with http.stream("POST", self.url, json=payload) as response:
+                        self.metrics.record_status(response.status_code)
+                        if response.status_code in RETRY_STATUSES:
+                            await response.aread()
+                            raise httpx.HTTPStatusError(
+                                f"{response.status_code} from LLM provider",
+                                request=response.request, response=response)
+                        if response.is_error:
+                            await response.aread()
+                            response.raise_for_status()
+                        text = ""
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            event = json.loads(data)
+                            self.metrics.record_usage(event.get("usage"))     # sent with the last chunk
+                            if not event.get("choices"):
+                                continue
+                            choice = event["choices"][0]
+                            delta = (choice.get("delta") or {}).get("content") or choice.get("text") or ""
+                            if delta:
+                                if not text:
+                                    self.metrics.first_token.append(time.perf_counter() - start)
+                                text += delta
+                                await on_text(text)
+                    self.metrics.record(time.perf_counter() - start, ok=True)
+                    return text
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    retryable = isinstance(e, httpx.TransportError) or \
+                        e.response.status_code in RETRY_STATUSES
+                    if not retryable or attempt >= self.max_retries:
+                        self.metrics.record(time.perf_counter() - start, ok=False)
+                        raise
+                except Exception:
+                    self.metrics.record(time.perf_counter() - start, ok=False)
+                    raise
+
+            self.metrics.retries += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._loop = None
+
+
+client = LLMClient()
+
+
+async def acall_llm(system: str, user: str) -> str:
+    return await client.complete(system, user)
+
+
+async def astream_llm(system: str, user: str, on_text: Callable[[str], Awaitable[None]]) -> str:
+    return await client.stream(system, user, on_text)
+
+
 def call_llm(system: str, user: str) -> str:
-    payload = {
-        "model": "meta-llama/Llama-3.2-3B-Instruct-Turbo",
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        "temperature": 0.2,
-        "max_tokens": 1000,
-    }
-    r = requests.post(URL, headers=HEAD, json=payload, timeout=60)
-    r.raise_for_status()
-    return r.json()["choices"][0]["message"]["content"]
+    """Blocking wrapper for scripts; the pipeline awaits acall_llm instead"""
+    async def once():
+        try:
+            return await client.complete(system, user)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(once())
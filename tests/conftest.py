@@ -0,0 +1,4 @@
+import os, sys
+
+# Modules import each other from the repository root, as when run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import asyncio
+
+from classifier.batcher import MicroBatcher
+
+
+def score(windows):
+    return [len(w) for w in windows]
+
+
+def classify_all(batcher, docs):
+    async def classify(windows):
+        batcher.count_requests()
+        return await asyncio.gather(*(batcher.submit(w) for w in windows))
+
+    async def run():
+        return await asyncio.gather(*(classify(d) for d in docs))
+
+    return asyncio.run(run())
+
+
+def test_results_follow_their_requests():
+    batcher = MicroBatcher(score, max_batch=4)
+    assert classify_all(batcher, [["a", "bb"], ["ccc"], ["dddd", "e", "ff"]]) == [[1, 2], [3], [4, 1, 2]]
+
+
+def test_stats_count_documents_apart_from_windows():
+    batcher = MicroBatcher(score, max_batch=32, unit="windows", request_unit="docs")
+    classify_all(batcher, [["a", "b", "c"], ["d"], ["e", "f"], ["g", "h"]])
+    stats = batcher.stats()
+    assert stats["windows"] == 8
+    assert stats["docs"] == 4
+    assert stats["mean_windows_per_request"] == 2.0
+    assert stats["docs_per_sec"] == round(4 / batcher.busy_seconds, 2)
+    assert stats["windows_per_sec"] == round(8 / batcher.busy_seconds, 2)
+    assert stats["docs_per_sec"] < stats["windows_per_sec"]
+
+
+def test_stats_without_requests_report_items_only():
+    batcher = MicroBatcher(score)
+    asyncio.run(batcher.submit("abc"))
+    stats = batcher.stats()
+    assert stats["items"] == 1
+    assert "requests" not in stats and "requests_per_sec" not in stats
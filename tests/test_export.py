@@ -0,0 +1,24 @@
+import pytest
+
+from export import export_query, parse_time
+
+
+def test_naive_times_are_taken_as_utc():
+    assert parse_time("2024-01-01", "start") == "2024-01-01 00:00:00"
+    assert parse_time("2024-01-01T08:30:00", "start") == "2024-01-01 08:30:00"
+
+
+def test_offsets_are_converted_to_utc():
+    assert parse_time("2024-01-01T00:00:00+05:30", "start") == "2023-12-31 18:30:00"
+    assert parse_time("2024-01-01T10:00:00-04:00", "end") == "2024-01-01 14:00:00"
+    assert parse_time("2024-01-01T10:00:00Z", "end") == "2024-01-01 10:00:00"
+
+
+def test_query_bounds_use_utc():
+    _, params = export_query(start="2024-01-01T00:00:00+05:30", end="2024-01-02")
+    assert params == ["2023-12-31 18:30:00", "2024-01-02 00:00:00"]
+
+
+def test_invalid_time_is_rejected():
+    with pytest.raises(ValueError, match="Invalid start"):
+        parse_time("yesterday", "start")
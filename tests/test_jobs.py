@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from db import Database
+from jobs import JobQueue
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "test.db"), threads=1)
+    database.migrate()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO files (id, filename, original_name) VALUES (?, ?, ?)",
+                         [(fid, f"{fid}.txt", f"{fid}.txt") for fid in ("a", "b")])
+    yield database
+    database.close()
+
+
+async def nothing(fid, full):
+    pass
+
+
+def test_enqueue_returns_the_active_job(database):
+    jobs = JobQueue(database, nothing)
+    first = jobs.enqueue("a")
+    again = jobs.enqueue("a", full=True)
+    assert again["id"] == first["id"] and again["full"] == 1
+    assert jobs.enqueue_many(["a", "b", "b"]) == 1
+    assert jobs.depth() == 2
+    assert database.fetchone("SELECT status FROM files WHERE id = 'b'")[0] == "queued"
+
+
+def test_recover_gives_up_after_max_interruptions(database):
+    jobs = JobQueue(database, nothing, max_interruptions=2)
+    job = jobs.enqueue("a")
+    assert jobs._claim()["id"] == job["id"]
+    assert jobs.recover() == 1                  # first interruption: requeued
+    jobs._claim()
+    assert jobs.recover() == 0                  # second: given up
+    assert jobs.get(job["id"])["status"] == "error"
+    assert database.fetchone("SELECT status FROM files WHERE id = 'a'")[0] == "error"
+
+
+def test_workers_run_jobs_and_record_failures(database):
+    ran = []
+
+    async def handler(fid, full):
+        ran.append((fid, full))
+        if fid == "b":
+            raise ValueError("boom")
+
+    async def run():
+        jobs = JobQueue(database, handler, workers=1, poll_interval=0.05)
+        await jobs.start()
+        ok = await database.run(jobs.enqueue, "a", True)
+        failed = await database.run(jobs.enqueue, "b")
+        for _ in range(100):
+            if all(jobs.get(j["id"])["status"] in ("done", "error") for j in (ok, failed)):
+                break
+            await asyncio.sleep(0.02)
+        await jobs.stop()
+        return jobs.get(ok["id"]), jobs.get(failed["id"])
+
+    ok, failed = asyncio.run(run())
+    assert ran == [("a", True), ("b", False)]
+    assert ok["status"] == "done"
+    assert (failed["status"], failed["error"], failed["attempts"]) == ("error", "boom", 1)
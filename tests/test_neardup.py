@@ -0,0 +1,53 @@
+import random, zlib
+
+import numpy as np
+import pytest
+
+import neardup
+from cache import normalize
+
+
+def reference_signature(text):
+    """The whole-text MinHash the streamed version must reproduce"""
+    words = neardup._word.findall(normalize(text).lower())
+    if not words:
+        return None
+    n = max(1, len(words) - neardup.SHINGLE_WORDS + 1)
+    shingles = {" ".join(words[i:i + neardup.SHINGLE_WORDS]) for i in range(n)}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    mins = ((hashes[:, None] * neardup._A + neardup._B) % neardup._PRIME).min(axis=0)
+    return (mins & 0xFFFFFFFF).astype("<u4").tobytes()
+
+
+def pieces(text, rng):
+    """`text` cut at random places, mid-word and mid-space included"""
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, 40))) if len(text) > 1 else []
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "   \n ",
+    "Notice",
+    "one two three",
+    "one two three four five",
+    "This Agreement is made on 1 March 2024 between Alpha Ltd and Beta LLP.\n\n  Section 138 applies. " * 30,
+    "café ﬁnal naïve résumé " * 20,
+])
+def test_chunks_match_whole_text(text):
+    rng = random.Random(len(text))
+    assert neardup.signature(text) == reference_signature(text)
+    for _ in range(5):
+        assert neardup.signature_chunks(pieces(text, rng)) == reference_signature(text)
+
+
+def test_long_token_is_not_held_whole():
+    # past MAX_PENDING a token is cut where the piece ended, so only its shingles differ
+    rng = random.Random(0)
+    words = " ".join(rng.choice(["court", "order", "appeal", "notice", "party", "sum", "date"]) for _ in range(400))
+    text = "x" * (neardup.MAX_PENDING * 3) + " " + words
+    chunks = [text[i:i + 1000] for i in range(0, len(text), 1000)]
+    streamed, whole = neardup.signature_chunks(chunks), reference_signature(text)
+    assert streamed is not None
+    same = np.mean(np.frombuffer(streamed, "<u4") == np.frombuffer(whole, "<u4"))
+    assert same > 0.8
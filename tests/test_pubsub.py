@@ -0,0 +1,41 @@
+import pytest
+
+from db import Database
+from pubsub import ALL, authorize
+
+
+@pytest.fixture
+def conn(tmp_path):
+    database = Database(str(tmp_path / "test.db"), threads=1)
+    database.migrate()
+    with database.transaction() as c:
+        c.executemany(
+            "INSERT INTO files (id, filename, original_name, owner) VALUES (?, ?, ?, ?)",
+            [("f-alice", "a.txt", "a.txt", "alice"), ("f-bob", "b.txt", "b.txt", "bob"),
+             ("f-anon", "c.txt", "c.txt", None)],
+        )
+    yield database.connect()
+    database.close()
+
+
+def test_own_user_and_files_allowed(conn):
+    allowed, refused = authorize(conn, "alice", ["user:alice", "file:f-alice"])
+    assert allowed == ["user:alice", "file:f-alice"]
+    assert refused == []
+
+
+def test_foreign_topics_refused(conn):
+    allowed, refused = authorize(conn, "alice", ["user:bob", "file:f-bob", "file:f-anon", "file:missing", "other"])
+    assert allowed == []
+    assert refused == ["user:bob", "file:f-bob", "file:f-anon", "file:missing", "other"]
+
+
+def test_anonymous_client_gets_nothing(conn):
+    allowed, refused = authorize(conn, None, ["user:", "file:f-anon", "file:f-alice"])
+    assert allowed == []
+    assert refused == ["user:", "file:f-anon", "file:f-alice"]
+
+
+def test_all_needs_explicit_setting(conn):
+    assert authorize(conn, "alice", [ALL]) == ([], [ALL])
+    assert authorize(conn, "alice", [ALL], allow_all=True) == ([ALL], [])